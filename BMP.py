@@ -6,6 +6,16 @@
 #*                --sheet: tab to read from the excel spreadsheet  
 #*                --app: Appliction name to map, this is case sensitive 
 #*                --legend: Include a legend and mechanism guide in the diagram.
+#*                --no-render-cache: Always run Graphviz, do not use the render cache.
+#*                --batch: Build this map in a batch (same format as --app), repeat for each map.
+#*                --each-app: Build one map per application in a batch.
+#*                --render-jobs: Number of concurrent Graphviz processes in a batch.
+#*                --aggregate: In all and ecosystem maps, collapse the parallel edges of an
+#*                         App-1/App-2 pair with the same Mechanism and Direction into one,
+#*                         labelled with the number of relationships.
+#*                --workbook: Excel workbook to read, default BMP-Data.xlsx.
+#*                --serve: Serve maps over HTTP on this local port (--host, --cache-mb),
+#*                         GET /map?app=A,B&legend=1&aggregate=1 returns the map as SVG, /apps the applications.
 #*  
 #*  Verion: 02
 #*  Author: Mike DeLaet
@@ -17,151 +27,30 @@
 #*
 #********************************************************************************
 import pandas as pd
+import numpy as np
 import argparse
+import json
+import math
 import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 from graphviz import Digraph
+import render_cache
 version = "2.0"
 
+WORKBOOK = "BMP-Data.xlsx"
+RENDER_TIMEOUT = 300            # seconds allowed for one layout in server mode
+EVICT_INTERVAL = 60             # seconds between evictions of the render cache in server mode
+LAYOUT_TIMES = "layout_times.json"  # last Graphviz layout time of each map, in the output directory
+MAX_PENWIDTH = 8.0
 
-def get_label(row):
-    #Generate label for edges using the topic, or blank if NaN.
-    return f"{row['Topic']}" if pd.notna(row['Topic']) else ""
-
-'''
-parser = argparse.ArgumentParser(description="Specify the sheet/tab for the mapping.")
-parser.add_argument('--sheet', help="Name of the sheet/tab where the mapping is located.")
-
-args = parser.parse_args()
-'''
-parser = argparse.ArgumentParser(description="Create Business Process Maps from Excel.")
-
-parser.add_argument('--sheet', help="Name of the Excel sheet to read.", required=False)
-parser.add_argument('--app', help="Application name(s) to map(case sensitive). Comma-separated for multiple or use 'all' or 'ecosystem'.", required=False)
-parser.add_argument('--legend',help="Include a legend and mechanism guide in the diagram.",action='store_true')
-
-args = parser.parse_args()
-
-
-# Use the argument if provided and not just whitespace, else prompt
-if args.sheet and args.sheet.strip():
-    sheet = args.sheet.strip()
-else:
-    sheet = input("Enter the tab/sheet where the mapping is located: ").strip()
-
-print(f"Using sheet: {sheet}")
-
-# Load the spreadsheet
-df = pd.read_excel("BMP-Data.xlsx", sheet_name=sheet)
-print (f'{df}')
-
-# List unique applications from combined App-1 and App-2 columns
-#unique_apps = sorted(set(df['App-1'].dropna().str.strip().unique()) | set(df['App-2'].dropna().str.strip().unique()))
-unique_apps = sorted(set(df['App-1'].dropna().str.strip().unique()))
-print("Available applications to map:")
-for app in unique_apps:
-    print(f"- {app}")
-print (f'- all: all relationships, \n- ecosystem: relationships between ecosystem applications.')
-
-'''
-# Prompt user for application to map
-app_to_map = input("Enter the application name(s) to map (comma-separated for multiple): ")
-app_to_map_list = [app.strip() for app in app_to_map.split(',')]
-'''
-# Determine the application(s) to map
-if args.app and args.app.strip():
-    app_to_map = args.app.strip()
-else:
-    app_to_map = input("Enter the application name(s) to map (comma-separated for multiple): ").strip()
-
-app_to_map_list = [app.strip() for app in app_to_map.split(',')]
-
-
-
-# Filter the data to include only relevant rows or "all" for all applications
-if "all" in app_to_map_list:
-    filtered_df = df
-    graph_engine = "sfdp"
-    beautify = "false"
-    ranksep='10.0'    # Increases vertical separationRight
-    nodesep='10.0'    # Increases horizontal separation
-    app_to_map_list = unique_apps
-    map_all = True
-    map_ecosystem = False
-elif "ecosystem" in app_to_map_list:
-    beautify = "false"
-    ranksep='10.0'    # Increases vertical separationRight
-    nodesep='10.0'    # Increases horizontal separation
-    map_all=False
-    map_ecosystem = True
-    graph_engine = "sfdp"
-    app_to_map_list = unique_apps
-    filtered_df = df[df['App-1'].fillna('').str.strip().isin(unique_apps) & df['App-2'].fillna('').str.strip().isin(unique_apps)]
-else:
-    filtered_df = df[df['App-1'].fillna('').str.strip().isin(unique_apps) | df['App-2'].fillna('').str.strip().isin(unique_apps)]
-    map_all=False
-    map_ecosystem = False
-    
-    if len(app_to_map_list) == 1:  
-        graph_engine = "circo"
-        beautify = "true"
-        ranksep='5.0'    # Increases vertical separationRight
-        nodesep='2.0'    # Increases horizontal separation
-    else: 
-        graph_engine = "sfdp"
-        beautify = "false"
-        ranksep='5.0'    # Increases vertical separationRight
-        nodesep='5.0'    # Increases horizontal separation
-        
-print(f'{filtered_df}')    
-
-# Initialize a directed graph with additional attributes
-graph_format = 'svg' 
-g = Digraph(format=graph_format, engine=graph_engine) # dot, neato, fdp, sfdp, circo, twopi, nop, nop2, osage, patchwork
-g.attr(
-    compound='true',  # Allows edges to connect between subgraphs properly
-    ranksep=f'{ranksep}',    # Increases vertical separationRight
-    nodesep= f'{nodesep}',    # Increases horizontal separation
-    overlap='false',  # Prevents nodes from overlapping
-    splines='true',    # Enables smoother edge routing
-    K='.5', 
-    repulsiveforce='1.25',
-    overlap_scale='0',
-    smoothing='avg_dist',
-    beautify=beautify,
-    bgcolor = 'lightyellow'
-)
-
-for i in range(len(app_to_map_list) - 1):
-    g.edge(app_to_map_list[i], app_to_map_list[i + 1], label="", len="10", dir="none", style="invisible")
-
-
-
-# Edge attributes to control edge length
-g.edge_attr.update(len='4.0')  # Increases distance between connected nodes
-
-# Filter the data to include only relevant rows or "all" for all applications
-if map_all == True:
-    app_shape = 'box3d'
-    for app in app_to_map_list:
-        g.node(app, label=app, shape=f'{app_shape}', color='deepskyblue', fillcolor='lightskyblue', style='filled')
-else:
-    app_shape = 'box3d'
-    for app in app_to_map_list:
-        g.node(app, label=app, shape=f'{app_shape}', color='deepskyblue', fillcolor='lightskyblue', style='filled')
-
-if map_ecosystem == True:
-    app_df = filtered_df[(filtered_df['App-1'].str.strip().isin(app_to_map_list))]
-else:
-    app_df = filtered_df[
-        (filtered_df['App-1'].str.strip().isin(app_to_map_list)) | 
-        (filtered_df['App-2'].str.strip().isin(app_to_map_list))
-    ]
-
-for index, row in app_df.iterrows():  # Fixed iterrow() to iterrows()
-    app_name = row['App-1']  # Define the app name from the row
-
-    if app_name in unique_apps and app_name not in app_to_map_list:  # Fixed .isin()
-        g.node(app_name, label=app_name, shape='box', color='deepskyblue', fillcolor='lightskyblue', style='filled')
 
 # Define colors for mechanisms
 mechanism_colors = {
@@ -176,103 +65,611 @@ mechanism_arrow = {
     "api":"diamond"
 }
 
-print(f'Relationships to be mapped: {filtered_df.shape[0]}')
-
-# Add edges within a subgraph for better organization
-i=0
-for application in app_to_map_list:
-    #if not filtered_df[(filtered_df['App-1'].str.strip() == application)].empty:
-    with g.subgraph(name=f"cluster{i}") as relationships: 
-        app_df = filtered_df[(filtered_df['App-1'].str.strip() == application) | (filtered_df['App-2'].str.strip() == application)]
-        if app_df.empty:
-            continue
-
-        relationships.attr(label=f"{application}", style="dashed")
-        #relationships.node(application, label="", shape='box', color='deepskyblue', fillcolor='lightskyblue', style='filled')
-
-        i += 1
-        for index, row in app_df.iterrows():
-            if (row['App-1'] == application) or (row['App-1'] != application and row['App-1'] not in app_to_map_list):
-                try:
-                    style = "solid"
-                    arrowhead = "normal"
-                    arrowtail = "normal"
-                    direction = "forward"
-                    
-
-                    app_1 = row['App-1'].strip()
-                    app_2 = row['App-2'].strip()
-
-                    #print(f"{row['App-1']}, {row['App-2']}\n")
-                    
-                    direction_type = str(row['Direction']).strip().lower() if pd.notna(row['Direction']) else ""
-                    mechanism_type = str(row['Mechanism']).strip().lower() if pd.notna(row['Mechanism']) else ""
-                    
-                    color = mechanism_colors.get(mechanism_type, "black")  # Default to black if no match
-                    arrowhead = mechanism_arrow.get(mechanism_type, "normal")  # Default to black if no match
-
-                    if app_to_map == "all":
-                        label = None
-                    else:
-                        label = get_label(row)
-
-                    if direction_type == "bi-directional":
-                        style = "bold"
-                        direction = "both"
-                        arrowtail = arrowhead
-                    elif direction_type == "depends on":
-                        style = "dashed"
-
-                    #print(f'Row attributes: {row['app-1']} ->{row['app-2']} {row['Direction']} {row['Mechanism']}\n')
-
-                    if not row.empty:
-                        relationships.edge(app_1, app_2, label=label, shape='box', style=style, arrowhead=arrowhead, arrowtail=arrowtail, dir=direction, color=color)
-                except Exception as e:
-                    print(f"Error processing row: {row}\nException: {e}\n")
-
-    # Add a properly structured subgraph for Legend and Mechanism at the bottom
-
-    if args.legend:
-        with g.subgraph(name="cluster01") as legend:
-            legend.attr(label="Legend", style="dashed")
-            legend.node("Legend", shape="box")
-            legend.edge("Legend", "Bi-Directional", label="Double Arrow", style="bold", dir="both")
-            legend.edge("Legend", "Depends On", label="Dashed Line", style="dashed")
-            legend.edge("Legend", "Normal Flow", label="Solid Line", style="solid")
-
-        with g.subgraph(name="cluster02") as mechanism:
-            mechanism.attr(label="Mechanism", style="dashed")
-            mechanism.node("Mechanism", shape="box")
-            mechanism.edge("Mechanism", "API", label="Green Diamond", arrowhead="diamond", color="green")
-            mechanism.edge("Mechanism", "FTP", label="Red Box", arrowhead="box", color="red")
-            mechanism.edge("Mechanism", "Fileshare", label="Blue Circle", arrowhead="odot", color="blue")
-    
-# Save and render the graph
-
-# Create output directory if it doesn't exist
-output_dir = "bmp_output"
-os.makedirs(output_dir, exist_ok=True)
-
-# Build output filename based on application(s)
-if "all" in app_to_map_list:
-    output_filename = "relationship_map_all"
-elif "ecosystem" in app_to_map_list:
-    output_filename = "relationship_map_ecosystem"
-else:
-    # Join app names with underscores and sanitize for file naming
-    output_filename = "relationship_map_" + "_".join(app_to_map_list).replace(" ", "_").replace("/", "_")
 
-if args.legend:
-    output_filename += "_legend"
-
-# Create full path with output directory
-output_file = os.path.join(output_dir, output_filename)
-
-g.render(output_file)
-
-
-print(f"Graph generated as {output_file}.{graph_format}")
+def get_label(topics):
+    #Generate labels for edges using the topic, or blank if NaN.
+    return topics.map(str).where(topics.notna(), "")
+
+
+def normalized_text(column):
+    #Stripped, lower case text of a column, blank if NaN.
+    return column.map(str).str.strip().str.lower().where(column.notna(), "")
+
+
+def edge_attributes(df, labels=True):
+    #Derive the edge attributes of every relationship row column-wise, aligned with df.
+    #Bi-directional rows are bold with arrows at both ends, depends on rows are dashed.
+    mechanism_type = normalized_text(df['Mechanism'])
+    direction_type = normalized_text(df['Direction'])
+    bi_directional = direction_type == "bi-directional"
+    arrowhead = mechanism_type.map(mechanism_arrow).fillna("normal")
+    return pd.DataFrame({
+        "label": get_label(df['Topic']) if labels else None,
+        "style": np.select([bi_directional, direction_type == "depends on"], ["bold", "dashed"], "solid"),
+        "arrowhead": arrowhead,
+        "arrowtail": arrowhead.where(bi_directional, "normal"),
+        "dir": np.where(bi_directional, "both", "forward"),
+        "color": mechanism_type.map(mechanism_colors).fillna("black"),
+        "mechanism": mechanism_type,
+        "direction": direction_type,
+    }, index=df.index)
+
+
+def rejects_report(df, positions):
+    #Rows of df (by position) that could not become an edge, with their sheet row number and the reason.
+    rejects = df.iloc[sorted(positions)]
+    reason = np.select([rejects['app_1'].isna() & rejects['app_2'].isna(), rejects['app_1'].isna()],
+                       ["App-1 and App-2 are missing", "App-1 is missing"], "App-2 is missing")
+    rejects = rejects.drop(columns=["app_1", "app_2"])
+    rejects.insert(0, "Row", rejects.index + 2)         # sheet row, after the header
+    rejects.insert(1, "Reason", reason)
+    return rejects
+
+
+def normalize_relationships(df):
+    #Add app_1/app_2: App-1/App-2 stripped once and interned, None where the cell is not text.
+    for column, normalized in (("App-1", "app_1"), ("App-2", "app_2")):
+        df[normalized] = [sys.intern(value.strip()) if isinstance(value, str) else None for value in df[column]]
+    return df
+
+
+def build_adjacency(df):
+    #Map each application to the positions of the rows it is App-1 or App-2 of, in row order.
+    adjacency = {}
+    for position, (app_1, app_2) in enumerate(zip(df['app_1'], df['app_2'])):
+        if app_1 is not None:
+            adjacency.setdefault(app_1, []).append(position)
+        if app_2 is not None and app_2 != app_1:
+            adjacency.setdefault(app_2, []).append(position)
+    return adjacency
+
+class RelationshipIndex:
+    #The relationship sheet normalized once: the applications of App-1, the rows of each application
+    #and every row as an edge tuple.  Any number of maps are built from it without re-reading the sheet.
+    def __init__(self, df):
+        self.df = normalize_relationships(df)
+        self.unique_apps = sorted(set(df['app_1'].dropna()))
+        self.unique_app_set = set(self.unique_apps)
+        self.adjacency = build_adjacency(df)
+        self.app_1_known = df['app_1'].isin(self.unique_app_set).to_numpy()
+        self.app_2_known = df['app_2'].isin(self.unique_app_set).to_numpy()
+
+        # App-1 as in the sheet, the normalized names, the edge attributes and the normalized Mechanism and Direction
+        attributes = edge_attributes(df)
+        self.edges = list(zip(df['App-1'], df['app_1'], df['app_2'], attributes['label'], attributes['style'],
+                              attributes['arrowhead'], attributes['arrowtail'], attributes['dir'], attributes['color'],
+                              attributes['mechanism'], attributes['direction']))
+
+
+def map_file_name(app_to_map_list, map_all, map_ecosystem, legend, aggregate=False):
+    # Build output filename based on application(s)
+    if map_all:
+        output_filename = "relationship_map_all"
+    elif map_ecosystem:
+        output_filename = "relationship_map_ecosystem"
+    else:
+        # Join app names with underscores and sanitize for file naming
+        output_filename = "relationship_map_" + "_".join(app_to_map_list).replace(" ", "_").replace("/", "_")
+
+    if aggregate:
+        output_filename += "_aggregated"
+    if legend:
+        output_filename += "_legend"
+    return output_filename
+
+
+def parallel_edge_attributes(count, topics):
+    #Attributes of the edge standing for count parallel relationships: the count as label (also in the
+    #all map, which has no topic labels), a penwidth growing with the log of the count and the topics
+    #with their counts as tooltip.
+    topic_counts = Counter(topic or "(no topic)" for topic in topics)
+    tooltip = f"{count} relationships\\n" + "\\n".join(f"{topic} ({n})" for topic, n in topic_counts.items())
+    return {
+        "label": str(count),
+        "penwidth": f"{min(MAX_PENWIDTH, 1 + math.log2(count)):.2f}",
+        "tooltip": tooltip,
+    }
+
+
+def build_map(index, app_to_map, legend, aggregate=False):
+    #Build the map of app_to_map (comma separated applications, all or ecosystem) from the index.
+    #With aggregate, all and ecosystem maps draw one edge per App-1, App-2, Mechanism and Direction in each cluster.
+    #Returns (graph, output file name, mask of the relationship rows considered, number of relationships mapped,
+    #number of edges, positions of the rejected rows).
+    app_to_map_list = [app.strip() for app in app_to_map.split(',')]
+    unique_apps = index.unique_apps
+
+    # Filter the data to include only relevant rows or "all" for all applications
+    if "all" in app_to_map_list:
+        filtered = np.ones(len(index.df), dtype=bool)
+        graph_engine = "sfdp"
+        beautify = "false"
+        ranksep='10.0'    # Increases vertical separationRight
+        nodesep='10.0'    # Increases horizontal separation
+        app_to_map_list = unique_apps
+        map_all = True
+        map_ecosystem = False
+    elif "ecosystem" in app_to_map_list:
+        beautify = "false"
+        ranksep='10.0'    # Increases vertical separationRight
+        nodesep='10.0'    # Increases horizontal separation
+        map_all=False
+        map_ecosystem = True
+        graph_engine = "sfdp"
+        app_to_map_list = unique_apps
+        filtered = index.app_1_known & index.app_2_known
+    else:
+        filtered = index.app_1_known | index.app_2_known
+        map_all=False
+        map_ecosystem = False
+    
+        if len(app_to_map_list) == 1:  
+            graph_engine = "circo"
+            beautify = "true"
+            ranksep='5.0'    # Increases vertical separationRight
+            nodesep='2.0'    # Increases horizontal separation
+        else: 
+            graph_engine = "sfdp"
+            beautify = "false"
+            ranksep='5.0'    # Increases vertical separationRight
+            nodesep='5.0'    # Increases horizontal separation
+
+    map_set = set(app_to_map_list)
+    labels = app_to_map != "all"
+    aggregate = aggregate and (map_all or map_ecosystem)
+    edges = index.edges
+    relationship_count = 0
+    edge_count = 0
+    rejects = set()
+
+    # Initialize a directed graph with additional attributes
+    graph_format = 'svg' 
+    g = Digraph(format=graph_format, engine=graph_engine) # dot, neato, fdp, sfdp, circo, twopi, nop, nop2, osage, patchwork
+    g.attr(
+        compound='true',  # Allows edges to connect between subgraphs properly
+        ranksep=f'{ranksep}',    # Increases vertical separationRight
+        nodesep= f'{nodesep}',    # Increases horizontal separation
+        overlap='false',  # Prevents nodes from overlapping
+        splines='true',    # Enables smoother edge routing
+        K='.5', 
+        repulsiveforce='1.25',
+        overlap_scale='0',
+        smoothing='avg_dist',
+        beautify=beautify,
+        bgcolor = 'lightyellow'
+    )
+
+    for i in range(len(app_to_map_list) - 1):
+        g.edge(app_to_map_list[i], app_to_map_list[i + 1], label="", len="10", dir="none", style="invisible")
+
+
+
+    # Edge attributes to control edge length
+    g.edge_attr.update(len='4.0')  # Increases distance between connected nodes
 
+    app_shape = 'box3d'
+    for app in app_to_map_list:
+        g.node(app, label=app, shape=f'{app_shape}', color='deepskyblue', fillcolor='lightskyblue', style='filled')
 
+    # Applications related to the mapped ones get a plain box, in row order
+    if map_ecosystem == True:
+        related = np.flatnonzero(filtered & np.fromiter((app_1 in map_set for _, app_1, *_ in edges), dtype=bool, count=len(edges)))
+    else:
+        related = sorted({position for app in map_set for position in index.adjacency.get(app, ()) if filtered[position]})
+    for position in related:
+        app_name = edges[position][0]  # Define the app name from the row
+        if app_name in index.unique_app_set and app_name not in map_set:  # Fixed .isin()
+            g.node(app_name, label=app_name, shape='box', color='deepskyblue', fillcolor='lightskyblue', style='filled')
+
+    # Add edges within a subgraph for better organization
+    i=0
+    for application in app_to_map_list:
+        with g.subgraph(name=f"cluster{i}") as relationships: 
+            app_rows = [position for position in index.adjacency.get(application, ()) if filtered[position]]
+            if not app_rows:
+                continue
+
+            relationships.attr(label=f"{application}", style="dashed")
+
+            i += 1
+            parallel = {}           # aggregate: (App-1, App-2, Mechanism, Direction) -> [first row, topics]
+            for position in app_rows:
+                raw_app_1, app_1, app_2, label, style, arrowhead, arrowtail, direction, color, mechanism_type, direction_type = edges[position]
+                if raw_app_1 == application or raw_app_1 not in map_set:
+                    if app_1 is None or app_2 is None:
+                        rejects.add(position)
+                        continue
+                    relationship_count += 1
+                    if aggregate:
+                        parallel.setdefault((app_1, app_2, mechanism_type, direction_type), [position, []])[1].append(label)
+                        continue
+                    relationships.edge(app_1, app_2, label=label if labels else None, shape='box', style=style, arrowhead=arrowhead, arrowtail=arrowtail, dir=direction, color=color)
+                    edge_count += 1
+
+            # One edge per group of parallel relationships, a single relationship is drawn as it is
+            for position, topics in parallel.values():
+                _, app_1, app_2, label, style, arrowhead, arrowtail, direction, color, *_ = edges[position]
+                attributes = parallel_edge_attributes(len(topics), topics) if len(topics) > 1 else {"label": label if labels else None}
+                relationships.edge(app_1, app_2, shape='box', style=style, arrowhead=arrowhead, arrowtail=arrowtail, dir=direction, color=color, **attributes)
+                edge_count += 1
+
+        # Add a properly structured subgraph for Legend and Mechanism at the bottom
+
+        if legend:
+            with g.subgraph(name="cluster01") as legend_cluster:
+                legend_cluster.attr(label="Legend", style="dashed")
+                legend_cluster.node("Legend", shape="box")
+                legend_cluster.edge("Legend", "Bi-Directional", label="Double Arrow", style="bold", dir="both")
+                legend_cluster.edge("Legend", "Depends On", label="Dashed Line", style="dashed")
+                legend_cluster.edge("Legend", "Normal Flow", label="Solid Line", style="solid")
+
+            with g.subgraph(name="cluster02") as mechanism:
+                mechanism.attr(label="Mechanism", style="dashed")
+                mechanism.node("Mechanism", shape="box")
+                mechanism.edge("Mechanism", "API", label="Green Diamond", arrowhead="diamond", color="green")
+                mechanism.edge("Mechanism", "FTP", label="Red Box", arrowhead="box", color="red")
+                mechanism.edge("Mechanism", "Fileshare", label="Blue Circle", arrowhead="odot", color="blue")
+
+    return g, map_file_name(app_to_map_list, map_all, map_ecosystem, legend, aggregate), filtered, relationship_count, edge_count, rejects
+
+
+def write_rejects(index, rejects, output_file):
+    # Rows that could not be mapped are reported once, in a CSV next to the map
+    rejects_file = f"{output_file}_rejects.csv"
+    if rejects:
+        rejects_report(index.df, rejects).to_csv(rejects_file, index=False)
+    elif os.path.exists(rejects_file):
+        os.remove(rejects_file)
+    return rejects_file
+
+
+def render_map(g, output_file, cache_dir):
+    # Render through the cache shared with CreateGraphvis.py, an unchanged map is not laid out again
+    #Returns (seconds, cache hit).
+    start = time.perf_counter()
+    g.save(output_file)
+    cache_hit = render_cache.render(g.source, g.engine, g.format, f"{output_file}.{g.format}", cache_dir=cache_dir)
+    return time.perf_counter() - start, cache_hit
+
+
+def load_layout_times(output_dir):
+    path = os.path.join(output_dir, LAYOUT_TIMES)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_layout_times(output_dir, layout_times):
+    path = os.path.join(output_dir, LAYOUT_TIMES)
+    with open(path + ".tmp", "w") as f:
+        json.dump(layout_times, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def aggregation_report(output_filename, relationship_count, edge_count, layout_times):
+    #Edge reduction of an aggregated map, and its layout time against the last layout of the same map without aggregation.
+    reduction = 1 - edge_count / relationship_count if relationship_count else 0
+    report = f"{output_filename}: aggregated {relationship_count} relationships into {edge_count} edges ({reduction:.0%} fewer)"
+    plain_filename = output_filename.replace("_aggregated", "")
+    if output_filename in layout_times and plain_filename in layout_times:
+        aggregated, plain = layout_times[output_filename], layout_times[plain_filename]
+        report += f", layout {aggregated:.2f}s against {plain:.2f}s without aggregation"
+        if plain:
+            report += f" ({aggregated / plain - 1:+.0%})"
+    return report
+
+
+def run_batch(index, app_sets, legend, output_dir, cache_dir, render_jobs, aggregate=False):
+    #Build every map of the batch from the index, then lay them out on a pool of render_jobs Graphviz processes.
+    #Ends with a summary of the build and layout time of each map.
+    batch_start = time.perf_counter()
+    results = []
+    futures = {}
+    with ThreadPoolExecutor(max_workers=render_jobs) as pool:
+        for app_to_map in app_sets:
+            start = time.perf_counter()
+            g, output_filename, filtered, relationship_count, edge_count, rejects = build_map(index, app_to_map, legend, aggregate)
+            output_file = os.path.join(output_dir, output_filename)
+            write_rejects(index, rejects, output_file)
+            build_seconds = time.perf_counter() - start
+
+            result = {"map": output_filename, "engine": g.engine, "relationships": relationship_count, "edges": edge_count, "rejects": len(rejects), "build": build_seconds}
+            results.append(result)
+            futures[pool.submit(render_map, g, output_file, cache_dir)] = result
+
+        for future in as_completed(futures):
+            result = futures[future]
+            try:
+                result["layout"], result["hit"] = future.result()
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+                result["layout"], result["hit"], result["error"] = None, False, str(e)
+
+    print(f"\n{'map':<60}{'engine':>7}{'edges':>8}{'rejects':>8}{'build s':>9}{'layout s':>9}")
+    for result in results:
+        layout = "failed" if result.get("error") else ("cache" if result["hit"] else f"{result['layout']:.2f}")
+        print(f"{result['map'][:59]:<60}{result['engine']:>7}{result['edges']:>8}{result['rejects']:>8}{result['build']:9.2f}{layout:>9}")
+    for result in results:
+        if result.get("error"):
+            print(f"Render failed for {result['map']}: {result['error']}")
+
+    # Layout times are kept across runs, so an aggregated map can be compared with the same map without aggregation
+    layout_times = load_layout_times(output_dir)
+    layout_times.update({result["map"]: round(result["layout"], 3) for result in results if result["layout"] is not None and not result["hit"]})
+    save_layout_times(output_dir, layout_times)
+    for result in results:
+        if "_aggregated" in result["map"]:
+            print(aggregation_report(result["map"], result["relationships"], result["edges"], layout_times))
+
+    laid_out = [result["layout"] for result in results if result["layout"] is not None and not result["hit"]]
+    print(f"{len(results)} maps in {time.perf_counter() - batch_start:.2f}s with {render_jobs} render jobs: build {sum(result['build'] for result in results):.2f}s, "
+          f"layout {sum(laid_out):.2f}s ({len(laid_out)} laid out, {sum(result['hit'] for result in results)} from the cache, {sum('error' in result for result in results)} failed)")
+    return results
+
+
+def load_index(workbook, sheet):
+    #Read the relationship sheet and index it.  Returns (index, read seconds, index seconds).
+    start = time.perf_counter()
+    df = pd.read_excel(workbook, sheet_name=sheet)
+    read_seconds = time.perf_counter() - start
+
+    # Normalize the application names and index the relationships once
+    start = time.perf_counter()
+    index = RelationshipIndex(df)
+    return index, read_seconds, time.perf_counter() - start
 
 
+#********************************************************************************
+# Server mode (--serve)
+# The relationship index stays loaded and GET /map?app=A,B&legend=1 returns the
+# map as SVG.  Rendered maps are kept in an LRU cache bounded by size, and the
+# index and the cache are reloaded when the workbook's mtime changes.  The render
+# cache on disk is evicted after new layouts, at most every EVICT_INTERVAL seconds.
+#********************************************************************************
+class MapServer:
+    def __init__(self, workbook, sheet, cache_bytes, cache_dir):
+        self.workbook = workbook
+        self.sheet = sheet
+        self.cache_bytes = cache_bytes
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        self.index = None
+        self.mtime = None
+        self.maps = OrderedDict()       # (app set, legend, aggregate) -> svg, least recently used first
+        self.size = 0
+        self.render_cache_bytes = render_cache.MAX_BYTES
+        self.last_evict = None          # time.monotonic() of the last render cache eviction
+
+    def current_index(self):
+        #The index of the workbook as it is now, reloaded (and the cache cleared) when its mtime changed.
+        mtime = os.path.getmtime(self.workbook)
+        with self.lock:
+            if mtime != self.mtime:
+                self.index, read_seconds, index_seconds = load_index(self.workbook, self.sheet)
+                self.mtime = mtime
+                self.maps.clear()
+                self.size = 0
+                print(f"Loaded {self.workbook} ({len(self.index.df)} relationships) in {read_seconds + index_seconds:.2f}s")
+            return self.index, self.mtime
+
+    def svg(self, app_to_map, legend, aggregate=False):
+        #The SVG map of app_to_map, from the cache when possible.  Returns (svg, cache hit).
+        index, mtime = self.current_index()
+        key = (app_to_map, legend, aggregate)
+        with self.lock:
+            if key in self.maps:
+                self.maps.move_to_end(key)
+                return self.maps[key], True
+
+        unknown = [app for app in app_to_map.split(",") if app not in ("all", "ecosystem") and app not in index.adjacency]
+        if unknown:
+            raise LookupError(f"Unknown application(s): {', '.join(unknown)}")
+
+        g = build_map(index, app_to_map, legend, aggregate)[0]
+        svg = render_svg(g, self.cache_dir)
+        self.evict_render_cache()
+
+        with self.lock:
+            # A map built from a workbook that has since been reloaded is not cached
+            if mtime == self.mtime and len(svg) <= self.cache_bytes and key not in self.maps:
+                self.maps[key] = svg
+                self.size += len(svg)
+                while self.size > self.cache_bytes:
+                    self.size -= len(self.maps.popitem(last=False)[1])
+        return svg, False
+
+    def evict_render_cache(self):
+        #Keep the render cache on disk within its limit, a long running server would grow it without bound.
+        now = time.monotonic()
+        with self.lock:
+            if self.last_evict is not None and now - self.last_evict < EVICT_INTERVAL:
+                return
+            self.last_evict = now
+        removed, removed_bytes = render_cache.evict(self.cache_dir, self.render_cache_bytes)
+        if removed:
+            print(f"Evicted {removed} renders ({removed_bytes / (1024 * 1024):.1f} MB) from {self.cache_dir}")
+
+
+def render_svg(g, cache_dir):
+    #Lay out g as SVG through the render cache and return the SVG bytes.
+    fd, svg_file = tempfile.mkstemp(suffix=".svg")
+    os.close(fd)
+    try:
+        render_cache.render(g.source, g.engine, "svg", svg_file, timeout=RENDER_TIMEOUT, cache_dir=cache_dir)
+        with open(svg_file, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(svg_file)
+
+
+class MapRequestHandler(BaseHTTPRequestHandler):
+    server_version = f"BMP/{version}"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == "/apps":
+            index = self.server.maps.current_index()[0]
+            self.send_body(200, "application/json", json.dumps(index.unique_apps).encode())
+            return
+        if url.path != "/map":
+            self.send_error(404, "Use /map?app=A,B&legend=1&aggregate=1 or /apps")
+            return
+
+        app_to_map = ",".join(app.strip() for app in query.get("app", [""])[0].split(",") if app.strip())
+        legend = query.get("legend", ["0"])[0].lower() in ("1", "true", "yes")
+        aggregate = query.get("aggregate", ["0"])[0].lower() in ("1", "true", "yes")
+        if not app_to_map:
+            self.send_error(400, "Missing app, e.g. /map?app=A,B&legend=1")
+            return
+
+        try:
+            svg, cache_hit = self.server.maps.svg(app_to_map, legend, aggregate)
+        except LookupError as e:
+            self.send_error(404, str(e))
+            return
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+            self.send_error(500, f"Render failed: {e}")
+            return
+        self.send_body(200, "image/svg+xml", svg, {"X-Cache": "hit" if cache_hit else "miss"})
+
+    def send_body(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(workbook, sheet, host, port, cache_bytes, cache_dir):
+    #The map server bound to host:port (port 0 picks a free port) with the index loaded.
+    server = ThreadingHTTPServer((host, port), MapRequestHandler)
+    server.maps = MapServer(workbook, sheet, cache_bytes, cache_dir)
+    server.maps.current_index()
+    return server
+
+
+def serve(workbook, sheet, host, port, cache_bytes, cache_dir):
+    server = make_server(workbook, sheet, host, port, cache_bytes, cache_dir)
+    print(f"Serving maps of {workbook} sheet {sheet} on http://{host}:{server.server_port}/map?app=A,B&legend=1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    '''
+    parser = argparse.ArgumentParser(description="Specify the sheet/tab for the mapping.")
+    parser.add_argument('--sheet', help="Name of the sheet/tab where the mapping is located.")
+
+    args = parser.parse_args()
+    '''
+    parser = argparse.ArgumentParser(description="Create Business Process Maps from Excel.")
+
+    parser.add_argument('--sheet', help="Name of the Excel sheet to read.", required=False)
+    parser.add_argument('--app', help="Application name(s) to map(case sensitive). Comma-separated for multiple or use 'all' or 'ecosystem'.", required=False)
+    parser.add_argument('--legend',help="Include a legend and mechanism guide in the diagram.",action='store_true')
+    parser.add_argument('--no-render-cache',help="Always run Graphviz, do not use the render cache.",action='store_true')
+    parser.add_argument('--batch',help="Build this map in a batch, same format as --app.  Repeat for each map, e.g. --batch App1 --batch App1,App2 --batch all.",action='append',default=[])
+    parser.add_argument('--each-app',help="Build one map per application in a batch.",action='store_true')
+    parser.add_argument('--render-jobs',help="Number of concurrent Graphviz processes in a batch (default: number of CPUs).",type=int,default=os.cpu_count() or 1)
+    parser.add_argument('--aggregate',help="In all and ecosystem maps, draw one edge per App-1, App-2, Mechanism and Direction labelled with the number of relationships (also in the all map), with a wider pen and the topics as tooltip.",action='store_true')
+    parser.add_argument('--workbook',help="Excel workbook to read (default %(default)s).",default=WORKBOOK)
+    parser.add_argument('--serve',help="Serve maps over HTTP on this local port, e.g. /map?app=A,B&legend=1 returns SVG.",type=int,metavar="PORT")
+    parser.add_argument('--host',help="Address the server listens on (default %(default)s).",default="127.0.0.1")
+    parser.add_argument('--cache-mb',help="Memory limit of the server's cache of rendered maps in MB (default %(default)s).",type=int,default=256)
+
+    args = parser.parse_args()
+    batch = args.batch or args.each_app
+    cache_dir = "" if args.no_render_cache else render_cache.CACHE_DIR
+
+
+    # Use the argument if provided and not just whitespace, else prompt
+    if args.sheet and args.sheet.strip():
+        sheet = args.sheet.strip()
+    elif args.serve is not None:
+        parser.error("--serve needs --sheet")
+    else:
+        sheet = input("Enter the tab/sheet where the mapping is located: ").strip()
+
+    if args.serve is not None:
+        serve(args.workbook, sheet, args.host, args.serve, args.cache_mb * 1024 * 1024, cache_dir)
+        return
+
+    print(f"Using sheet: {sheet}")
+
+    # Load the spreadsheet
+    timings = {}
+    index, timings["read"], timings["index"] = load_index(args.workbook, sheet)
+    df = index.df
+
+    # Create output directory if it doesn't exist
+    output_dir = "bmp_output"
+    os.makedirs(output_dir, exist_ok=True)
+
+    if batch:
+        app_sets = list(args.batch) + (index.unique_apps if args.each_app else [])
+        print(f"Read {len(df)} relationships in {timings['read']:.2f}s, indexed in {timings['index']:.2f}s, building {len(app_sets)} maps")
+        run_batch(index, app_sets, args.legend, output_dir, cache_dir, max(1, args.render_jobs), args.aggregate)
+        render_cache.evict(cache_dir)
+        return
+
+    print (f'{df.drop(columns=["app_1", "app_2"])}')
+
+    # List unique applications from combined App-1 and App-2 columns
+    print("Available applications to map:")
+    for app in index.unique_apps:
+        print(f"- {app}")
+    print (f'- all: all relationships, \n- ecosystem: relationships between ecosystem applications.')
+
+    '''
+    # Prompt user for application to map
+    app_to_map = input("Enter the application name(s) to map (comma-separated for multiple): ")
+    app_to_map_list = [app.strip() for app in app_to_map.split(',')]
+    '''
+    # Determine the application(s) to map
+    if args.app and args.app.strip():
+        app_to_map = args.app.strip()
+    else:
+        app_to_map = input("Enter the application name(s) to map (comma-separated for multiple): ").strip()
+
+    start = time.perf_counter()
+    g, output_filename, filtered, relationship_count, edge_count, rejects = build_map(index, app_to_map, args.legend, args.aggregate)
+    print(f'{df[filtered].drop(columns=["app_1", "app_2"])}')    
+    print(f'Relationships to be mapped: {filtered.sum()}')
+
+    # Create full path with output directory
+    output_file = os.path.join(output_dir, output_filename)
+    rejects_file = write_rejects(index, rejects, output_file)
+    if rejects:
+        print(f"Rejected {len(rejects)} relationship rows with a missing App-1 or App-2, see {rejects_file}")
+    timings["graph"] = time.perf_counter() - start
+
+    timings["render"], cache_hit = render_map(g, output_file, cache_dir)
+    render_cache.evict(cache_dir)
+    if cache_hit:
+        print("Layout taken from the render cache")
+    else:
+        layout_times = load_layout_times(output_dir)
+        layout_times[output_filename] = round(timings["render"], 3)
+        save_layout_times(output_dir, layout_times)
+    if "_aggregated" in output_filename:
+        print(aggregation_report(output_filename, relationship_count, edge_count, load_layout_times(output_dir)))
+
+    print(f"Timing: {filtered.sum()} relationships, " + ", ".join(f"{step} {seconds:.2f}s" for step, seconds in timings.items()))
+
+
+    print(f"Graph generated as {output_file}.{g.format}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+#********************************************************************************
+#*  Script: BenchmarkGraphvis.py
+#*  Purpose: Time the stages of CreateGraphvis.py separately on a synthetic export
+#*              (GenerateAzureExport.py) and keep the results across commits.
+#*              Stages: read_excel and the application stages process_application
+#*              records (CreateGraphvis.APPLICATION_STAGES): group, build_node_df,
+#*              process_vms, process_nics, process_paas_resources, process_lbs,
+#*              assign_tier_based_on_parent and create_graphvis_file.
+#*              benchmarks/test_stages.py times the same stages with pytest-benchmark.
+#*              --compare-readers instead reads the workbook with the full-sheet reader
+#*              and the --stream reader, each in a new process, and reports the time
+#*              and peak RSS of both.
+#*              Each run appends a record (commit, workbook size, seconds per stage)
+#*              to the history file and is compared with the previous record for
+#*              the same workbook size.
+#*  Command line: --help
+#*                --resources: size of the generated workbook (default 10000)
+#*                --workbook: benchmark this workbook instead of a generated one
+#*                --apps: number of applications timed per repeat (default all)
+#*                --repeat: repeats, the fastest is reported (default 3)
+#*                --history: JSON-lines file of the results (default benchmarks.jsonl)
+#*                --compare-readers: compare the peak RSS of the full and streamed readers
+#*
+#********************************************************************************
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import CreateGraphvis as cg
+import GenerateAzureExport
+
+
+def git_commit():
+    """
+    Short hash of HEAD, with "+" when the working tree has changes.  "" outside a git checkout.
+    """
+    try:
+        repo = os.path.dirname(os.path.abspath(__file__))
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo, capture_output=True, text=True).stdout.strip()
+        return commit + ("+" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def time_read_excel(workbook):
+
+    cg.file_path = workbook
+    cg.raw_data_sheet = GenerateAzureExport.RAW_DATA_SHEET
+    cg.azure_services_sheet = GenerateAzureExport.AZURE_SERVICES_SHEET
+    cg.shared_services_sheet = GenerateAzureExport.SHARED_SERVICES_SHEET
+
+    start = time.perf_counter()
+    cg.read_excel()
+    return time.perf_counter() - start
+
+
+def measure_reader(workbook, stream):
+    """
+    Reads workbook in this process, with the --stream reader or the full-sheet reader, and
+    returns its seconds, peak RSS and row counts.  Run by compare_readers in a new process, so
+    the peak RSS is that of one reader.
+    """
+    cg.CG_internals.stream = stream
+    rss_before = cg.peak_rss_mb()
+    with contextlib.redirect_stdout(io.StringIO()):
+        seconds = time_read_excel(workbook)
+    return {"reader": "stream" if stream else "full", "seconds": round(seconds, 3),
+            "rss_before_mb": round(rss_before, 1), "peak_rss_mb": round(cg.peak_rss_mb(), 1),
+            "raw_rows": len(cg.CG_internals.raw_data), "production_rows": len(cg.CG_internals.filtered_data)}
+
+
+def compare_readers(workbook):
+    """
+    Runs measure_reader for the full-sheet and the streamed reader, each in a new Python process.
+    """
+    results = []
+    for reader in ("full", "stream"):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--workbook", workbook, "--measure-reader", reader],
+                                capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+    return results
+
+
+def time_applications(tasks):
+    """
+    Runs process_application for each task and sums the wall time of its stage records.
+    Returns {stage: seconds summed over the applications}.
+    """
+
+    seconds = dict.fromkeys(cg.APPLICATION_STAGES, 0.0)
+    for task in tasks:
+        _, _, _, stage_records = cg.process_application(*task)
+        for record in stage_records:
+            seconds[record["stage"]] += record["wall"]
+
+    return seconds
+
+
+def previous_record(history, resources, apps):
+
+    if not os.path.exists(history):
+        return None
+    previous = None
+    with open(history) as f:
+        for line in f:
+            record = json.loads(line)
+            if record["resources"] == resources and record["apps"] == apps:
+                previous = record
+    return previous
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the stages of CreateGraphvis.py on a synthetic Azure export.")
+    parser.add_argument('--resources', help="Resources in the generated workbook (default %(default)s).", type=int, default=10000)
+    parser.add_argument('--workbook', help="Benchmark this workbook instead of a generated one.", default="")
+    parser.add_argument('--apps', help="Number of applications timed per repeat, 0 for all (default %(default)s).", type=int, default=0)
+    parser.add_argument('--repeat', help="Number of repeats, the fastest is reported (default %(default)s).", type=int, default=3)
+    parser.add_argument('--history', help="JSON-lines file the results are appended to (default %(default)s).", default="benchmarks.jsonl")
+    parser.add_argument('--label', help="Free text stored with the results.", default="")
+    parser.add_argument('--compare-readers', help="Compare the time and peak RSS of the full-sheet reader and the --stream reader instead.", action='store_true')
+    parser.add_argument('--measure-reader', help=argparse.SUPPRESS, choices=["full", "stream"])
+    args = parser.parse_args()
+
+    # Generated workbooks are kept in .bench, they are reused by later runs
+    workbook = args.workbook
+    if not workbook:
+        os.makedirs(".bench", exist_ok=True)
+        workbook = os.path.join(".bench", f"AzureExport_{args.resources}.xlsx")
+        if not os.path.exists(workbook):
+            print(f"Generating {workbook}")
+            GenerateAzureExport.generate_workbook(args.resources, workbook)
+
+    cg.CG_internals.debug = 0
+    cg.CG_internals.use_cache = False
+    cg.CG_internals.debug_app = None        # never matches an application, no debug tracing
+
+    if args.measure_reader:
+        print(json.dumps(measure_reader(workbook, args.measure_reader == "stream")))
+        sys.exit(0)
+    if args.compare_readers:
+        full, stream = compare_readers(workbook)
+        print(f"{os.path.basename(workbook)}: {full['raw_rows']} RawData rows, {full['production_rows']} Production IaaS/PaaS rows")
+        print(f"{'reader':<10}{'seconds':>10}{'peak RSS MB':>14}{'of which read':>15}{'rows kept':>11}")
+        for result in (full, stream):
+            print(f"{result['reader']:<10}{result['seconds']:10.2f}{result['peak_rss_mb']:14.1f}{result['peak_rss_mb'] - result['rss_before_mb']:15.1f}{result['raw_rows']:11d}")
+        print(f"--stream peak RSS {stream['peak_rss_mb'] / full['peak_rss_mb'] - 1:+.0%}, time {stream['seconds'] / full['seconds'] - 1:+.0%}")
+        if stream["production_rows"] != full["production_rows"]:
+            print(f"Production rows differ: full {full['production_rows']}, stream {stream['production_rows']}")
+            sys.exit(1)
+        sys.exit(0)
+
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        results["read_excel"] = min(time_read_excel(workbook) for _ in range(args.repeat))
+
+    sorted_data = cg.CG_internals.filtered_data.sort_values(by=["AppName", "as_Category", "as_ResourceType", "name"])
+    with tempfile.TemporaryDirectory() as output_dir:
+        tasks = cg.application_tasks(sorted_data, output_dir)
+        if args.apps:
+            tasks = tasks[:args.apps]
+
+        runs = []
+        for _ in range(args.repeat):
+            with contextlib.redirect_stdout(io.StringIO()):
+                runs.append(time_applications(tasks))
+    for stage in cg.APPLICATION_STAGES:
+        results[stage] = min(run[stage] for run in runs)
+
+    record = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "label": args.label,
+        "workbook": os.path.basename(workbook),
+        "resources": len(cg.CG_internals.raw_data),
+        "rows": len(sorted_data),
+        "apps": len(tasks),
+        "seconds": {stage: round(seconds, 4) for stage, seconds in results.items()},
+    }
+    previous = previous_record(args.history, record["resources"], record["apps"])
+
+    print(f"{record['workbook']}: {record['resources']} resources, {record['rows']} Production IaaS/PaaS rows, {record['apps']} applications, best of {args.repeat}")
+    if previous:
+        print(f"Compared with {previous['commit'] or 'unknown commit'} ({previous['time']})")
+    print(f"{'stage':<30}{'seconds':>10}{'ms/app':>10}{'change':>10}")
+    for stage, seconds in record["seconds"].items():
+        per_app = "" if stage == "read_excel" else f"{1000 * seconds / max(1, record['apps']):10.2f}"
+        change = ""
+        if previous and previous["seconds"].get(stage):
+            change = f"{100 * (seconds / previous['seconds'][stage] - 1):+9.1f}%"
+        print(f"{stage:<30}{seconds:10.3f}{per_app:>10}{change:>10}")
+    print(f"{'total':<30}{sum(record['seconds'].values()):10.3f}")
+
+    with open(args.history, "a") as f:
+        f.write(json.dumps(record) + "\n")
@@ -13,13 +13,24 @@
 #********************************************************************************
 
 import pandas as pd
-import pdb
+import numpy as np
 import os
 import graphviz as g
 import sys
 import inspect
 import re
+import hashlib
+import json
+import time
+import argparse
+import shutil
+import subprocess
+import contextlib
+import cProfile
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from graphviz import Digraph
+import render_cache
 
 
 #***************************************************************
@@ -29,24 +40,61 @@ class CG_internals:
         # variables
         version = "04"
         name = ""
-        doc_df = pd.DataFrame(columns=["Name", "Subroutine", "Purpose"])
-        document = False                # create documentation for this application
-        output_file = ""                # .dot file to be created
+        registry = {}                   # code documentation rows, see documented()
+        document = True                 # write the script documentation graph at the end of the run
         debug = 1                       # debugging level (0-5), 0=none, 5=verbose;
+        debug_levels = {}               # per subsystem debugging level, overrides debug
+        log_json = ""                   # also append every message to this JSON-lines file
         debug_app = ""
         filtered_data = pd.DataFrame()  
         shared_xref = pd.DataFrame() 
         raw_data = pd.DataFrame()         
+        use_cache = True                # read sheets from the parquet sidecar cache when it is current
+        rebuild_cache = False           # ignore the sidecar cache and re-parse the workbook
+        cache_dir = ".xlsx_cache"       # sidecar cache directory, next to the workbook
+        jobs = 1                        # number of worker processes generating applications
+        full_rebuild = False            # ignore the manifest and regenerate every application
+        stream = False                  # stream RawData keeping only the used columns and Production rows
+        unique_format = "xlsx"          # UniqueNames export format: xlsx, csv or parquet
+        icon_dir = ""                   # directory of the node icons, "" keeps the Windows relative icons\ paths
+        render_formats = []             # Graphviz output formats rendered from the .dot files, e.g. ["svg", "png"]
+        render_jobs = os.cpu_count() or 1   # number of concurrent Graphviz processes
+        render_timeout = 300            # seconds allowed for one layout before the fallback engine is tried
+        render_engine = "dot"
+        render_fallback = "fdp"         # engine used when the render_engine times out or fails, "" for none
+        render_cache_dir = render_cache.CACHE_DIR   # content-addressed cache of rendered files, "" for none
+        render_cache_size = render_cache.MAX_BYTES  # the least recently used renders are evicted above this size
+        profile = ""                    # --profile report file, "" when not profiling
+        profile_app = ""                # application run under cProfile
+        stage_records = []              # timing records, one per stage (and application), see profile_stage()
+        open_stages = []                # peak traced bytes of the nested stages still running, innermost last
+        cost_top = 10                   # slowest applications listed by the application cost report
+        ire_names = {}                  # IRE names derived for the current application, name -> IRE name
 
         # Code documentation methods
         @classmethod    
         def add(cls, name, subroutine, purpose):
-            # Check if this exact row already exists
-            duplicate = ((cls.doc_df["Name"] == name) &
-                        (cls.doc_df["Subroutine"] == subroutine) &
-                        (cls.doc_df["Purpose"] == purpose)).any()
-            if not duplicate:
-                cls.doc_df.loc[len(cls.doc_df)] = [name, subroutine, purpose]
+            # The registry is an insertion ordered set of (name, subroutine, purpose) rows
+            cls.registry[(name, subroutine, purpose)] = None
+
+        @classmethod
+        def documented(cls, *calls):
+            """
+            Decorator registering a function, and the subroutines it calls, in the documentation
+            registry when the script is imported.  Each call is "subroutine" or ("subroutine", "purpose").
+            The function itself is returned unchanged, so documentation costs nothing at run time.
+            """
+            def register(func):
+                cls.add(func.__name__, "", "")
+                for call in calls:
+                    subroutine, purpose = (call, "") if isinstance(call, str) else call
+                    cls.add(func.__name__, subroutine, purpose)
+                return func
+            return register
+
+        @classmethod
+        def doc_df(cls):
+            return pd.DataFrame(list(cls.registry), columns=["Name", "Subroutine", "Purpose"])
 
                 
         @classmethod
@@ -63,12 +111,13 @@ class CG_internals:
             dot = Digraph(comment="Script Documentation", format=format)
 
             dot.attr(label=f'{filename}')
+            doc_df = cls.doc_df()
 
             # First, add all unique nodes (to ensure they appear even without edges)
-            for name in pd.unique(cls.doc_df["Name"]):
+            for name in pd.unique(doc_df["Name"]):
                 dot.node(name)
 
-            for _, row in cls.doc_df.iterrows():
+            for _, row in doc_df.iterrows():
                 name = row["Name"]
                 sub = row["Subroutine"]
                 purpose = row["Purpose"]
@@ -85,12 +134,79 @@ class LoadBalancer:
         self.tier = tier 
 
 
+class SubstringIndex:
+    """
+    Answers "which names contain this pattern" without scanning every name.
+
+    Every 3-gram of every name is mapped to the positions of the names containing it, in name
+    order.  A pattern of 3 or more characters is only checked against the names holding its
+    rarest 3-gram, shorter patterns against every name.  The table is built once, so memory is
+    bounded by the total length of the names however many patterns, or pattern lengths, are
+    queried.  process_application builds one index over the application's node names and the
+    node stages share it, each passing the rows it is looking for as candidates.
+    """
+    GRAM = 3
+
+    def __init__(self, names):
+        self.names = [name if isinstance(name, str) else (None if pd.isna(name) else str(name)) for name in names]
+        self._grams = None
+
+    def _gram_table(self):
+        if self._grams is None:
+            self._grams = {}
+            for pos, name in enumerate(self.names):
+                if name is None:
+                    continue
+                for start in range(len(name) - self.GRAM + 1):
+                    positions = self._grams.setdefault(name[start:start + self.GRAM], [])
+                    if not positions or positions[-1] != pos:
+                        positions.append(pos)
+        return self._grams
+
+    def matches(self, pattern, candidates=None):
+        """
+        Positions of all names containing pattern, in name order.  candidates, a boolean
+        sequence over the names, limits the answer to the positions where it is True.
+        """
+        if len(pattern) < self.GRAM:
+            positions = (pos for pos, name in enumerate(self.names) if name is not None and pattern in name)
+        else:
+            table = self._gram_table()
+            rarest = min((table.get(pattern[start:start + self.GRAM], ()) for start in range(len(pattern) - self.GRAM + 1)), key=len)
+            positions = (pos for pos in rarest if pattern in self.names[pos])
+        if candidates is not None:
+            return [pos for pos in positions if candidates[pos]]
+        return list(positions)
+
+    def first_match(self, pattern, candidates=None):
+        """Position of the first name containing pattern (among candidates), or None."""
+        positions = self.matches(pattern, candidates)
+        return positions[0] if positions else None
+
+
+
+
+class DotBuilder:
+    """
+    Accumulates the lines of one .dot file in memory.  The finished text is available from
+    text() so it can be hashed, cached or rendered, merge_application_results writes it in a single call.
+    """
+    def __init__(self, name=""):
+        self.name = name            # output file name, used in messages
+        self.lines = []
+
+    def write(self, line: str):
+        self.lines.append(line)
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n" if self.lines else ""
 
+
+@CG_internals.documented()
 def cleanup_existing_files(output_dir, extensions):
     """
     Cleans up existing files in the output directory with specified extensions.
     """
-    CG_internals.add(inspect.currentframe().f_code.co_name,"","")
     
 
     for filename in os.listdir(output_dir):
@@ -98,21 +214,157 @@ def cleanup_existing_files(output_dir, extensions):
             os.remove(os.path.join(output_dir, filename))
 
 
+@CG_internals.documented()
+def workbook_cache_key(file_path):
+    """
+    Returns the identity of the workbook used to validate the sidecar cache:
+    absolute path, size, mtime and a sha256 of the file contents.
+    """
+
+    stat = os.stat(file_path)
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+
+    return {"path": os.path.abspath(file_path), "size": stat.st_size, "mtime": stat.st_mtime_ns, "sha256": sha.hexdigest()}
+
+
+@CG_internals.documented()
+def read_sheet_cached(file_path, sheet_name, workbook_key, timings, reader=None, variant=""):
+    """
+    Reads one sheet of the workbook, using a parquet sidecar in CG_internals.cache_dir when its
+    key (workbook path, sheet, size, mtime and content hash) matches.  Otherwise the sheet is
+    parsed with pd.read_excel and the sidecar is rebuilt.
+
+    :param timings: list that receives (sheet_name, "hit"|"parse", seconds) for the timing report.
+    :param reader: optional reader(file_path, sheet_name) used instead of pd.read_excel.
+    :param variant: names the reader's output in the cache, so it is cached apart from the full sheet.
+    """
+
+    start = time.perf_counter()
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(file_path)), CG_internals.cache_dir)
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    sheet_stem = re.sub(r'[^A-Za-z0-9_.-]', '_', sheet_name) + (f'.{variant}' if variant else '')
+    data_path = os.path.join(cache_dir, f'{stem}.{sheet_stem}.parquet')
+    key_path = os.path.join(cache_dir, f'{stem}.{sheet_stem}.key.json')
+    key = dict(workbook_key, sheet=sheet_name, variant=variant)
+
+    if CG_internals.use_cache and not CG_internals.rebuild_cache and os.path.exists(data_path) and os.path.exists(key_path):
+        try:
+            with open(key_path) as f:
+                cached_key = json.load(f)
+            if cached_key == key:
+                df = pd.read_parquet(data_path)
+                timings.append((sheet_name, "hit", time.perf_counter() - start))
+                return df
+        except Exception as e:
+            error_msg(inspect.currentframe().f_code.co_name, f"Ignoring unreadable cache for sheet '{sheet_name}': {e}")
+
+    df = reader(file_path, sheet_name) if reader else pd.read_excel(file_path, sheet_name=sheet_name)
+    timings.append((sheet_name, "parse", time.perf_counter() - start))
+
+    if CG_internals.use_cache:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            df.to_parquet(data_path, index=False)
+            with open(key_path, "w") as f:
+                json.dump(key, f)
+        except Exception as e:
+            # Cache is an optimization only, an unwritable cache should never stop the run
+            error_msg(inspect.currentframe().f_code.co_name, f"Unable to write cache for sheet '{sheet_name}': {e}")
+
+    return df
+
+
+# RawData columns used by the pipeline, the streaming reader keeps only these
+RAW_DATA_COLUMNS = ["name", "type", "AppName", "Environment", "Unique"]
+
+# Low-cardinality columns of the workbook frames held as pandas Categoricals, comparisons on them
+# are integer code compares.  The per-application node_df (tens of rows) stays object dtype, there
+# the Categorical overhead costs more than it saves.
+CATEGORY_COLUMNS = ["type", "AppName", "Environment", "Unique", "as_ResourceType", "as_Category", "xr_PrimaryAppName", "xr_SharedAppName", "xr_URL"]
+
+def compact_categories(df, columns=CATEGORY_COLUMNS):
+    """
+    Converts the given columns of df (where present) to Categoricals, dropping categories no row uses.
+    """
+    for column in columns:
+        if column in df.columns:
+            df[column] = df[column].astype("category").cat.remove_unused_categories()
+    return df
+
+
+def stream_raw_data(file_path, sheet_name, keep_types):
+    """
+    Reads the RawData sheet row by row with openpyxl in read_only mode, keeping only the
+    RAW_DATA_COLUMNS of Production rows whose type is in keep_types.  Peak memory is the
+    size of the kept rows rather than the whole sheet.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+        header = next(rows)
+        columns = {column: header.index(column) for column in RAW_DATA_COLUMNS if column in header}
+        environment_col, type_col = columns["Environment"], columns["type"]
+
+        data = {column: [] for column in columns}
+        for row in rows:
+            if row[environment_col] != "Production" or row[type_col] not in keep_types:
+                continue
+            for column, col in columns.items():
+                data[column].append(row[col])
+    finally:
+        workbook.close()
+
+    return pd.DataFrame(data)
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB, None where the resource module is not available (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+@CG_internals.documented("stream_raw_data")
 def read_excel():
-    CG_internals.add(inspect.currentframe().f_code.co_name,"","")
     try:
-        # Read both sheets from the Excel file
-        CG_internals.raw_data = pd.read_excel(file_path, sheet_name=raw_data_sheet)
-        resource_lookup = pd.read_excel(file_path, sheet_name=azure_services_sheet)
-        CG_internals.shared_xref = pd.read_excel(file_path, sheet_name=shared_services_sheet)
+        with profile_stage("read_excel") as counts:
+            # Read the sheets from the Excel file, or from the sidecar cache when it is current
+            timings = []
+            workbook_key = workbook_cache_key(file_path) if CG_internals.use_cache else {}
+            resource_lookup = read_sheet_cached(file_path, azure_services_sheet, workbook_key, timings)
+            CG_internals.shared_xref = read_sheet_cached(file_path, shared_services_sheet, workbook_key, timings)
+
+            if CG_internals.stream:
+                # Only Production rows of IaaS/PaaS types are kept, before the merges
+                keep_types = set(resource_lookup.loc[resource_lookup["Category"].str.contains("IaaS|PaaS", na=False), "ResourceType"])
+                reader = lambda path, sheet: stream_raw_data(path, sheet, keep_types)
+                CG_internals.raw_data = read_sheet_cached(file_path, raw_data_sheet, workbook_key, timings, reader=reader, variant="production")
+            else:
+                CG_internals.raw_data = read_sheet_cached(file_path, raw_data_sheet, workbook_key, timings)
 
-        CG_internals.raw_data["AppName"] = CG_internals.raw_data["AppName"].str.strip()
+            for sheet_name, source, seconds in timings:
+                debug_msg(1, 'Read sheet %s: %s in %.2fs', sheet_name, "cache hit" if source == "hit" else "parsed", seconds, subsystem="read")
+            debug_msg(1, 'Workbook read in %.2fs', sum(t[2] for t in timings), subsystem="read")
 
-        resource_lookup = resource_lookup.add_prefix("as_")
-        CG_internals.shared_xref = CG_internals.shared_xref.add_prefix("xr_")
+            CG_internals.raw_data["AppName"] = CG_internals.raw_data["AppName"].str.strip()
+            compact_categories(CG_internals.raw_data)
 
-        CG_internals.shared_xref = CG_internals.shared_xref.dropna(subset=["xr_SharedAppName"])
-        CG_internals.shared_xref["xr_SharedAppName"] = CG_internals.shared_xref["xr_SharedAppName"].str.strip()
+            resource_lookup = resource_lookup.add_prefix("as_")
+            CG_internals.shared_xref = CG_internals.shared_xref.add_prefix("xr_")
+
+            CG_internals.shared_xref = CG_internals.shared_xref.dropna(subset=["xr_SharedAppName"])
+            CG_internals.shared_xref["xr_SharedAppName"] = CG_internals.shared_xref["xr_SharedAppName"].str.strip()
+            counts["rows"] = len(CG_internals.raw_data)
         
     except Exception as e:
         error_msg(inspect.currentframe().f_code.co_name, f"Error reading Excel file: {e}")
@@ -120,7 +372,8 @@ def read_excel():
 
     # Merge CG_internals.raw_data with CG_internals.shared_xref on 'name' == 'SharedAppName'
     if "name" in CG_internals.raw_data.columns and "xr_PrimaryAppName" in CG_internals.shared_xref.columns:  
-        CG_internals.raw_data = pd.merge(CG_internals.raw_data, CG_internals.shared_xref, left_on="AppName", right_on="xr_PrimaryAppName", how="left")
+        with profile_stage("merge_shared_xref", rows=len(CG_internals.raw_data)):
+            CG_internals.raw_data = pd.merge(CG_internals.raw_data, CG_internals.shared_xref, left_on="AppName", right_on="xr_PrimaryAppName", how="left")
     else:
         #print(CG_internals.raw_data.columns, CG_internals.shared_xref.columns)
         debug_msg(0, "The required 'name' or 'xr_PrimaryAppName' column is missing in one of the sheets.")
@@ -128,21 +381,27 @@ def read_excel():
 
     # Merge RawData with ResourceLookup on the 'type' column
     if "type" in CG_internals.raw_data.columns and "as_ResourceType" in resource_lookup.columns:
-        merged_data = pd.merge(CG_internals.raw_data, resource_lookup, left_on="type", right_on="as_ResourceType", how="left")
+        with profile_stage("merge_resource_lookup", rows=len(CG_internals.raw_data)):
+            merged_data = pd.merge(CG_internals.raw_data, resource_lookup, left_on="type", right_on="as_ResourceType", how="left")
     else:
         debug_msg(0, "The required 'type' column is missing in one of the sheets.")
         return
 
-    debug_msg(2, f"The number of rows in the merged dataset is: {merged_data.shape[0]}")
+    debug_msg(2, "The number of rows in the merged dataset is: %d", merged_data.shape[0], subsystem="read")
 
     # Filter the merged data using ResourceType and Environment
-    CG_internals.filtered_data = merged_data[
-        (merged_data["Environment"] == "Production")
-        & (merged_data["as_Category"].str.contains("IaaS|PaaS", na=False))
-    ]
+    with profile_stage("filter_production", rows=len(merged_data)):
+        CG_internals.filtered_data = compact_categories(merged_data[
+            (merged_data["Environment"] == "Production")
+            & (merged_data["as_Category"].str.contains("IaaS|PaaS", na=False))
+        ].copy())
 
+    peak_rss = peak_rss_mb()
+    if peak_rss is not None:
+        debug_msg(1, 'Peak RSS after reading the workbook (%s): %.0f MB', "streamed" if CG_internals.stream else "full sheets", peak_rss, subsystem="read")
+
+@CG_internals.documented()
 def check_for_critical_columns(required_columns, data):
-    CG_internals.add(inspect.currentframe().f_code.co_name,"","")
     
     """
     Checks if all required columns exist in the given DataFrame.
@@ -157,53 +416,315 @@ def check_for_critical_columns(required_columns, data):
             sys.exit(1)  # Exit with error code 1
 
 
-def debug_msg(lvl, msg):
+def debug_msg(lvl, msg, *args, subsystem="main"):
+    """
+    Prints msg if lvl is enabled for the subsystem (CG_internals.debug_levels, else CG_internals.debug).
+    Formatting is deferred until the level check passes, pass either a %-style format and its
+    args, or a callable returning the message, so DataFrame dumps cost nothing when disabled.
+    """
     #CG_internals.add(inspect.currentframe().f_code.co_name,"","")
-    if lvl <= CG_internals.debug:
-        print(f'{msg}')
+    if lvl > CG_internals.debug_levels.get(subsystem, CG_internals.debug):
+        return
+    if callable(msg):
+        msg = msg()
+    elif args:
+        msg = msg % args
+    print(f'{msg}')
+    if CG_internals.log_json:
+        log_json_record(lvl, subsystem, msg)
 
 def error_msg(call_funct, msg):
     #CG_internals.add(inspect.currentframe().f_code.co_name,"","")
     print(f'❌ {msg}.  Thrown from {call_funct}')
+    if CG_internals.log_json:
+        log_json_record("error", call_funct, msg)
+
+def log_json_record(lvl, subsystem, msg):
+    """
+    Appends one message to the CG_internals.log_json JSON-lines file.
+    """
+    record = {"time": time.time(), "level": lvl, "subsystem": subsystem, "app": CG_internals.name, "pid": os.getpid(), "msg": str(msg)}
+    with open(CG_internals.log_json, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+#******************************************************************************
+# Profiling (--profile) and the application cost report
+# Every pipeline stage records its wall time, CPU time and its row/node counts,
+# and with --profile the peak memory traced by tracemalloc while it ran.
+# Application stages are recorded where the application runs (worker or main
+# process) and returned with the application's result.
+#******************************************************************************
+@contextlib.contextmanager
+def profile_stage(stage, app="", **counts):
+    """
+    Records the enclosed block as one stage in CG_internals.stage_records.  The yielded dict holds
+    the stage's counts, the block can add counts it only knows at the end.
+    """
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        # reset_peak() would lose the peak of the enclosing stage, keep it on the stack first
+        traced, peak = tracemalloc.get_traced_memory()
+        if CG_internals.open_stages:
+            CG_internals.open_stages[-1] = max(CG_internals.open_stages[-1], peak)
+        CG_internals.open_stages.append(traced)
+        tracemalloc.reset_peak()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield counts
+    finally:
+        record = {"stage": stage, "app": app,
+                  "wall": round(time.perf_counter() - wall, 6),
+                  "cpu": round(time.process_time() - cpu, 6)}
+        if tracing:
+            # The stage's peak is the highest of its own and its inner stages' peaks, and is
+            # passed on to the enclosing stage
+            peak = max(CG_internals.open_stages.pop(), tracemalloc.get_traced_memory()[1])
+            if CG_internals.open_stages:
+                CG_internals.open_stages[-1] = max(CG_internals.open_stages[-1], peak)
+            record["peak_mb"] = round((peak - traced) / (1024 * 1024), 3)
+        record.update(counts)
+        CG_internals.stage_records.append(record)
+
+
+def app_profile_file(app_name):
+    """
+    cProfile output of --profile-app: <profile report>.<app>.prof, or <app>.prof without --profile.
+    """
+    safe_name = re.sub(r'[^\w.-]', '_', app_name)
+    if CG_internals.profile:
+        return f"{os.path.splitext(CG_internals.profile)[0]}.{safe_name}.prof"
+    return f"{safe_name}.prof"
+
+
+def write_profile_report(path, wall, cpu):
+    """
+    Writes the --profile report: the run totals, a summary per stage and every stage record.
+    cpu is the main process only, application stages run with --jobs > 1 carry the worker's CPU time.
+    """
+
+    summary = {}
+    for record in CG_internals.stage_records:
+        total = summary.setdefault(record["stage"], {"count": 0, "wall": 0.0, "cpu": 0.0, "peak_mb": 0.0})
+        total["count"] += 1
+        total["wall"] += record["wall"]
+        total["cpu"] += record["cpu"]
+        total["peak_mb"] = max(total["peak_mb"], record.get("peak_mb", 0.0))
+        for key in ("rows", "nodes"):
+            if key in record:
+                total[key] = total.get(key, 0) + record[key]
+    for total in summary.values():
+        total["wall"], total["cpu"] = round(total["wall"], 6), round(total["cpu"], 6)
+
+    report = {
+        "script": os.path.basename(sys.argv[0]),
+        "version": CG_internals.version,
+        "argv": sys.argv[1:],
+        "jobs": CG_internals.jobs,
+        "wall": round(wall, 6),
+        "cpu": round(cpu, 6),
+        "peak_rss_mb": peak_rss_mb(),
+        "summary": summary,
+        "stages": CG_internals.stage_records,
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=1)
+
+    for stage, total in summary.items():
+        debug_msg(1, '%-28s %5d x %9.3fs wall %9.3fs cpu %9.1f MB peak', stage, total["count"], total["wall"], total["cpu"], total["peak_mb"], subsystem="profile")
+    debug_msg(0, 'Profile written to %s', path, subsystem="profile")
+
+
+COSTS_FILE = "application_costs.csv"
+def application_cost(app_name, records):
+    """
+    One row of the application cost report, from the application's stage records.
+    """
+    stages = {record["stage"]: record for record in records}
+    types = stages["build_node_df"]["types"]
+    cost = {
+        "AppName": app_name,
+        "resources": stages["group"]["resources"],
+        "shared_rows": stages["group"]["shared_rows"],
+        "nodes": stages["build_node_df"]["nodes"],
+        "vms": types.get("virtualmachines", 0) + types.get("sqlvirtualmachines", 0),
+        "nics": types.get("networkinterfaces", 0),
+        "lbs": types.get("loadbalancers", 0),
+        "dot_bytes": stages["create_graphvis_file"]["dot_bytes"],
+    }
+    cost.update({f"s_{stage}": stages[stage]["wall"] for stage in APPLICATION_STAGES})
+    cost["seconds"] = round(sum(stages[stage]["wall"] for stage in APPLICATION_STAGES), 6)
+    cost["types"] = types
+    return cost
+
+
+@CG_internals.documented("application_cost")
+def write_application_costs(output_dir, tasks, changed_apps, manifest):
+    """
+    Writes the application cost report, one row per application: its resource counts by type,
+    VM/NIC/LB counts, shared application rows, DOT size and the seconds spent in each pass.
+    Unchanged applications keep the costs measured when they were last rebuilt (rebuilt=False).
+    The slowest applications and a linear fit of seconds per node are logged.
+
+    Returns:
+        {app name: cost} for the manifest
+    """
+
+    records = {}
+    for record in CG_internals.stage_records:
+        if record["app"]:
+            records.setdefault(record["app"], []).append(record)
+
+    costs = {}
+    for app_name, *_ in tasks:
+        if app_name in changed_apps:
+            costs[app_name] = application_cost(app_name, records[app_name])
+        elif manifest["apps"][app_name].get("cost"):
+            costs[app_name] = manifest["apps"][app_name]["cost"]
+    if not costs:
+        return costs
+
+    table = pd.DataFrame(list(costs.values()))
+    table.insert(1, "rebuilt", table["AppName"].isin(changed_apps))
+    types = pd.DataFrame(list(table.pop("types"))).fillna(0).astype(int)
+    table = pd.concat([table, types[sorted(types.columns)].add_prefix("type_")], axis=1)
+    costs_path = os.path.join(output_dir, COSTS_FILE)
+    table.to_csv(costs_path, index=False)
+    debug_msg(1, 'Application costs written to %s', costs_path, subsystem="costs")
+
+    slowest = table.nlargest(CG_internals.cost_top, "seconds")
+    debug_msg(1, lambda: "Slowest applications:\n" + slowest[["AppName", "rebuilt", "resources", "shared_rows", "nodes", "vms", "nics", "lbs", "dot_bytes", "seconds"]].to_string(index=False), subsystem="costs")
+
+    # seconds = per_app + per_node * nodes, over the applications measured in this run
+    measured = table[table["rebuilt"]]
+    if measured["nodes"].nunique() > 1:
+        per_node, per_app = np.polyfit(measured["nodes"], measured["seconds"], 1)
+        predicted = per_app + per_node * measured["nodes"]
+        variance = ((measured["seconds"] - measured["seconds"].mean()) ** 2).sum()
+        r2 = 1 - ((measured["seconds"] - predicted) ** 2).sum() / variance if variance else 1.0
+        debug_msg(1, 'Fitted cost: %.2f ms per application + %.3f ms per node (R^2 %.2f, %d applications), %d nodes predict %.1fs',
+                  1000 * per_app, 1000 * per_node, r2, len(measured), table["nodes"].sum(), per_app * len(table) + per_node * table["nodes"].sum(), subsystem="costs")
+
+    return costs
 
 
 # Function to find the tier of a load balancer by its label
+@CG_internals.documented()
 def find_loadbalancer_tier(label, df):
-    CG_internals.add(inspect.currentframe().f_code.co_name,"","")
     row = df[df["name"] == label]
     if not row.empty:
         return row.iloc[0]["tier"]
     return None
 
         
+@CG_internals.documented()
 def unique_name(prod_name): 
-    CG_internals.add(inspect.currentframe().f_code.co_name,"","")
     
-    debug_msg(5, inspect.currentframe().f_code.co_name + f' 0: {prod_name}')
+    debug_msg(5, 'unique_name 0: %s', prod_name, subsystem="nodes")
     left_three = prod_name[:3]
     fourth = prod_name[3]
     if "-prd-" in prod_name or "prod" in prod_name:
         ire_name = prod_name.replace("-prd-", "-ire-")
         ire_name = ire_name.replace("prod", "ire")
         dr_name = prod_name.replace("-prd-", "-drp-")
-        debug_msg(5, inspect.currentframe().f_code.co_name + f" 1:{fourth}")
+        debug_msg(5, "unique_name 1:%s", fourth, subsystem="nodes")
     elif ("com" in left_three or "crp" in left_three):        # legacy style
             ire_name = prod_name[:3] + "i" + prod_name[4:]
             dr_name = prod_name[:3] + "r" + prod_name[4:]
-            debug_msg(5,"2a")
+            debug_msg(5, "unique_name 2a", subsystem="nodes")
     elif left_three == "mpc":                           # greenfield 2 style
         ire_name = prod_name[:6] + "i" + prod_name[7:]
         dr_name = prod_name[:6] + "r" + prod_name[7:]
-        debug_msg(5, inspect.currentframe().f_code.co_name + " 2b")  
+        debug_msg(5, "unique_name 2b", subsystem="nodes")  
     else:
         ire_name = prod_name + "_IRE"
-        debug_msg(5, inspect.currentframe().f_code.co_name + " 3") 
+        debug_msg(5, "unique_name 3", subsystem="nodes") 
         
     #print(inspect.currentframe().f_code.co_name , prod_name, ire_name)
     return ire_name
 
+@CG_internals.documented()
+def unique_names(prod_names: pd.Series) -> pd.DataFrame:
+    """
+    Vectorized unique_name: returns the "IRE Name" and "DR Name" for every entry of prod_names
+    using the same prefix rules, evaluated in the same order.  Names matching no rule get an
+    _IRE / _DR suffix.
+    """
+
+    names = prod_names.astype(str)
+    left_three = names.str[:3]
+
+    prod_style = names.str.contains("-prd-", regex=False) | names.str.contains("prod", regex=False)
+    legacy_style = left_three.isin(["com", "crp"])
+    greenfield_style = (left_three == "mpc")
+
+    ire_names = names + "_IRE"
+    ire_names = ire_names.mask(greenfield_style, names.str[:6] + "i" + names.str[7:])
+    ire_names = ire_names.mask(legacy_style, names.str[:3] + "i" + names.str[4:])
+    ire_names = ire_names.mask(prod_style, names.str.replace("-prd-", "-ire-", regex=False).str.replace("prod", "ire", regex=False))
+
+    dr_names = names + "_DR"
+    dr_names = dr_names.mask(greenfield_style, names.str[:6] + "r" + names.str[7:])
+    dr_names = dr_names.mask(legacy_style, names.str[:3] + "r" + names.str[4:])
+    dr_names = dr_names.mask(prod_style, names.str.replace("-prd-", "-drp-", regex=False))
+
+    return pd.DataFrame({"IRE Name": ire_names, "DR Name": dr_names})
+
+@CG_internals.documented("unique_names")
+def add_dr_names(df):
+    """
+    Adds the "DR Name" column for every row of df that has an IRE name, in one pass.
+    """
+
+    if "IRE Name" in df.columns:
+        flagged = df["IRE Name"].notna()
+        df["DR Name"] = pd.Series(dtype=object)
+        df.loc[flagged, "DR Name"] = unique_names(df.loc[flagged, "name"])["DR Name"]
+
+@CG_internals.documented()
+def update_ire_names(ire_map):
+    """
+    Writes the IRE names derived for one application back into raw_data.
+    """
+
+    if ire_map:
+        raw_mask = CG_internals.raw_data['name'].isin(ire_map.keys())
+        CG_internals.raw_data.loc[raw_mask, "IRE Name"] = CG_internals.raw_data.loc[raw_mask, 'name'].map(ire_map)
+
+@CG_internals.documented()
+def write_unique_names(df, path, sheet_name):
+    """
+    Writes df with its index, laid out as DataFrame.to_excel does, by the extension of path:
+    .csv, .parquet, or .xlsx with xlsxwriter in constant_memory mode.  DataFrame.to_excel
+    writes column by column, so rows are streamed here with write_row instead.
+    """
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        df.to_csv(path)
+    elif ext == ".parquet":
+        df.to_parquet(path)
+    else:
+        import xlsxwriter
+
+        # Dates, the header and the index are formatted as DataFrame.to_excel formats them
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_urls": False,
+                                              "default_date_format": "YYYY-MM-DD HH:MM:SS"})
+        try:
+            worksheet = workbook.add_worksheet(sheet_name)
+            header_format = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+            worksheet.write_row(0, 1, [str(column) for column in df.columns], header_format)
+
+            values = df.astype(object).where(df.notna(), None)   # NaN / NaT -> blank cell
+            for row, record in enumerate(values.itertuples(), start=1):
+                worksheet.write(row, 0, record[0], header_format)
+                worksheet.write_row(row, 1, record[1:])
+        finally:
+            workbook.close()
+
+
+@CG_internals.documented("write_unique_names")
 def updateUniqueNamesXls(df, uniqueXlsx_path, raw_data_sheet):
-    CG_internals.add(inspect.currentframe().f_code.co_name,"","")
     
 
     try:
@@ -216,11 +737,11 @@ def updateUniqueNamesXls(df, uniqueXlsx_path, raw_data_sheet):
             raise ValueError("raw_data_sheet must be a non-empty string")
 
         #uniqueXlsx_path = "UniqueNames.xlsx"
-        debug_msg(0, f'Creating {uniqueXlsx_path}\n')
+        debug_msg(0, 'Creating %s\n', uniqueXlsx_path, subsystem="read")
 
         # Attempt to write to Excel
-        df.to_excel(uniqueXlsx_path, sheet_name=raw_data_sheet)
-        debug_msg(3, f'Successfully created {uniqueXlsx_path}')
+        write_unique_names(df, uniqueXlsx_path, raw_data_sheet)
+        debug_msg(3, 'Successfully created %s', uniqueXlsx_path, subsystem="read")
 
     except PermissionError:
         error_msg(inspect.currentframe().f_code.co_name, f"Error: Cannot write to {uniqueXlsx_path}. The file might be open in another program. Close it and try again.")
@@ -236,52 +757,41 @@ def updateUniqueNamesXls(df, uniqueXlsx_path, raw_data_sheet):
 
 
 
+@CG_internals.documented()
 def build_node_df(combined_group: pd.DataFrame, raw_data: pd.DataFrame, dot_type: str):
-    CG_internals.add(inspect.currentframe().f_code.co_name,"","")
     # Write each resource as a node
         
-    node_df = pd.DataFrame(columns=['type', 'dot_label', 'name', 'tier', 'parent', 'parent_name', 'parsed'])
-
-    # Create node_df with attributes for the Graphviz diagrams
-    for resource_type, resources in combined_group.groupby("type"):
-        dot_type = resource_type.split('/')[-1]
-        resource_cnt = 0
-        all_cnt=0
-        for idx, row in resources.iterrows():
-            resource_cnt += 1
-            all_cnt += 1
-            label = row["name"]
-            unique_flag = row.get("Unique", "N")  # Default to "N" if column missing
-            node_id = f'{dot_type}_{resource_cnt}'
-
-            if unique_flag == "Y":
-                ire_name = unique_name(label)
-                CG_internals.raw_data.loc[CG_internals.raw_data['name'] == label, "IRE Name"] = ire_name
-            else:
-                ire_name = ""
-
-            tier=""
+    # Build the whole node table in one pass.  Rows keep the groupby("type") order (sorted by type,
+    # original order within a type) and dot_label is numbered per resource type.
+    resources = combined_group[combined_group["type"].notna()].sort_values("type", kind="stable")
+    resource_cnt = resources.groupby("type", sort=False, observed=True).cumcount() + 1
+    dot_types = resources["type"].str.split('/').str[-1]
+
+    if "Unique" in resources.columns:
+        unique_flags = resources["Unique"]
+    else:
+        unique_flags = pd.Series("N", index=resources.index)  # Default to "N" if column missing
 
-            '''
-            debug_msg(5, "debug_1:" + node_id + " " + row['as_Category'].lower())
-            if row['as_Category'].lower() == 'paas' and not dot_type == "networkinterfaces": 
-                tier='paas'
-                debug_msg(5, "debug_2:" + node_id + " " + row['as_Category'].lower())
-            else:
-                tier = None
-                debug_msg(5, "debug_3:" + node_id + " " + row['as_Category'].lower())
-            '''
+    is_unique = (unique_flags == "Y")
+    ire_names = pd.Series("", index=resources.index, dtype=object)
+    ire_names[is_unique] = unique_names(resources.loc[is_unique, "name"])["IRE Name"]
 
-            new_df_row = pd.DataFrame({'type': [dot_type], 'dot_label': [node_id], 'name': label, 'tier':tier, 'unique': unique_flag, 'unique_name': ire_name})
-            debug_msg(5, "0." + new_df_row)
-            node_df = node_df._append(new_df_row, ignore_index=True)
+    node_df = pd.DataFrame({
+        'type': dot_types.values,
+        'dot_label': (dot_types + "_" + resource_cnt.astype(str)).values,
+        'name': resources["name"].values,
+        'tier': "",
+        'parent': "",
+        'parent_name': "",
+        'parsed': "",
+        'unique': unique_flags.values,
+        'unique_name': ire_names.values,
+    }, dtype=object)
 
-            debug_msg(5, "1." + str((node_df["tier"] == "paas").sum()))
+    # IRE names are merged back into raw_data in one bulk update by update_ire_names
+    CG_internals.ire_names = dict(zip(resources.loc[is_unique, "name"], ire_names[is_unique]))
 
-            
-    node_df['parent'] = ""
-    node_df['parent_name'] = ""
-    node_df['parsed']= ""
+    debug_msg(5, lambda: f'build_node_df: {node_df}\n', subsystem="nodes")
 
     #rabbit MQ servers
     rabmq_list = ["mps2517","mps2518","mps2519","mps2520","mps2521"]
@@ -303,33 +813,39 @@ def build_node_df(combined_group: pd.DataFrame, raw_data: pd.DataFrame, dot_type
     "microsoft.web/sites": ('folder', 'gray', 'icons\\Function-Apps.svg', 0.35, 'bc', 'tc'),
     "microsoft.network/privateendpoints": ('folder', 'gray', 'icons\\Private-Endpoints.svg', 0.35, 'bc', 'tc')
     '''
-    node_df.loc[node_df['type'] == 'site', 'tier'] = 'app'
-    node_df.loc[(node_df['type'] == 'virtualmachines') & (~node_df['name'].str.contains('sql', na=False)), 'tier'] = 'web'
-    node_df.loc[(node_df['type'] == 'virtualmachines') & (node_df['name'].str.contains('sql', na=False)), 'tier'] = 'sql'
-    node_df.loc[(node_df['type'] == 'virtualmachines') & (node_df['name'].isin(rabmq_list)), 'tier'] = 'app'
-    node_df.loc[(node_df['type'] == 'sqlvirtualmachines'), 'tier'] = 'sql'
-    node_df.loc[(node_df['type'] == "loadbalancers") & (node_df['name'].str.contains('iis')), ['tier','parent']] = ['web', 'app_url']
-    node_df.loc[(node_df['type'] == "loadbalancers") & (node_df['name'].str.contains('rabmq')), 'tier'] = 'app'
-    node_df.loc[(node_df['type'] == "loadbalancers") & (node_df['name'].str.contains('cluster')), 'tier'] = 'sql'
-    node_df.loc[(node_df['type'] == 'networkinterfaces') & (~node_df['name'].str.contains('sql', na=False)), 'tier'] = 'web'
-    node_df.loc[(node_df['type'] == 'networkinterfaces') & (node_df['name'].str.contains('sql', na=False)), 'tier'] = 'sql'
-    node_df.loc[(node_df['type'] == 'networkinterfaces') & (node_df['name'].isin(rabmq_list)), 'tier'] = 'app'
-    node_df.loc[(node_df['type'] == 'databases') | (node_df['type'] == 'managedinstances'), 'tier'] = 'sql'
-    node_df.loc[(node_df['type'] == 'serverfarms'), 'tier'] = 'app'
-
-    node_df.loc[(node_df['type'] == 'privateendpoints') | 
-                (node_df['type'] == 'registries') |
-                (node_df['type'] == 'namespaces') |
-                (node_df['type'] == 'configurationstores') |
-                (node_df['type'] == 'vaults') |
-                (node_df['type'] == 'sites') |
-                (node_df['type'] == 'storageaccounts')
-                , 'tier'] = 'paas'
+    # The rules are applied in order (a later rule overrides an earlier one) to a numpy array,
+    # which is then stored in node_df in one assignment.
+    types = node_df['type'].to_numpy()
+    lbs = (types == "loadbalancers")
+    vms = (types == 'virtualmachines')
+    nics = (types == 'networkinterfaces')
+    sql_names = node_df['name'].str.contains('sql', na=False).to_numpy()
+    rabmq_names = node_df['name'].isin(rabmq_list).to_numpy()
+    lb_name_has = lambda s: node_df['name'].str.contains(s, na=False).to_numpy()
+
+    tier = np.full(len(node_df), "", dtype=object)
+    tier[types == 'site'] = 'app'
+    tier[vms & ~sql_names] = 'web'
+    tier[vms & sql_names] = 'sql'
+    tier[vms & rabmq_names] = 'app'
+    tier[types == 'sqlvirtualmachines'] = 'sql'
+    iis_lbs = lbs & lb_name_has('iis')
+    tier[iis_lbs] = 'web'
+    tier[lbs & lb_name_has('rabmq')] = 'app'
+    tier[lbs & lb_name_has('cluster')] = 'sql'
+    tier[nics & ~sql_names] = 'web'
+    tier[nics & sql_names] = 'sql'
+    tier[nics & rabmq_names] = 'app'
+    tier[(types == 'databases') | (types == 'managedinstances')] = 'sql'
+    tier[types == 'serverfarms'] = 'app'
+    tier[np.isin(types, ['privateendpoints', 'registries', 'namespaces', 'configurationstores', 'vaults', 'sites', 'storageaccounts'])] = 'paas'
 
     # Messy, but necessary.  If we don't find a tier for the LB put it in the Web 
-    node_df.loc[(node_df['type'] == "loadbalancers") & (node_df['tier']==""), 'tier'] = 'web'
+    tier[lbs & (tier == "")] = 'web'
+    node_df['tier'] = tier
+    node_df.loc[iis_lbs, 'parent'] = 'app_url'
     lb_df = lb_df = node_df[node_df['type'] == "loadbalancers"]
-    debug_msg(5, f'{inspect.currentframe().f_code.co_name}: {lb_df}\n' )
+    debug_msg(5, lambda: f'build_node_df: {lb_df}\n', subsystem="nodes")
 
 
 
@@ -337,183 +853,152 @@ def build_node_df(combined_group: pd.DataFrame, raw_data: pd.DataFrame, dot_type
     return node_df, all_cnt
 
 
-def process_nics(node_df: pd.DataFrame):
-    CG_internals.add(inspect.currentframe().f_code.co_name, "", "")
-    CG_internals.add(inspect.currentframe().f_code.co_name, "vm_details", "")
+# NIC names exported by Azure can carry a ".<guid>" suffix
+GUID_SUFFIX_PATTERN = re.compile(r'\.([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})$')
+
+
+@CG_internals.documented()
+def parse_nic_names(names: pd.Series) -> pd.Series:
+    """
+    Vectorized NIC name parsing, returns the VM name embedded in each NIC name.
+    The rules are evaluated in order, the first matching rule wins:
+        <vm>.nic...         -> <vm>
+        <vm>.<anything>     -> <vm>
+        nic-<vm>-...        -> <vm>
+        <vm>-nic-... / <vm>-x-iac  -> <vm>
+        <vm>xxx_z...        -> <vm>
+        <vm>-...            -> <vm>
+    """
+
+    dash_parts = names.str.split('-')
+    dash_cnt = dash_parts.str.len()
+    first, second, third = dash_parts.str[0], dash_parts.str[1], dash_parts.str[2]
+
+    parsed = first
+    parsed = parsed.mask(names.str.contains("_z", regex=False), names.str.split('_').str[0].str[:-3])
+    parsed = parsed.mask((dash_cnt >= 3) & ((third == "iac") | (second == "nic")), first)
+    parsed = parsed.mask((dash_cnt >= 3) & (first == "nic"), second)
+    parsed = parsed.mask(names.str.contains(".", regex=False), names.str.split('.', n=1).str[0])
+    parsed = parsed.mask(names.str.contains(".nic", regex=False), names.str.split(".nic", n=1, regex=False).str[0])
+    return parsed
+
+
+@CG_internals.documented("parse_nic_names")
+def process_nics(node_df: pd.DataFrame, names=None):
 
     # Iterate over NIC rows to find matches in VM rows
-    nic_df = node_df[node_df['type'] == "networkinterfaces"]
+    nic_mask = node_df['type'] == "networkinterfaces"
     vm_df = node_df[node_df['type'].isin(["virtualmachines", "sqlvirtualmachines"])]
 
     # If no NIC or VM data exists, return
-    if nic_df.empty or vm_df.empty: 
+    if not nic_mask.any() or vm_df.empty: 
         return
     
-    # Turn on tracing
-    if(CG_internals.name==CG_internals.debug_app): pdb.set_trace()
-
-    def update_name_if_guid(name: str) -> str:
-        guid_pattern = r'\.([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})$'
-        # Check if the name matches the GUID pattern at the end
-        debug_msg(4, f'inspect.currentframe().f_code.co_name - Checking for GUID in {name}')
-        if re.search(guid_pattern, name):
-            # Remove the GUID part from the name
-            cleaned_name = re.sub(guid_pattern, '', name)
-            debug_msg(4, f'inspect.currentframe().f_code.co_name - Removing for GUID in {cleaned_name}')
-            return cleaned_name
-        return name  # Return original name if no GUID is found
-
-    # Helper function for parsing NIC names
-    def parse_nic_name(name: str) -> str:   
-        if ".nic" in name:
-            return name.split(".nic")[0]
-        if "." in name:
-            return name.split('.')[0]  # Fallback
-        name_split = name.split('-')
-        if len(name_split) >= 3:
-            if name_split[0] == "nic":
-                return name_split[1]
-            if name_split[2] == "iac" or name_split[1] == "nic":
-                return name_split[0]
-        if "_z" in name:
-            return name.split('_')[0][:-3]
-        return name.split('-')[0]
-
-    # Apply the update_name_if_guid function to remove GUID if present, only for rows where type == "networkinterfaces"
-    node_df.loc[node_df['type'] == "networkinterfaces", 'name'] = node_df.loc[node_df['type'] == "networkinterfaces", 'name'].apply(update_name_if_guid)
-
-    # Apply the parsing logic to NICs, only for rows where type == "networkinterfaces"
-    node_df.loc[node_df['type'] == "networkinterfaces", 'parsed'] = node_df.loc[node_df['type'] == "networkinterfaces", 'name'].apply(parse_nic_name)
-
-
-    # Match NICs to Virtual Machines using the parsed names
-    nic_df = node_df[node_df['type'] == "networkinterfaces"]
-    nic_df = nic_df.merge(vm_df[['dot_label','name', 'tier']], left_on='parsed', right_on='name', how='left', suffixes=('', '_vm'))
-
-    # Update the tier for NICs based on the matching VM
-    # node_df.loc[node_df['type'] == "networkinterfaces", 'tier'] = nic_df['tier']
-
-    # Update the parent fields for NICs based on the matched VM
-    if not nic_df.empty:
-        try:
-            if 'tier_vm' in nic_df.columns:
-                matching_vms = nic_df[~nic_df['tier_vm'].isnull()]  # Filter rows with valid VM matches
-
-                for _, vm_row in matching_vms.iterrows():
-                    vm_dot_label = vm_row['dot_label_vm']
-                    vm_name = vm_row['name_vm']
-                    vm_tier = vm_row['tier_vm']
-                    nic_name = vm_row['name']
-                    debug_msg(5, f"{inspect.currentframe().f_code.co_name} Match found for NIC '{nic_name}', VM '{vm_name}', dot_label '{vm_dot_label}'.")
+    # Remove the GUID suffix if present, then parse the VM name out of the NIC name
+    node_df.loc[nic_mask, 'name'] = node_df.loc[nic_mask, 'name'].str.replace(GUID_SUFFIX_PATTERN, '', regex=True)
+    node_df.loc[nic_mask, 'parsed'] = parse_nic_names(node_df.loc[nic_mask, 'name'])
 
-                    # Build mask for rows to update
-                    mask = (node_df['type'] == 'networkinterfaces') & (node_df['parsed'] == vm_name)
-                    matched_rows = node_df[mask]
+    # Match NICs to Virtual Machines using the parsed names.  When several VMs share a name
+    # the last one wins, as it did when each match was written in turn.
+    try:
+        vm_keys = vm_df[vm_df['tier'].notna()].drop_duplicates(subset='name', keep='last').set_index('name')
+        nic_parents = node_df.loc[nic_mask, ['parsed']].join(vm_keys[['dot_label', 'tier']], on='parsed', how='inner')
 
-                    if matched_rows.empty:
-                        debug_msg(5, f"No match found in node_df for parsed NIC name '{vm_name}'. Skipping update.")
-                    else:
-                        debug_msg(5, f"Updating {len(matched_rows)} row(s) in node_df for NIC '{nic_name}' with parent '{vm_dot_label}'.")
-                        node_df.loc[mask, ['parent', 'parent_name', 'tier']] = vm_dot_label, vm_name, vm_tier
+        if not nic_parents.empty:
+            debug_msg(5, lambda: f"process_nics Matched {len(nic_parents)} NIC(s) to VMs:\n{nic_parents}", subsystem="nics")
+            node_df.loc[nic_parents.index, ['parent', 'parent_name', 'tier']] = nic_parents[['dot_label', 'parsed', 'tier']].values
 
-                debug_msg(3, f"{inspect.currentframe().f_code.co_name} Final NIC processing update:\n{node_df}")
+        debug_msg(3, lambda: f"process_nics Final NIC processing update:\n{node_df}", subsystem="nics")
 
-        except KeyError as e:
-            error_msg(inspect.currentframe().f_code.co_name, f"Error: Missing expected column in NIC to VM match - {e}")
-        except IndexError:
-            error_msg(inspect.currentframe().f_code.co_name, "Error: Attempted to access an index that does not exist in NIC to VM match.")
+    except KeyError as e:
+        error_msg(inspect.currentframe().f_code.co_name, f"Error: Missing expected column in NIC to VM match - {e}")
 
 
 #v04 change
-def process_vms(node_df):
-    CG_internals.add(inspect.currentframe().f_code.co_name, "", "")
+@CG_internals.documented()
+def process_vms(node_df, names=None):
 
     # Filter VMs and Load Balancers
     vm_df = node_df[(node_df['type'] == "virtualmachines") | (node_df['type'] == "sqlvirtualmachines")]
-    lb_df = node_df[node_df['type'] == "loadbalancers"]
+    lb_rows = (node_df['type'] == "loadbalancers").to_numpy()
+
+    if not vm_df.empty and lb_rows.any():
+        # Find the first load balancer whose name contains the last 6 characters of each VM name
+        if names is None:
+            names = SubstringIndex(node_df['name'])
+        lb_pos = [names.first_match(vm_name[-6:], lb_rows) for vm_name in vm_df['name']]
+        matched = [pos is not None for pos in lb_pos]
 
-    # Turn on tracing
-    #if(CG_internals.name==CG_internals.debug_app): pdb.set_trace()
+        if any(matched):
+            vm_match = vm_df[matched]
+            lb_match = node_df.iloc[[pos for pos in lb_pos if pos is not None]]
+            node_df.loc[vm_match.index, ['parent', 'parent_name']] = lb_match[['dot_label', 'name']].values
 
-    if not vm_df.empty and not lb_df.empty:
-        for vm_index, vm_row in vm_df.iterrows():
-            # Attempt to find a load balancer whose name contains the last 6 characters of the VM name
-            matching_lb = lb_df[lb_df['name'].apply(lambda lb_name: vm_row['name'][-6:] in lb_name if pd.notna(lb_name) else False)]
-            if not matching_lb.empty:
-                lb = matching_lb.iloc[0]
-                node_df.at[vm_index, 'parent'] = lb['dot_label']
-                node_df.at[vm_index, 'parent_name'] = lb['name']
-                node_df.loc[(node_df['type'] == "loadbalancers") & (node_df['name'] == lb['name']),'tier'] = node_df.at[vm_index, 'tier']
+            # Each load balancer takes the tier of the last VM matched to it
+            lb_tiers = pd.Series(vm_match['tier'].values, index=lb_match['name'].values)
+            lb_tiers = lb_tiers[~lb_tiers.index.duplicated(keep='last')]
+            lb_rows = (node_df['type'] == "loadbalancers") & (node_df['name'].isin(lb_tiers.index))
+            node_df.loc[lb_rows, 'tier'] = node_df.loc[lb_rows, 'name'].map(lb_tiers)
 
 
 
-def process_paas_resources(node_df):
+@CG_internals.documented()
+def process_paas_resources(node_df, names=None):
     
-    CG_internals.add(inspect.currentframe().f_code.co_name, "", "")
 
     # Get all non-NIC resources where tier is 'paas'
-    paas_df = node_df[(node_df['type'] != "networkinterfaces") & (node_df['tier'] == "paas")]
+    paas_rows = ((node_df['type'] != "networkinterfaces") & (node_df['tier'] == "paas")).to_numpy()
     nic_df = node_df[node_df['type'] == "networkinterfaces"]
 
-    if paas_df.empty or nic_df.empty:
+    if not paas_rows.any() or nic_df.empty:
         return
 
-    for nic_index, nic_row in nic_df.iterrows():
-        parsed = nic_row.get('parsed')
+    # Look for the first PaaS resource whose name contains each NIC's parsed value
+    if names is None:
+        names = SubstringIndex(node_df['name'])
+    nic_matches = {}
+    for nic_index, parsed in nic_df['parsed'].items():
         if pd.isna(parsed):
             continue
+        pos = names.first_match(parsed, paas_rows)
+        if pos is not None:
+            nic_matches[nic_index] = pos
 
-        # Look for a PaaS resource whose name contains this NIC's parsed value
-        matching_paas = paas_df[paas_df['name'].apply(
-            lambda name: parsed in name if pd.notna(name) else False
-        )]
+    if nic_matches:
+        paas = node_df.iloc[list(nic_matches.values())]
+        node_df.loc[list(nic_matches.keys()), ['parent', 'parent_name', 'tier']] = paas[['dot_label', 'name', 'tier']].values
 
-        if not matching_paas.empty:
-            paas = matching_paas.iloc[0]
-            node_df.at[nic_index, 'parent'] = paas['dot_label']
-            node_df.at[nic_index, 'parent_name'] = paas['name']
-            node_df.at[nic_index, 'tier'] = paas['tier']
 
-
-def process_lbs(node_df):
-    CG_internals.add(inspect.currentframe().f_code.co_name, "", "")
+@CG_internals.documented()
+def process_lbs(node_df, names=None):
     # Filter Load Balancers and VMs
     lb_df = node_df[node_df['type'] == "loadbalancers"]
     #vm_df = node_df[node_df['type'].isin(["virtualmachines", "sqlvirtualmachines"]) & node_df['parent']==""]
     vm_df = node_df[node_df['type'].isin(["virtualmachines", "sqlvirtualmachines"])]
 
-    debug_msg (3, f'{inspect.currentframe().f_code.co_name} Number of VMs with no parent: {len(vm_df)}\n{vm_df}')
-
-    # Turn on tracing
-    if(CG_internals.name==CG_internals.debug_app): pdb.set_trace()
+    debug_msg (3, lambda: f'process_lbs Number of VMs with no parent: {len(vm_df)}\n{vm_df}', subsystem="lbs")
 
     if not lb_df.empty and not vm_df.empty:
-        for _, lb_row in lb_df.iterrows():
-            lb_name = lb_row['name']
-            lb_tier = lb_row['tier']
-            lb_index = lb_row.name  # actual index in node_df
-            debug_msg(3,f'{inspect.currentframe().f_code.co_name}: Checking {lb_name}, {lb_tier}\n')
+        # Every VM is parented to the last load balancer in its tier.  A name with VM rows in
+        # several tiers takes whichever of those tiers' last load balancers comes last.
+        last_lb = lb_df[['dot_label', 'name', 'tier']].assign(lb_pos=range(len(lb_df)))
+        last_lb = last_lb.drop_duplicates(subset='tier', keep='last')
 
-            # Find all VMs with no parent that are in the same tier as the LB
-            matching_vms = vm_df[vm_df['tier']==lb_tier]
+        last_lb = last_lb[last_lb['tier'].notna()]
 
-            for _, vm_row in matching_vms.iterrows():
-                vm_name = vm_row['name']
-                vm_tier = vm_row['tier']
+        vm_lbs = vm_df[vm_df['name'].notna()][['name', 'tier']].merge(last_lb, on='tier', how='inner', suffixes=('', '_lb'))
+        if not vm_lbs.empty:
+            vm_lbs = vm_lbs.sort_values('lb_pos', kind='stable').drop_duplicates(subset='name', keep='last').set_index('name')
+            debug_msg(3, lambda: f'process_lbs: VM parents\n{vm_lbs}', subsystem="lbs")
 
-                # Set VM's parent and parent_name
-                node_df.loc[node_df['name'] == vm_name, ['parent', 'parent_name']] = lb_row['dot_label'], lb_row['name']
-                debug_msg(3, f'{inspect.currentframe().f_code.co_name}: Updated {vm_name} with parent: {lb_row["dot_label"]}')
-
-
-                # Set Load Balancer's tier to VM's tier
-                node_df.at[lb_index, 'tier'] = vm_tier
-                debug_msg(3, f'{inspect.currentframe().f_code.co_name}: Load Balancer Updated with {vm_name} - {vm_tier}')
+            vm_rows = node_df['name'].isin(vm_lbs.index)
+            node_df.loc[vm_rows, 'parent'] = node_df.loc[vm_rows, 'name'].map(vm_lbs['dot_label'])
+            node_df.loc[vm_rows, 'parent_name'] = node_df.loc[vm_rows, 'name'].map(vm_lbs['name_lb'])
     
 
 # depricated
+@CG_internals.documented()
 def assign_lb_tier(node_df):
-    CG_internals.add(inspect.currentframe().f_code.co_name,"","")
     #print("5.", (node_df["tier"] == "paas").sum())
     # Set NIC parents to the Web and SQL Load Balancers
     web_lb = node_df.loc[(node_df['type'] == 'loadbalancers') & (node_df['tier'] == 'web')]
@@ -540,29 +1025,37 @@ def assign_lb_tier(node_df):
         node_df.loc[(node_df['type'] == 'networkinterfaces') & (node_df['tier'] == 'app'),'parent'] = app_lb.iloc[0]['dot_label']
 
 
-def assign_tier_based_on_parent(node_df):
-    CG_internals.add(inspect.currentframe().f_code.co_name,"","")
+@CG_internals.documented()
+def assign_tier_based_on_parent(node_df, names=None):
     #print("6.", (node_df["tier"] == "paas").sum())
     # Find rows with no parent and no tier
     no_parent_df = node_df.loc[node_df['parent'].isna()]
-    paas_df = node_df.loc[node_df['tier'] == "paas"]
+    paas_rows = (node_df['tier'] == "paas").to_numpy()
     
     #print("7.", (node_df["tier"] == "paas").sum())
-    if not paas_df.empty and not no_parent_df.empty:
+    if paas_rows.any() and not no_parent_df.empty:
         #print(f'Looking for PaaS {len(pass_df)}, {len(no_parent_df)}\n')
-        for p_index, p_row in no_parent_df.iterrows():
-            name = p_row['name']
-            for index, row in paas_df.iterrows():
-                #print(f'Evaluate - Name: {name}, Match: {row['name']}\n')
-                if p_index != index and name in row['name']:
-                    node_df.loc[index, ['parent','parent_name']] = p_row['dot_label'],p_row['name']
-                    #print(f'Found - Name: {name}, Match: {row['name']}\n')
+        # Every PaaS resource whose name contains a parentless node's name takes that node as
+        # its parent, when several nodes match the last one wins
+        if names is None:
+            names = SubstringIndex(node_df['name'])
+        paas_parents = {}
+        for p_index, p_label, name in zip(no_parent_df.index, no_parent_df['dot_label'], no_parent_df['name']):
+            if pd.isna(name):
+                continue
+            for pos in names.matches(name, paas_rows):
+                if node_df.index[pos] != p_index:
+                    paas_parents[node_df.index[pos]] = (p_label, name)
+
+        if paas_parents:
+            node_df.loc[list(paas_parents.keys()), ['parent','parent_name']] = list(paas_parents.values())
     #print("8.", (node_df["tier"] == "paas").sum())
     node_df.loc[(node_df['type'].isna()),'tier'] = 'paas'
     #print("9.", (node_df["tier"] == "paas").sum())
     
 
 
+@CG_internals.documented(("application_tasks", "Split the rows by application"), ("process_application", "Create the diagram for one application"), ("merge_application_results", "Write .dot files and merge IRE names"), ("load_manifest", "Read the manifest of the previous run"), ("write_application_costs", "Write the application cost report"), ("save_manifest", "Write the manifest for the next run"), ("render_applications", "Render the .dot files with Graphviz"), ("add_dr_names", "Derive the DR names"), ("updateUniqueNamesXls", "Create unique_name.xls"), "check_for_critical_columns")
 def process_with_resource_lookup(file_path, raw_data_sheet, azure_services_sheet, shared_services_sheet, output_dir):
     """
     Processes the Excel file by merging RawData and ResourceLookup, filtering, and generating Graphviz files.
@@ -573,7 +1066,6 @@ def process_with_resource_lookup(file_path, raw_data_sheet, azure_services_sheet
         lookup_sheet (str): Name of the ResourceLookup sheet.
         output_dir (str): Directory to save the output Graphviz files.
         """
-    CG_internals.add(inspect.currentframe().f_code.co_name,"","")
     
     '''
     try:
@@ -594,142 +1086,467 @@ def process_with_resource_lookup(file_path, raw_data_sheet, azure_services_sheet
         error_msg(inspect.currentframe().f_code.co_name, f"Error reading Excel file: {e}")
         return
     '''
-    CG_internals.add(inspect.currentframe().f_code.co_name,"process_nics","Parse Nic names")
-    CG_internals.add(inspect.currentframe().f_code.co_name,"process_vms","Assign Nics to VMs")
-    CG_internals.add(inspect.currentframe().f_code.co_name,"process_paas_resources","Assign Nics to PaaS Services")
-    CG_internals.add(inspect.currentframe().f_code.co_name,"process_lbs","Assign VMs to LoadBalancers")
-    #CG_internals.add(inspect.currentframe().f_code.co_name,"assign_lb_tier","")
-    CG_internals.add(inspect.currentframe().f_code.co_name,"build_node_df","")
-    CG_internals.add(inspect.currentframe().f_code.co_name,"assign_tier_based_on_parent","")
-    CG_internals.add(inspect.currentframe().f_code.co_name,"create_graphvis_file","Create .dot files for each application")
-    CG_internals.add(inspect.currentframe().f_code.co_name,"updateUniqueNamesXls","Create unique_name.xls")
-    CG_internals.add(inspect.currentframe().f_code.co_name,"check_for_critical_columns","")
     
     # Check for required columns
     required_columns = ["AppName", "type", "Environment", "as_ResourceType", "as_Category", "xr_URL", "xr_SharedAppName"]
     check_for_critical_columns(required_columns, CG_internals.filtered_data)
 
-    debug_msg(2, f"The number of rows in the filtered dataset is: {CG_internals.filtered_data.shape[0]}")
+    debug_msg(2, "The number of rows in the filtered dataset is: %d", CG_internals.filtered_data.shape[0])
     # Sort the filtered data
-    sorted_data = CG_internals.filtered_data.sort_values(by=["AppName", "as_Category", "as_ResourceType", "name"])
+    with profile_stage("application_tasks", rows=len(CG_internals.filtered_data)) as counts:
+        sorted_data = CG_internals.filtered_data.sort_values(by=["AppName", "as_Category", "as_ResourceType", "name"])
 
-    # Main Loop - Look here Timur :-)
+        # Main Loop - Look here Timur :-)
+    
+        # Group by AppName and create Graphviz files, on a process pool when --jobs > 1.
+        # Applications whose inputs match the manifest keep their existing .dot file.
+        tasks = application_tasks(sorted_data, output_dir)
+        counts["apps"] = len(tasks)
+    manifest = load_manifest(output_dir)
+    app_hashes = {task[0]: application_hash(task[1], task[2], task[3]) for task in tasks}
+    changed = [task for task in tasks if application_changed(task[0], app_hashes[task[0]], task[4], manifest)]
+    changed_apps = {task[0] for task in changed}
+    ire_by_app = {}
+
+    # The application stages are in the report once per application, "applications" is the whole loop
+    with profile_stage("applications", apps=len(changed)):
+        if CG_internals.jobs > 1 and changed:
+            settings = (CG_internals.debug, CG_internals.debug_levels, CG_internals.log_json, CG_internals.debug_app, CG_internals.document, CG_internals.icon_dir,
+                        CG_internals.profile, CG_internals.profile_app)
+            with ProcessPoolExecutor(max_workers=CG_internals.jobs, initializer=init_worker, initargs=settings) as pool:
+                results = pool.map(process_application, *zip(*changed))
+                merge_application_results(with_unchanged_applications(tasks, changed_apps, results, manifest, ire_by_app))
+        else:
+            results = (process_application(*task) for task in changed)
+            merge_application_results(with_unchanged_applications(tasks, changed_apps, results, manifest, ire_by_app))
+
+    removed = remove_vanished_applications(output_dir, manifest, app_hashes)
+    costs = write_application_costs(output_dir, tasks, changed_apps, manifest)
+    save_manifest(output_dir, app_hashes, ire_by_app, costs)
+    debug_msg(0, 'Applications rebuilt: %d, skipped: %d, removed: %d', len(changed), len(tasks) - len(changed), removed, subsystem="manifest")
+
+    # Render the rebuilt applications, and unchanged ones missing a rendered file
+    if CG_internals.render_formats:
+        render_files = [task[4] for task in tasks
+                        if task[0] in changed_apps
+                        or any(not os.path.exists(f"{os.path.splitext(task[4])[0]}.{fmt}") for fmt in CG_internals.render_formats)]
+        with profile_stage("render", files=len(render_files)):
+            render_applications(render_files)
     
-    # Group by AppName and create Graphviz files
-    for app_name, group in sorted_data.groupby("AppName"):
-        CG_internals.name = app_name
-        debug_msg(1, f"\n******************\nBegin Processing Application: {app_name}")
+    uniqueXlsx_path = f"UniqueNames.{CG_internals.unique_format}"
+    with profile_stage("unique_names", rows=len(CG_internals.raw_data)):
+        add_dr_names(CG_internals.raw_data)
+        updateUniqueNamesXls(CG_internals.raw_data, uniqueXlsx_path,raw_data_sheet)
+    if CG_internals.document:
+        debug_msg(3, CG_internals.doc_df)   
+        CG_internals.write_documentation_dot()
+
+@CG_internals.documented()
+def application_tasks(sorted_data, output_dir):
+    """
+    Returns one (app_name, group, shared_rows, url, output_file) task per application.
+    Each task carries only the application's rows and its shared application's rows.
+
+    sorted_data is sorted by AppName, so each application is a contiguous block of rows.  The
+    blocks, each application's URL and the primary -> shared application map are computed once
+    and every lookup in the loop is a dictionary get.
+    """
+
+    # AppName -> (first, last + 1) row positions in sorted_data, in sorted order
+    app_positions = sorted(sorted_data.groupby("AppName", observed=True).indices.items(), key=lambda item: item[1][0])
+    app_slices = {app_name: (positions[0], positions[-1] + 1) for app_name, positions in app_positions}
+
+    # Application url from column URL, taken from the first row of each application
+    app_urls = {}
+    for app_name, (start, stop) in app_slices.items():
+        first_url = sorted_data['xr_URL'].iat[start] if 'xr_URL' in sorted_data.columns else None
+
+        # Check if the URL is NaN or empty
+        if pd.notna(first_url) and str(first_url).strip():
+            app_urls[app_name] = first_url  # Assign only if it is valid
+        else:
+            app_urls[app_name] = "https://*.mgroup.net"  # Default fallback
+
+    # Primary application -> shared application, from the first xref row of each primary
+    shared_apps = {}
+    if not CG_internals.shared_xref.empty and "xr_SharedAppName" in CG_internals.shared_xref.columns:
+        first_rows = CG_internals.shared_xref.drop_duplicates(subset="xr_PrimaryAppName", keep="first")
+        for primary_app, first_value in zip(first_rows["xr_PrimaryAppName"], first_rows["xr_SharedAppName"]):
+            if pd.notna(first_value) and str(first_value).strip():  # Ensure it's not NaN or empty
+                shared_apps[primary_app] = first_value
+
+    no_rows = sorted_data.iloc[0:0]
+
+    tasks = []
+    for app_name, (start, stop) in app_slices.items():
         output_file = os.path.join(output_dir, f"{app_name}.dot")
-        with open(output_file, "w") as CG_internals.output_file:
-            debug_msg(2, "Note: Creating output file:" + output_file)
-            dot_type = ""
-            url = ""
-
-            # Application url from column URL
-            if 'xr_URL' in group.columns:
-                first_url = group['xr_URL'].iloc[0]  # Attempt to fetch first URL value
-
-                # Check if the URL is NaN or empty
-                if pd.notna(first_url) and str(first_url).strip():
-                    url = first_url  # Assign only if it is valid
-                else:
-                    url = "https://*.mgroup.net"  # Default fallback
-            else:
-                url = "https://*.mgroup.net"  # Default fallback if 'URL' column is missing
+        group = sorted_data.iloc[start:stop]
 
-            
-            # Initialize shared_app_name to None
-            shared_app_name = None  # Default to None
-
-            # Check if shared_rows is not empty and contains 'xr_SharedAppName'
-            if not CG_internals.shared_xref.empty and "xr_SharedAppName" in CG_internals.shared_xref.columns:
-                # Match rows based on AppName and xr_PrimaryAppName
-                matched_rows = CG_internals.shared_xref[CG_internals.shared_xref["xr_PrimaryAppName"] == app_name]
-
-                # If there's a match and 'xr_SharedAppName' is not NaN or empty, assign the value
-                if not matched_rows.empty:
-                    first_value = matched_rows["xr_SharedAppName"].iloc[0]  # Get the first valid entry
-                    
-                    if pd.notna(first_value) and str(first_value).strip():  # Ensure it's not NaN or empty
-                        shared_app_name = first_value  # Assign the value
-
-            #Print the result
-            debug_msg(4, f"SharedAppName: {shared_app_name}")
-
-            # Include rows where 'name' matches 'SharedAppName'
-            shared_rows = sorted_data[sorted_data["AppName"] == shared_app_name]
-
-            combined_group = pd.concat([group, shared_rows], ignore_index=True)
-            combined_group = combined_group.groupby(["as_Category", "type", "name"], as_index=False).first()
-      
-            
-            # Create node_df with attributes for the Graphviz diagrams
-            node_df, nodes_cnt = build_node_df(combined_group, CG_internals.raw_data, dot_type)
-            #print(f'Nodes add: {nodes_cnt}')
+        shared_app_name = shared_apps.get(app_name)
+        debug_msg(4, "SharedAppName: %s", shared_app_name)
 
-            lb_df = node_df[node_df['type'] == "loadbalancers"]
-            if(app_name==CG_internals.debug_app): debug_msg(1,f'Step 1: {lb_df}\n')
-            process_vms(node_df)
-            
-            lb_df = node_df[node_df['type'] == "loadbalancers"]
-            if(app_name==CG_internals.debug_app): debug_msg(1,f'Step 2: {lb_df}\n')
-            process_nics(node_df)  
-
-            lb_df = node_df[node_df['type'] == "loadbalancers"]
-            if(app_name==CG_internals.debug_app): debug_msg(1,f'Step 3: {lb_df}\n')
-            process_paas_resources(node_df)
-
-            lb_df = node_df[node_df['type'] == "loadbalancers"]
-            if(app_name==CG_internals.debug_app): debug_msg(1,f'Step 4: {lb_df}\n')
-            process_lbs(node_df)
-
-            #assign_lb_tier(node_df)
-            lb_df = node_df[node_df['type'] == "loadbalancers"]
-            if(app_name==CG_internals.debug_app): debug_msg(1,f'Step 5: {lb_df}\n')
-            assign_tier_based_on_parent(node_df)
-                                                                                                                           
-            #print("Tail", node_df[['type', 'name', 'dot_label', 'tier', 'parent','parsed']].to_string(index=False), "\n")
-            
+        # Include the shared application's rows
+        if shared_app_name in app_slices:
+            shared_start, shared_stop = app_slices[shared_app_name]
+            shared_rows = sorted_data.iloc[shared_start:shared_stop]
+        else:
+            shared_rows = no_rows
 
-            create_graphvis_file(app_name, url, node_df, combined_group)
-            # create_runbook_doc(app_name)                      Put this in the backlog
-            #create_diagram_graphs(app_name , node_df)          Put this in the backlog
-            if(app_name==CG_internals.debug_app): debug_msg(1, f'{node_df}\n') 
-            
-            debug_msg(1, f'{node_df}\n') 
+        tasks.append((app_name, group, shared_rows, app_urls[app_name], output_file))
+
+    return tasks
+
+
+def init_worker(debug, debug_levels, log_json, debug_app, document, icon_dir, profile, profile_app):
+    """
+    Process pool initializer, copies the run settings into the worker's CG_internals.
+    """
+    CG_internals.debug = debug
+    CG_internals.debug_levels = debug_levels
+    CG_internals.log_json = log_json
+    CG_internals.debug_app = debug_app
+    CG_internals.document = document
+    CG_internals.icon_dir = icon_dir
+    CG_internals.profile = profile
+    CG_internals.profile_app = profile_app
+    if profile:
+        tracemalloc.start()
+
+
+def combine_application_rows(group, shared_rows):
+    """
+    One row per resource (as_Category, type, name) of the application and its shared application.
+    """
+    combined_group = pd.concat([group, shared_rows], ignore_index=True)
+    return combined_group.groupby(["as_Category", "type", "name"], as_index=False, observed=True).first()
+
+
+# The passes over an application's node table, in the order process_application runs them.  Each is
+# called as stage(node_df, names), names being the SubstringIndex of the application's node names,
+# built once per application (process_nics and process_lbs do not search names and ignore it).
+NODE_STAGES = (process_vms, process_nics, process_paas_resources, process_lbs, assign_tier_based_on_parent)
+APPLICATION_STAGES = ["group", "build_node_df"] + [stage.__name__ for stage in NODE_STAGES] + ["create_graphvis_file"]
+
+@CG_internals.documented("combine_application_rows", ("process_nics", "Parse Nic names"), ("process_vms", "Assign Nics to VMs"), ("process_paas_resources", "Assign Nics to PaaS Services"), ("process_lbs", "Assign VMs to LoadBalancers"), "build_node_df", "assign_tier_based_on_parent", ("create_graphvis_file", "Create .dot files for each application"))
+def process_application(app_name, group, shared_rows, url, output_file):
+    """
+    Builds the diagram for one application.  Runs in the main process, or in a pool worker for --jobs > 1.
+
+    Returns:
+        (output file, dot text, IRE names for update_ire_names, stage records)
+    """
+
+    CG_internals.name = app_name
+    debug_msg(1, "\n******************\nBegin Processing Application: %s", app_name)
+    debug_msg(2, "Note: Creating output file:%s", output_file)
+
+    # --profile-app runs this application under cProfile
+    profiler = cProfile.Profile() if app_name == CG_internals.profile_app else None
+    if profiler:
+        profiler.enable()
+    first_record = len(CG_internals.stage_records)
+
+    # The DOT text is collected in memory and written by the main process
+    dot = DotBuilder(output_file)
+    dot_type = ""
+
+    with profile_stage("group", app_name, rows=len(group), shared_rows=len(shared_rows)) as counts:
+        combined_group = combine_application_rows(group, shared_rows)
+        counts["resources"] = len(combined_group)
+  
     
-    uniqueXlsx_path = "UniqueNames.xlsx"
-    debug_msg(3,CG_internals.doc_df)   
-    updateUniqueNamesXls(CG_internals.raw_data, uniqueXlsx_path,raw_data_sheet)
-    CG_internals.write_documentation_dot()
+    # Create node_df with attributes for the Graphviz diagrams
+    with profile_stage("build_node_df", app_name, rows=len(combined_group)) as counts:
+        node_df, nodes_cnt = build_node_df(combined_group, CG_internals.raw_data, dot_type)
+        counts["nodes"] = len(node_df)
+        counts["types"] = {node_type: int(count) for node_type, count in node_df["type"].value_counts().items()}
+    #print(f'Nodes add: {nodes_cnt}')
+
+    nodes = len(node_df)
+    names = SubstringIndex(node_df['name'])
+    for step, stage in enumerate(NODE_STAGES, start=1):
+        if(app_name==CG_internals.debug_app): debug_msg(1, lambda: f'Step {step}: {node_df[node_df["type"] == "loadbalancers"]}\n')
+        with profile_stage(stage.__name__, app_name, nodes=nodes):
+            stage(node_df, names)
+                                                                                                                   
+    #print("Tail", node_df[['type', 'name', 'dot_label', 'tier', 'parent','parsed']].to_string(index=False), "\n")
+    
+
+    with profile_stage("create_graphvis_file", app_name, nodes=nodes) as counts:
+        create_graphvis_file(dot, app_name, url, node_df, combined_group)
+        dot_text = dot.text()
+        counts["dot_bytes"] = len(dot_text)
+    # create_runbook_doc(app_name)                      Put this in the backlog
+    #create_diagram_graphs(app_name , node_df)          Put this in the backlog
+    if(app_name==CG_internals.debug_app): debug_msg(1, lambda: f'{node_df}\n') 
+    
+    debug_msg(3, lambda: f'{node_df}\n', subsystem="nodes") 
+
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(app_profile_file(app_name))
+        debug_msg(0, 'cProfile of %s written to %s', app_name, app_profile_file(app_name), subsystem="profile")
+
+    # This application's stage records travel with its result, merge_application_results collects them in order
+    stage_records = CG_internals.stage_records[first_record:]
+    del CG_internals.stage_records[first_record:]
+
+    return output_file, dot_text, CG_internals.ire_names, stage_records
+
+
+@CG_internals.documented(("update_ire_names", "Merge IRE names into raw_data"))
+def merge_application_results(results):
+    """
+    Writes each application's .dot file and merges its IRE names into raw_data, in application
+    order, so the output does not depend on the number of jobs.  A dot text of None keeps the
+    existing file (unchanged application).  The applications' --profile records are collected the same way.
+    """
+
+    for output_file, dot_text, ire_map, stage_records in results:
+        if dot_text is not None:
+            with open(output_file, "w") as f:
+                f.write(dot_text)
+        update_ire_names(ire_map)
+        CG_internals.stage_records.extend(stage_records)
+
+
+#******************************************************************************
+# Incremental regeneration
+# graphviz_output/manifest.json records a hash of each application's input rows
+# and the IRE names it produced, so unchanged applications are not regenerated.
+#******************************************************************************
+MANIFEST_FILE = "manifest.json"
+
+def script_hash():
+    """
+    Hash of this script, a change to the code invalidates every application in the manifest.
+    """
+    with open(os.path.abspath(__file__), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+@CG_internals.documented()
+def application_hash(group, shared_rows, url):
+    """
+    Content hash of an application's inputs: its rows (including the AzureServices lookup
+    columns merged onto them), its shared application's rows, its URL and the icon directory.
+    """
+
+    sha = hashlib.sha256()
+    for df in (group, shared_rows):
+        sha.update("\x1f".join(map(str, df.columns)).encode())
+        sha.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    sha.update(str(url).encode())
+    sha.update(CG_internals.icon_dir.encode())
+    return sha.hexdigest()
+
+
+@CG_internals.documented(("cleanup_existing_files", "Remove existing .dot files"))
+def load_manifest(output_dir):
+    """
+    Returns the manifest of the previous run.  Without a usable manifest (first run or
+    --full-rebuild) the existing output is removed and every application is rebuilt.
+    """
+
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    manifest = {"code": "", "apps": {}}
+
+    if not CG_internals.full_rebuild and os.path.exists(manifest_path):
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            error_msg(inspect.currentframe().f_code.co_name, f"Ignoring unreadable manifest {manifest_path}: {e}")
+
+    if manifest["code"] != script_hash():
+        if manifest["apps"]:
+            debug_msg(1, '%s has changed since the last run, rebuilding all applications', os.path.basename(__file__), subsystem="manifest")
+        cleanup_existing_files(output_dir, [".dot", ".png"])
+        manifest = {"code": "", "apps": {}}
+
+    return manifest
+
+
+@CG_internals.documented()
+def application_changed(app_name, app_hash, output_file, manifest):
+
+    entry = manifest["apps"].get(app_name)
+    return entry is None or entry["hash"] != app_hash or not os.path.exists(output_file)
+
+
+def with_unchanged_applications(tasks, changed_apps, results, manifest, ire_by_app):
+    """
+    Yields a result for every application in order: the new result for rebuilt applications and
+    the IRE names from the manifest (with no dot text) for unchanged ones.  The IRE names of
+    every application are collected into ire_by_app for the next manifest.
+    """
+    results = iter(results)
+    for app_name, group, shared_rows, url, output_file in tasks:
+        if app_name in changed_apps:
+            result = next(results)
+        else:
+            debug_msg(2, "Unchanged, skipping application: %s", app_name, subsystem="manifest")
+            result = (output_file, None, manifest["apps"][app_name]["ire_names"], [])
+        ire_by_app[app_name] = result[2]
+        yield result
+
+
+@CG_internals.documented()
+def remove_vanished_applications(output_dir, manifest, app_hashes):
+    """
+    Deletes the output of applications that are in the manifest but no longer in the export.
+    Returns the number of applications removed.
+    """
+
+    removed = 0
+    for app_name in manifest["apps"]:
+        if app_name in app_hashes:
+            continue
+        removed += 1
+        debug_msg(1, "Removing application no longer in the export: %s", app_name, subsystem="manifest")
+        for ext in [".dot", ".png", ".svg"]:
+            app_file = os.path.join(output_dir, f"{app_name}{ext}")
+            if os.path.exists(app_file):
+                os.remove(app_file)
+    return removed
+
+
+@CG_internals.documented()
+def save_manifest(output_dir, app_hashes, ire_by_app, costs):
+
+    manifest = {
+        "code": script_hash(),
+        "apps": {app_name: {"hash": app_hash, "ire_names": ire_by_app.get(app_name, {}), "cost": costs.get(app_name)} for app_name, app_hash in app_hashes.items()},
+    }
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+#******************************************************************************
+# Render stage
+# Graphviz is run over the .dot files on a bounded thread pool, each render is a
+# separate Graphviz process.  A render that times out or fails is retried once
+# with the fallback engine, so one pathological application cannot hang the batch.
+# Renders go through render_cache, an unchanged .dot file is not laid out again.
+#******************************************************************************
+@CG_internals.documented("render_cache.render")
+def render_dot_file(dot_file, formats):
+    """
+    Renders one .dot file to each format next to it.
+
+    Returns:
+        (dot_file, [(format, engine or None if every engine failed, seconds, message, cache hit)])
+    """
+
+    with open(dot_file, "rb") as f:
+        dot_source = f.read()
+
+    engines = [CG_internals.render_engine]
+    if CG_internals.render_fallback and CG_internals.render_fallback != CG_internals.render_engine:
+        engines.append(CG_internals.render_fallback)
+
+    renders = []
+    for fmt in formats:
+        out_file = f"{os.path.splitext(dot_file)[0]}.{fmt}"
+        start = time.perf_counter()
+        used_engine, messages, hit = None, [], False
+        for engine in engines:
+            try:
+                hit = render_cache.render(dot_source, engine, fmt, out_file, timeout=CG_internals.render_timeout, cache_dir=CG_internals.render_cache_dir)
+                used_engine = engine
+                break
+            except subprocess.TimeoutExpired:
+                messages.append(f"{engine} timed out after {CG_internals.render_timeout}s")
+            except subprocess.CalledProcessError as e:
+                messages.append(f"{engine} failed: {e.stderr.decode(errors='replace').strip()}")
+            except OSError as e:
+                messages.append(f"{engine} could not be run: {e}")
+        renders.append((fmt, used_engine, time.perf_counter() - start, "; ".join(messages), hit))
+
+    return dot_file, renders
+
+
+@CG_internals.documented("render_dot_file", "render_cache.evict")
+def render_applications(dot_files):
+    """
+    Renders the .dot files to CG_internals.render_formats on CG_internals.render_jobs concurrent
+    Graphviz processes and logs the render time of each application and a summary.
+    """
+
+    if not dot_files:
+        return
+    if not shutil.which(CG_internals.render_engine):
+        error_msg(inspect.currentframe().f_code.co_name, f"Graphviz '{CG_internals.render_engine}' was not found on the PATH, skipping the render stage")
+        return
+
+    formats = CG_internals.render_formats
+    start = time.perf_counter()
+    app_seconds = []
+    failed = 0
+    hits = 0
+
+    with ThreadPoolExecutor(max_workers=CG_internals.render_jobs) as pool:
+        for dot_file, renders in pool.map(lambda dot_file: render_dot_file(dot_file, formats), dot_files):
+            app_name = os.path.splitext(os.path.basename(dot_file))[0]
+            seconds = sum(render[2] for render in renders)
+            app_seconds.append((seconds, app_name))
+
+            for fmt, engine, _, message, hit in renders:
+                hits += hit
+                if engine is None:
+                    failed += 1
+                    error_msg(inspect.currentframe().f_code.co_name, f"Render of {app_name} to {fmt} failed: {message}")
+                elif message:
+                    debug_msg(1, "%s: %s, rendered with %s", app_name, message, engine, subsystem="render")
+
+            debug_msg(1, "Rendered %s (%s) in %.2fs", app_name, ", ".join(f"{fmt}: {engine or 'failed'}{' (cached)' if hit else ''}" for fmt, engine, _, _, hit in renders), seconds, subsystem="render")
+
+    slowest = ", ".join(f"{app_name} {seconds:.2f}s" for seconds, app_name in sorted(app_seconds, reverse=True)[:5])
+    debug_msg(0, 'Rendered %d applications to %s in %.2fs on %d jobs, %d from the render cache, %d renders failed.  Slowest: %s',
+              len(dot_files), ",".join(formats), time.perf_counter() - start, CG_internals.render_jobs, hits, failed, slowest, subsystem="render")
+
+    removed, removed_bytes = render_cache.evict(CG_internals.render_cache_dir, CG_internals.render_cache_size)
+    if removed:
+        debug_msg(1, 'Evicted %d renders (%.1f MB) from %s', removed, removed_bytes / (1024 * 1024), CG_internals.render_cache_dir, subsystem="render")
+
+
+def icon_path(file_name):
+    """
+    Path of a node icon for the DOT image attribute.  Without --icon-dir this is the Windows
+    relative path icons\\<file_name>, with it the icon in that directory using / separators,
+    which Graphviz accepts on Windows and Linux.
+    """
+    if not CG_internals.icon_dir:
+        return f"icons\\{file_name}"
+    return os.path.join(CG_internals.icon_dir, file_name).replace("\\", "/")
+
 
 #******************************************************************************
 # Function: create_graphvis_file
 # Purpose: Create the .dot file for a graphvis diagram
-# Calls: dot_write
+# Calls: DotBuilder.write
 #******************************************************************************
-def create_graphvis_file(app_name: str, url: str, node_df: pd, group: pd):
-    CG_internals.add(inspect.currentframe().f_code.co_name,"","")
-    CG_internals.add(inspect.currentframe().f_code.co_name,"create_cluster","Create .dot cluster for Web, App, DB and PaaS")
-    CG_internals.add(inspect.currentframe().f_code.co_name,"dot_write","")
-    f = CG_internals.output_file
+@CG_internals.documented(("create_cluster", "Create .dot cluster for Web, App, DB and PaaS"), "DotBuilder.write")
+def create_graphvis_file(dot: DotBuilder, app_name: str, url: str, node_df: pd, group: pd):
 
     resource_styles = {
-        "microsoft.compute/virtualmachines": ('box3d', 'lightblue', 'icons\\VM-Images-l.svg', 0.35, 'bc', 'tc'),
-        "microsoft.sqlvirtualmachine/sqlvirtualmachines": ('box3d', 'lightblue', 'icons\\Sql-Server.svg', 0.35, 'bc', 'tc'),
-        "microsoft.network/networkinterfaces": ('component', 'lightyellow', 'icons\\Network-Interfaces-l.svg', 0.35, 'bc', 'tc'),
-        "microsoft.network/loadbalancers": ('Mdiamond', 'lawngreen', 'icons\\Load-Balancers-l.svg', 0.35, 'bc', 'tc'),
-        "microsoft.web/serverfarms": ('box', 'gray', 'icons\\Server-Farm.svg', 0.35, 'bc', 'tc'),
-        "microsoft.storage/storageaccounts": ('folder', 'gray', 'icons\\Storage-Accounts.svg', 0.35, 'bc', 'tc'),
-        "microsoft.sql/managedinstances/databases": ('folder', 'gray', 'icons\\Managed-Database.svg', 0.35, 'bc', 'tc'),
-        "microsoft.sql/managedinstances": ('folder', 'gray', 'icons\\SQL-Managed-Instance.svg', 0.35, 'bc', 'tc'),
-        "microsoft.keyvault/vaults": ('folder', 'gray', 'icons\\Key-Vaults.svg', 0.35, 'bc', 'tc'),
-        "microsoft.appconfiguration/configurationstores": ('folder', 'gray', 'icons\\App-Configuration.svg', 0.35, 'bc', 'tc'),
-        "microsoft.cache/redis": ('folder', 'gray', 'icons\\Cache-Redis.svg', 0.35, 'bc', 'tc'),
-        "microsoft.servicebus/namespaces": ('folder', 'gray', 'icons\\Notification-Hub-Namespaces.svg', 0.35, 'bc', 'tc'),
-        "microsoft.containerregistry/registries": ('folder', 'gray', 'icons\\Container-Registries.svg', 0.35, 'bc', 'tc'),
-        "microsoft.web/sites": ('folder', 'gray', 'icons\\Function-Apps.svg', 0.35, 'bc', 'tc'),
-        "microsoft.network/privateendpoints": ('folder', 'gray', 'icons\\Private-Endpoints.svg', 0.35, 'bc', 'tc')
+        "microsoft.compute/virtualmachines": ('box3d', 'lightblue', icon_path('VM-Images-l.svg'), 0.35, 'bc', 'tc'),
+        "microsoft.sqlvirtualmachine/sqlvirtualmachines": ('box3d', 'lightblue', icon_path('Sql-Server.svg'), 0.35, 'bc', 'tc'),
+        "microsoft.network/networkinterfaces": ('component', 'lightyellow', icon_path('Network-Interfaces-l.svg'), 0.35, 'bc', 'tc'),
+        "microsoft.network/loadbalancers": ('Mdiamond', 'lawngreen', icon_path('Load-Balancers-l.svg'), 0.35, 'bc', 'tc'),
+        "microsoft.web/serverfarms": ('box', 'gray', icon_path('Server-Farm.svg'), 0.35, 'bc', 'tc'),
+        "microsoft.storage/storageaccounts": ('folder', 'gray', icon_path('Storage-Accounts.svg'), 0.35, 'bc', 'tc'),
+        "microsoft.sql/managedinstances/databases": ('folder', 'gray', icon_path('Managed-Database.svg'), 0.35, 'bc', 'tc'),
+        "microsoft.sql/managedinstances": ('folder', 'gray', icon_path('SQL-Managed-Instance.svg'), 0.35, 'bc', 'tc'),
+        "microsoft.keyvault/vaults": ('folder', 'gray', icon_path('Key-Vaults.svg'), 0.35, 'bc', 'tc'),
+        "microsoft.appconfiguration/configurationstores": ('folder', 'gray', icon_path('App-Configuration.svg'), 0.35, 'bc', 'tc'),
+        "microsoft.cache/redis": ('folder', 'gray', icon_path('Cache-Redis.svg'), 0.35, 'bc', 'tc'),
+        "microsoft.servicebus/namespaces": ('folder', 'gray', icon_path('Notification-Hub-Namespaces.svg'), 0.35, 'bc', 'tc'),
+        "microsoft.containerregistry/registries": ('folder', 'gray', icon_path('Container-Registries.svg'), 0.35, 'bc', 'tc'),
+        "microsoft.web/sites": ('folder', 'gray', icon_path('Function-Apps.svg'), 0.35, 'bc', 'tc'),
+        "microsoft.network/privateendpoints": ('folder', 'gray', icon_path('Private-Endpoints.svg'), 0.35, 'bc', 'tc')
     }
 
     url_df = node_df[node_df['tier'] == "app_url"]
@@ -749,61 +1566,66 @@ def create_graphvis_file(app_name: str, url: str, node_df: pd, group: pd):
     default_shape, default_color, default_image = 'box', 'gray', '',  
     default_margin, default_labelloc, default_imagepos = 0.00, 'mc', 'tc'
 
-    dot_write(f'digraph "{app_name}" {{')
-    dot_write(f'\t# Produced by: {os.path.basename(__file__)}')
-    dot_write('\tcompound=true;\n    style=filled;')
-    dot_write('\trankdir=TB;')
-    dot_write('\tcolor=deepskyblue; fillcolor=lightskyblue;')
+    dot.write(f'digraph "{app_name}" {{')
+    dot.write(f'\t# Produced by: {os.path.basename(__file__)}')
+    dot.write('\tcompound=true;\n    style=filled;')
+    dot.write('\trankdir=TB;')
+    dot.write('\tcolor=deepskyblue; fillcolor=lightskyblue;')
 
     # **Spacing & Layout Improvements**
-    dot_write('\tranksep=2.0;    # Increases vertical separation')
-    dot_write('\tnodesep=1.5;    # Increases horizontal spacing')
-    dot_write('\toverlap=false;  # Prevents nodes from overlapping')
-    dot_write('\tsplines=true;    # Enables smoother edge routing')
-    dot_write('\tpackmode="clust"; # Helps in spreading clusters evenly')
+    dot.write('\tranksep=2.0;    # Increases vertical separation')
+    dot.write('\tnodesep=1.5;    # Increases horizontal spacing')
+    dot.write('\toverlap=false;  # Prevents nodes from overlapping')
+    dot.write('\tsplines=true;    # Enables smoother edge routing')
+    dot.write('\tpackmode="clust"; # Helps in spreading clusters evenly')
 
-    dot_write(f'\tlabel="{app_name}";\n    labelloc=t;\n')
+    dot.write(f'\tlabel="{app_name}";\n    labelloc=t;\n')
 
     # **Define Node Styles**
-    for resource_type, resources in group.groupby("type"):
+    hidden_nodes = []       # commented out in the diagram, their tier and parent are cleared below
+    for resource_type, resources in group.groupby("type", observed=True):
         dot_type = resource_type.split('/')[-1]
 
         shape, color, image, margin, labelloc, imagepos = resource_styles.get(
             resource_type, (default_shape, default_color, default_image, default_margin, default_labelloc, default_imagepos)
         )
         #print(f'Images: {resource_type}, {image}')
-        dot_write(f"\n\t/* Resource Type: {resource_type} */")
+        dot.write(f"\n\t/* Resource Type: {resource_type} */")
 
-        dot_write(f'\tnode [shape={shape} style=filled fillcolor={color} '
+        dot.write(f'\tnode [shape={shape} style=filled fillcolor={color} '
                   f'labelloc={labelloc} margin={margin} '
                   f'imagepos={imagepos} image="{image}"];')
         type_df = node_df[node_df['type']==dot_type]
 
         for index, row in type_df.iterrows():  
             if dot_type == "virtualmachines" and isinstance(row['name'], str) and "sql" in row['name'].lower():
-                dot_write(f'\t#"{row["dot_label"]}" [label="{row["name"]}"];')
-                node_df.loc[index, ['tier','parent','parent_name']] = "","",""
+                dot.write(f'\t#"{row["dot_label"]}" [label="{row["name"]}"];')
+                hidden_nodes.append(index)
             elif dot_type == "networkinterfaces":
                 # Ensure 'parent' is not empty or None for network interfaces
                 if pd.notna(row['parent']) and row['parent'] != "":
-                    dot_write(f'\t{row["dot_label"]} [label="{row["name"]}"];')
+                    dot.write(f'\t{row["dot_label"]} [label="{row["name"]}"];')
                 else:
-                    dot_write(f'\t#"{row["dot_label"]}" [label="{row["name"]}"];') 
-                    node_df.loc[index, ['tier','parent','parent_name']] = "","",""
+                    dot.write(f'\t#"{row["dot_label"]}" [label="{row["name"]}"];') 
+                    hidden_nodes.append(index)
             elif row['type'] == dot_type:
-                dot_write(f'\t{row["dot_label"]} [label="{row["name"]}"];')  
+                dot.write(f'\t{row["dot_label"]} [label="{row["name"]}"];')  
+
+    if hidden_nodes:
+        node_df.loc[hidden_nodes, ['tier','parent','parent_name']] = "","",""
 
     # **Edge Connections**
-    dot_write("\t/******************************************************/")
-    dot_write("\t/*    Edge Connectors between Clusters                */")
-    dot_write("\t/******************************************************/")
-    dot_write("\t/* app_url to web loadbalancers */")
+    dot.write("\t/******************************************************/")
+    dot.write("\t/*    Edge Connectors between Clusters                */")
+    dot.write("\t/******************************************************/")
+    dot.write("\t/* app_url to web loadbalancers */")
 
     app_url = url if len(url) > 0 else "https:*.mgroup.net"
 
-    dot_write(f"\t#Web site URL")
-    dot_write(f'\tapp_url [label="{app_url}" shape=none margin=0.50 image="icons\\Website-Power.svg" labelloc=bc];')
-    dot_write(f"\t#Web site to Web Load Balancers")
+    dot.write(f"\t#Web site URL")
+    url_icon = icon_path('Website-Power.svg')
+    dot.write(f'\tapp_url [label="{app_url}" shape=none margin=0.50 image="{url_icon}" labelloc=bc];')
+    dot.write(f"\t#Web site to Web Load Balancers")
 
     lb_df = web_df[(web_df['type'] == "loadbalancers")]
    
@@ -812,15 +1634,15 @@ def create_graphvis_file(app_name: str, url: str, node_df: pd, group: pd):
     #    if not lb_df.empty:
     #        dot_write(f"\t\tapp_url -> {lb_df.iloc[0]['dot_label']};\t\t/* {app_url} -> {lb_df.iloc[0]['name']} {lb_df.iloc[0]['tier']}*/")
     #    else:
-    dot_write(f'\t\tapp_url -> Web_top;\t\t/* {app_url} */')
+    dot.write(f'\t\tapp_url -> Web_top;\t\t/* {app_url} */')
 
     if not sql_df.empty:
-        dot_write(f'\tWeb_bottom -> Sql_top [ltail=cluster01, lhead=cluster03, image=""]')
+        dot.write(f'\tWeb_bottom -> Sql_top [ltail=cluster01, lhead=cluster03, image=""]')
     if not app_df.empty:
-        dot_write(f'\tWeb_bottom -> App_top [ltail=cluster01, lhead=cluster02, image=""]')
-        dot_write(f'\tApp_bottom -> Paas_top [ltail=cluster02, lhead=cluster04, image=""]')
+        dot.write(f'\tWeb_bottom -> App_top [ltail=cluster01, lhead=cluster02, image=""]')
+        dot.write(f'\tApp_bottom -> Paas_top [ltail=cluster02, lhead=cluster04, image=""]')
     else:
-        dot_write(f'\tWeb_bottom -> Paas_top [ltail=cluster01, lhead=cluster04, image=""]')
+        dot.write(f'\tWeb_bottom -> Paas_top [ltail=cluster01, lhead=cluster04, image=""]')
         
 
     # Loop through the dictionary and create clusters only if the tier exists in node_df
@@ -830,22 +1652,15 @@ def create_graphvis_file(app_name: str, url: str, node_df: pd, group: pd):
         # If tier is None, we assume it's a general category (e.g., PaaS) and always process it
         if not config['filtered_df'].empty:
             #create_cluster(config['filtered_df'], cluster_id, config["node_type"], tier, f)
-            create_cluster(cluster_id, config)
+            create_cluster(dot, cluster_id, config)
 
-    dot_write("}")
+    dot.write("}")
 
-    debug_msg(1, f"Generated Graphviz file: {f.name}") 
+    debug_msg(1, "Generated Graphviz file: %s", dot.name, subsystem="dot") 
 
 
-def dot_write(str: str):
-    CG_internals.add(inspect.currentframe().f_code.co_name,"","")
-    dot_file = CG_internals.output_file
-
-    dot_file.write(f'{str}\n')
-
+@CG_internals.documented("find_loadbalancer_tier")
 def create_diagram_graphs(app_name: str, node_df: pd):
-    CG_internals.add(inspect.currentframe().f_code.co_name,"","")
-    CG_internals.add(inspect.currentframe().f_code.co_name,"find_loadbalancer_tier")
     # Diagrams library
     from diagrams import Diagram
     from diagrams.azure.compute import VM, ContainerRegistries 
@@ -961,10 +1776,8 @@ def create_diagram_graphs(app_name: str, node_df: pd):
     import subprocess
     subprocess.run(["dot", "-Tsvg", f"{app_name}.dot", "-o", f"debug_{app_name}.svg"])
 
-def create_cluster(cluster_id, config):
-    CG_internals.add(inspect.currentframe().f_code.co_name,"","")
-    CG_internals.add(inspect.currentframe().f_code.co_name,"dot_write","")
-    CG_internals.add(inspect.currentframe().f_code.co_name,"add_nodes","")
+@CG_internals.documented("DotBuilder.write", "add_nodes")
+def create_cluster(dot: DotBuilder, cluster_id, config):
     
     #node_df = filtered_df
     '''
@@ -980,14 +1793,14 @@ def create_cluster(cluster_id, config):
     tier = config['tier'].capitalize()
     cluster_label = tier + " Tier"
     
-    dot_write('\n\n\t/***********************************/')
-    dot_write(f'\t/* {cluster_label} */')
-    dot_write('\t/***********************************/')
-    dot_write(f'\tsubgraph cluster{cluster_id}')
-    dot_write("\t{")
-    dot_write(f'\t\tlabel="{cluster_label}";')
-    dot_write(f'\t\t{tier}_top [style=invisible, label="", image=""]')
-    dot_write("")
+    dot.write('\n\n\t/***********************************/')
+    dot.write(f'\t/* {cluster_label} */')
+    dot.write('\t/***********************************/')
+    dot.write(f'\tsubgraph cluster{cluster_id}')
+    dot.write("\t{")
+    dot.write(f'\t\tlabel="{cluster_label}";')
+    dot.write(f'\t\t{tier}_top [style=invisible, label="", image=""]')
+    dot.write("")
 
     #print(f"*******Create_cluser1: {tier}, {config['exclude_types']} ")
 
@@ -998,24 +1811,23 @@ def create_cluster(cluster_id, config):
     else:
         node_types = tier_df['type'].unique().tolist()
 
-    debug_msg (3, f"Included types: {node_types} ")
+    debug_msg (3, "Included types: %s ", node_types, subsystem="dot")
 
     for node_item in node_types:
-        dot_write(f'\t\t##### {node_item}')
+        dot.write(f'\t\t##### {node_item}')
 
         # Filter nodes based on type and tier
         node_type_df = tier_df[(tier_df['type'] == node_item)]
 
         #print(f'{tier}, {node_item}, {len(node_type_df)}\n')  # Use len(node_types) to get the length
-        add_nodes(tier_df, node_type_df, node_item, tier)
-        dot_write("")
+        add_nodes(dot, tier_df, node_type_df, node_item, tier)
+        dot.write("")
 
-    dot_write(f'\t\t{tier}_bottom [style=invisible, label="", dir=none, image=""]')
-    dot_write("\t}")
+    dot.write(f'\t\t{tier}_bottom [style=invisible, label="", dir=none, image=""]')
+    dot.write("\t}")
 
-def create_cluster00(df, seq, node_types, tier):
-    CG_internals.add(inspect.currentframe().f_code.co_name,"","")
-    CG_internals.add(inspect.currentframe().f_code.co_name,"dot_write","")
+@CG_internals.documented("DotBuilder.write")
+def create_cluster00(dot: DotBuilder, df, seq, node_types, tier):
 
     node_df = df
     
@@ -1024,12 +1836,12 @@ def create_cluster00(df, seq, node_types, tier):
     else:
         cluster_label = f"{tier.capitalize()} Tier"
     
-    dot_write('\n\n\t/***********************************/')
-    dot_write(f'\t/* {cluster_label} */')
-    dot_write('\t/***********************************/')
-    dot_write(f'\tsubgraph cluster{seq}')
-    dot_write("\t{")
-    dot_write(f'\t\tlabel="{cluster_label}";')
+    dot.write('\n\n\t/***********************************/')
+    dot.write(f'\t/* {cluster_label} */')
+    dot.write('\t/***********************************/')
+    dot.write(f'\tsubgraph cluster{seq}')
+    dot.write("\t{")
+    dot.write(f'\t\tlabel="{cluster_label}";')
     
     #lb_df = node_df[(node_df['type'] == "loadbalancers") & (node_df['tier'] == tier)]  
     #nic_df = node_df[(node_df['type'] == "networkinterfaces") & (node_df['tier'] == tier)] 
@@ -1041,21 +1853,21 @@ def create_cluster00(df, seq, node_types, tier):
     
     
     for node_item in node_types:
-        dot_write(f'\n\t\t####### {node_item}')
+        dot.write(f'\n\t\t####### {node_item}')
         
         # Filter nodes based on type and tier
         node_type_df = node_df[(node_df['type'] == node_item) & (node_df['tier'] == tier)]
         
         # Add nodes of the current type
         #print(f'{tier}, {node_item}, {len(node_type_df)}\n') 
-        add_nodes(node_df, node_type_df, node_item, tier)
+        add_nodes(dot, node_df, node_type_df, node_item, tier)
 
 
     # Handle nodes without a parent
     na_df = node_df[(node_df['tier'] == tier) & (pd.isna(node_df['parent']))]
     if not na_df.empty:
-        dot_write("\n\t\t# No parent associated with this node")
-        add_nodes(node_df, na_df, "", tier)  
+        dot.write("\n\t\t# No parent associated with this node")
+        add_nodes(dot, node_df, na_df, "", tier)  
 
     '''
     # Rows without a tier, put the PaaS services in the SQL cluster
@@ -1065,28 +1877,28 @@ def create_cluster00(df, seq, node_types, tier):
             
             for paas_row in paas_df.itertuples():
                 if not pd.isna(paas_row.parent):
-                    dot_write(f'\t\t{paas_row.parent} -> {paas_row.dot_label};\t\t/* {paas_row.parent} -> {paas_row.name} */',f)
+                    dot.write(f'\t\t{paas_row.parent} -> {paas_row.dot_label};\t\t/* {paas_row.parent} -> {paas_row.name} */',f)
                 else:
-                    dot_write(f'\t\t{paas_row.dot_label};\t\t/* {paas_row.name} {paas_row.type}*/',f)
+                    dot.write(f'\t\t{paas_row.dot_label};\t\t/* {paas_row.name} {paas_row.type}*/',f)
     '''
-    dot_write("\t}\n")
+    dot.write("\t}\n")
 
 
 
-def add_nodes(tier_df, node_type_df, node_type, tier):
-    CG_internals.add(inspect.currentframe().f_code.co_name, "", "")
-    CG_internals.add(inspect.currentframe().f_code.co_name, "dot_write", "")
+@CG_internals.documented("DotBuilder.write")
+def add_nodes(dot: DotBuilder, tier_df, node_type_df, node_type, tier):
     
+    tier_parents = set(tier_df['parent'].values)
     for nrow in node_type_df.itertuples():
         # 1. Connect to parent if exists, else connect to tier_top
         if pd.notna(nrow.parent) and nrow.parent != "" and nrow.parent != "app_url":
-            dot_write(f'\t\t{nrow.parent} -> {nrow.dot_label};\t\t/* {nrow.parent} -> {nrow.name} */')
+            dot.write(f'\t\t{nrow.parent} -> {nrow.dot_label};\t\t/* {nrow.parent} -> {nrow.name} */')
         else:
-            dot_write(f'\t\t{tier}_top -> {nrow.dot_label} [style=invisible, dir=none];\t\t/* No parent for {nrow.name} */')
+            dot.write(f'\t\t{tier}_top -> {nrow.dot_label} [style=invisible, dir=none];\t\t/* No parent for {nrow.name} */')
 
         # 2. Connect to tier_bottom if this node is not a parent of any other
-        if nrow.dot_label not in tier_df['parent'].values:
-            dot_write(f'\t\t{nrow.dot_label} -> {tier}_bottom [style=invisible, dir=none];\t\t/* {nrow.name} not a parent */')
+        if nrow.dot_label not in tier_parents:
+            dot.write(f'\t\t{nrow.dot_label} -> {tier}_bottom [style=invisible, dir=none];\t\t/* {nrow.name} not a parent */')
 
 
 
@@ -1095,8 +1907,8 @@ from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from datetime import datetime
 
+@CG_internals.documented()
 def add_doc_property_field(paragraph, property_name):
-    CG_internals.add(inspect.currentframe().f_code.co_name,"","")
     """Inserts a document property Quick Part field into the paragraph."""
     run = paragraph.add_run()
     fldChar1 = OxmlElement('w:fldChar')
@@ -1117,8 +1929,8 @@ def add_doc_property_field(paragraph, property_name):
     run._r.append(fldChar2)
     run._r.append(fldChar3)
 
+@CG_internals.documented()
 def create_runbook_doc(app):
-    CG_internals.add(inspect.currentframe().f_code.co_name,"","")
     doc = Document()
     
     # Set document properties
@@ -1155,9 +1967,58 @@ def create_runbook_doc(app):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create Graphviz .dot files for each application in the Azure export.")
+    parser.add_argument('--no-cache', help="Always parse the workbook, do not read or write the sidecar cache.", action='store_true')
+    parser.add_argument('--rebuild-cache', help="Parse the workbook and rebuild the sidecar cache.", action='store_true')
+    parser.add_argument('--full-rebuild', help="Ignore the manifest and regenerate every application.", action='store_true')
+    parser.add_argument('--no-document', help="Do not write the script documentation graph.", action='store_true')
+    parser.add_argument('--debug', help="Debugging level (0-5), 0=none, 5=verbose (default 1).", type=int, default=1)
+    parser.add_argument('--debug-subsystem', help="Debugging level for one subsystem, e.g. nics=5.  Subsystems: main, read, nodes, vms, nics, paas, lbs, dot, manifest, render, profile, costs.", action='append', default=[], metavar="NAME=LEVEL")
+    parser.add_argument('--log-json', help="Also write every message to this JSON-lines file.", default="")
+    parser.add_argument('--unique-format', help="Format of the UniqueNames export (default %(default)s).", choices=["xlsx", "csv", "parquet"], default=CG_internals.unique_format)
+    parser.add_argument('--stream', help="Stream RawData, keeping only the columns the diagrams use and Production IaaS/PaaS rows.  UniqueNames.xlsx then holds only those rows and columns.", action='store_true')
+    parser.add_argument('--jobs', help="Number of worker processes used to generate the applications (default 1).", type=int, default=1)
+    parser.add_argument('--render', help="Render the .dot files with Graphviz to these comma separated formats, e.g. svg,png.", default="")
+    parser.add_argument('--render-jobs', help="Number of concurrent Graphviz processes (default: number of CPUs).", type=int, default=CG_internals.render_jobs)
+    parser.add_argument('--render-timeout', help="Seconds allowed for one render before the fallback engine is tried (default %(default)s).", type=float, default=CG_internals.render_timeout)
+    parser.add_argument('--render-engine', help="Graphviz layout engine (default %(default)s).", default=CG_internals.render_engine)
+    parser.add_argument('--render-fallback', help="Layout engine used when the render engine times out or fails, '' for none (default %(default)s).", default=CG_internals.render_fallback)
+    parser.add_argument('--render-cache-dir', help="Directory of the render cache, '' to always run Graphviz (default %(default)s).", default=CG_internals.render_cache_dir)
+    parser.add_argument('--render-cache-size', help="Size limit of the render cache in MB, the least recently used renders are evicted (default %(default)s).", type=int, default=CG_internals.render_cache_size // (1024 * 1024))
+    parser.add_argument('--profile', help="Write a JSON report of the wall time, CPU time, peak traced memory and row/node counts of every stage to this file.  tracemalloc slows the run down.", default="")
+    parser.add_argument('--profile-app', help="Run this application under cProfile, the stats are written next to the --profile report (<report>.<app>.prof) or to <app>.prof.", default="")
+    parser.add_argument('--cost-top', help="Number of slowest applications listed after the application cost report (graphviz_output/application_costs.csv, default %(default)s).", type=int, default=CG_internals.cost_top)
+    parser.add_argument('--icon-dir', help="Directory of the node icons.  By default the .dot files refer to the Windows relative path icons\\<file>.", default="")
+    args = parser.parse_args()
+
+    CG_internals.use_cache = not args.no_cache
+    CG_internals.rebuild_cache = args.rebuild_cache
+    CG_internals.jobs = max(1, args.jobs)
+    CG_internals.full_rebuild = args.full_rebuild
+    CG_internals.document = not args.no_document
+    CG_internals.stream = args.stream
+    CG_internals.unique_format = args.unique_format
+    CG_internals.render_formats = [fmt.strip() for fmt in args.render.split(",") if fmt.strip()]
+    CG_internals.render_jobs = max(1, args.render_jobs)
+    CG_internals.render_timeout = args.render_timeout
+    CG_internals.render_engine = args.render_engine
+    CG_internals.render_fallback = args.render_fallback
+    CG_internals.icon_dir = os.path.abspath(args.icon_dir) if args.icon_dir else ""
+    CG_internals.render_cache_dir = args.render_cache_dir
+    CG_internals.render_cache_size = args.render_cache_size * 1024 * 1024
+    CG_internals.profile = os.path.abspath(args.profile) if args.profile else ""
+    CG_internals.profile_app = args.profile_app
+    CG_internals.cost_top = args.cost_top
+    CG_internals.debug = args.debug
+    for setting in args.debug_subsystem:
+        subsystem, _, level = setting.partition("=")
+        CG_internals.debug_levels[subsystem.strip()] = int(level)
+    if args.log_json:
+        CG_internals.log_json = os.path.abspath(args.log_json)
+        open(CG_internals.log_json, "w").close()
+
     # File path to the Excel file
     CG_internals.add(inspect.currentframe().f_code.co_name,"","")
-    CG_internals.add(inspect.currentframe().f_code.co_name,"cleanup_existing_files","Remove existing .dot files")
     CG_internals.add(inspect.currentframe().f_code.co_name,"read_excel","Open and read the excel into dataframes")
     CG_internals.add(inspect.currentframe().f_code.co_name,"process_with_resource_lookup","Process the excel spreadsheet")
 
@@ -1172,10 +2033,14 @@ if __name__ == "__main__":
     output_dir = "./graphviz_output"
     os.makedirs(output_dir, exist_ok=True)
 
-    # Cleanup any existing Graphviz files
-    cleanup_existing_files(output_dir, [".dot", ".png"])
+    if CG_internals.profile:
+        tracemalloc.start()
+    run_wall, run_cpu = time.perf_counter(), time.process_time()
 
     read_excel()
 
     process_with_resource_lookup(file_path, raw_data_sheet, azure_services_sheet, shared_services_sheet, output_dir)
 
+    if CG_internals.profile:
+        write_profile_report(CG_internals.profile, time.perf_counter() - run_wall, time.process_time() - run_cpu)
+
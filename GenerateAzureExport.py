@@ -0,0 +1,193 @@
+#********************************************************************************
+#*  Script: GenerateAzureExport.py
+#*  Purpose: Create a synthetic Azure export workbook for testing and benchmarking
+#*              CreateGraphvis.py without a customer export.  The workbook has
+#*              the three sheets CreateGraphvis.py reads and uses the naming
+#*              conventions its parsers expect:
+#*                  VMs         <prefix><web|sql|app><nn>, legacy com/crp, greenfield mpc,
+#*                              -prd- names and the RabbitMQ servers mps2517-mps2521
+#*                  NICs        <vm>.nic<n>, <vm>.<guid>, nic-<vm>-<n>, <vm>-nic-<n>,
+#*                              <vm>-x-iac, <vm>abc_z<nn>
+#*                  LBs         lb-<iis|rabmq|cluster|gen>-<last 6 of a VM name>-<n>
+#*                  PaaS        <app>-prd-<type><n>, with private endpoint NICs
+#*                              <paas>.nic.<guid>
+#*                  XRef        shared applications and application URLs
+#*              plus non-Production copies and non IaaS/PaaS resources that the
+#*              Production filter removes.
+#*  Command line: --help
+#*                --resources: number of RawData rows (1k, 10k, 100k, 1M ...)
+#*                --output: workbook to write
+#*                --seed: random seed, the same seed gives the same workbook
+#*
+#********************************************************************************
+import argparse
+import random
+import uuid
+
+RAW_DATA_SHEET = "RawData_12_09"
+AZURE_SERVICES_SHEET = "AzureServices"
+SHARED_SERVICES_SHEET = "Shared Application XRef"
+
+# ResourceType, Category
+RESOURCE_TYPES = [
+    ("microsoft.compute/virtualmachines", "IaaS"),
+    ("microsoft.sqlvirtualmachine/sqlvirtualmachines", "IaaS"),
+    ("microsoft.network/networkinterfaces", "IaaS"),
+    ("microsoft.network/loadbalancers", "IaaS"),
+    ("microsoft.web/serverfarms", "PaaS"),
+    ("microsoft.storage/storageaccounts", "PaaS"),
+    ("microsoft.keyvault/vaults", "PaaS"),
+    ("microsoft.web/sites", "PaaS"),
+    ("microsoft.network/privateendpoints", "PaaS"),
+    ("microsoft.sql/managedinstances", "PaaS"),
+    ("microsoft.sql/managedinstances/databases", "PaaS"),
+    ("microsoft.appconfiguration/configurationstores", "PaaS"),
+    ("microsoft.servicebus/namespaces", "PaaS"),
+    ("microsoft.containerregistry/registries", "PaaS"),
+    ("microsoft.compute/disks", "Storage"),
+    ("microsoft.network/networksecuritygroups", "Network"),
+]
+VM, SQL_VM, NIC, LB = (t for t, _ in RESOURCE_TYPES[:4])
+PAAS_TYPES = [t for t, c in RESOURCE_TYPES if c == "PaaS"]
+OTHER_TYPES = [t for t, c in RESOURCE_TYPES if c not in ("IaaS", "PaaS")]
+
+RAW_DATA_COLUMNS = ["name", "type", "AppName", "Environment", "Unique", "resourceGroup", "location", "subscriptionId"]
+RABBITMQ_SERVERS = ["mps2517", "mps2518", "mps2519", "mps2520", "mps2521"]
+LOCATIONS = ["eastus", "eastus2", "centralus", "westus2"]
+
+
+def generate_application(r, app_index, production_share):
+    """
+    Returns the RawData rows of one application.
+    """
+
+    app_name = f"App{app_index:05d}"
+    style = r.choice(["legacy", "legacy", "greenfield", "prd", "other"])
+    if style == "legacy":
+        prefix = r.choice(["comp", "crpp"])
+    elif style == "greenfield":
+        prefix = "mpcxxp"
+    elif style == "prd":
+        prefix = f"a{app_index}-prd-"
+    else:
+        prefix = f"az{app_index % 100:02d}"
+
+    resource_group = f"rg-{app_name.lower()}-prd"
+    subscription = str(uuid.UUID(int=r.getrandbits(128)))
+    rows = []
+
+    def add(name, resource_type, unique=None):
+        rows.append([name, resource_type, app_name, "Production", unique or r.choice("YN"),
+                     resource_group, r.choice(LOCATIONS), subscription])
+
+    # Virtual machines and their NICs
+    vms = []
+    for n in range(r.randint(1, 8)):
+        role = r.choice(["web", "web", "app", "sql"])
+        vm = f"{prefix}{role}{app_index % 100:02d}{n:02d}"
+        if r.random() < .03:
+            vm = r.choice(RABBITMQ_SERVERS)
+        vms.append(vm)
+        add(vm, SQL_VM if role == "sql" and r.random() < .5 else VM)
+
+        for k in range(r.randint(1, 2)):
+            nic_style = r.randrange(6)
+            if nic_style == 0:
+                nic = f"{vm}.nic{k}"
+            elif nic_style == 1:
+                nic = f"{vm}.{uuid.UUID(int=r.getrandbits(128))}"
+            elif nic_style == 2:
+                nic = f"nic-{vm}-{k}"
+            elif nic_style == 3:
+                nic = f"{vm}-nic-{k}"
+            elif nic_style == 4:
+                nic = f"{vm}-x-iac"
+            else:
+                nic = f"{vm}abc_z{k:02d}"
+            add(nic, NIC)
+
+    # Load balancers carry the last 6 characters of a VM name
+    for n in range(r.randint(0, 3)):
+        kind = r.choice(["iis", "iis", "rabmq", "cluster", "gen"])
+        add(f"lb-{kind}-{r.choice(vms)[-6:]}-{n}", LB, unique="N")
+
+    # PaaS services, some behind a private endpoint NIC
+    for n in range(r.randint(0, 8)):
+        paas_type = r.choice(PAAS_TYPES)
+        paas = f"{app_name.lower()}-prd-{paas_type.split('/')[-1][:6]}{n}"
+        add(paas, paas_type)
+        if r.random() < .4:
+            add(f"{paas}.nic.{uuid.UUID(int=r.getrandbits(128))}", NIC, unique="N")
+
+    # Resources the IaaS/PaaS filter removes
+    for n in range(r.randint(0, 3)):
+        add(f"{r.choice(vms)}_OsDisk_{n}", r.choice(OTHER_TYPES), unique="N")
+
+    # Non-Production copies of the application
+    copies = []
+    for row in rows:
+        if r.random() > production_share:
+            environment = r.choice(["Dev", "Test", "QA", "UAT"])
+            copies.append([row[0].replace("prd", environment.lower()), row[1], row[2], environment] + row[4:])
+    rows.extend(copies)
+
+    # Untrimmed application names, CreateGraphvis.py strips them
+    if r.random() < .1:
+        for row in rows:
+            row[2] = f"{app_name} "
+
+    return rows
+
+
+def generate_workbook(resources, output, seed=1, production_share=0.6, shared_share=0.3):
+    """
+    Writes a synthetic export with about `resources` RawData rows to output.
+    Returns (rows, applications).
+    """
+    import xlsxwriter
+
+    r = random.Random(seed)
+    raw_rows = []
+    app_count = 0
+    while len(raw_rows) < resources:
+        raw_rows.extend(generate_application(r, app_count, production_share))
+        app_count += 1
+    del raw_rows[resources:]
+    apps = sorted({row[2].strip() for row in raw_rows})
+
+    # Rows are streamed (constant_memory), so 1M resource workbooks fit in memory
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True, "strings_to_urls": False})
+    try:
+        sheet = workbook.add_worksheet(RAW_DATA_SHEET)
+        sheet.write_row(0, 0, RAW_DATA_COLUMNS)
+        for row_index, row in enumerate(raw_rows, start=1):
+            sheet.write_row(row_index, 0, row)
+
+        sheet = workbook.add_worksheet(AZURE_SERVICES_SHEET)
+        sheet.write_row(0, 0, ["ResourceType", "Category", "Description"])
+        for row_index, (resource_type, category) in enumerate(RESOURCE_TYPES, start=1):
+            sheet.write_row(row_index, 0, [resource_type, category, resource_type.split("/")[-1]])
+
+        sheet = workbook.add_worksheet(SHARED_SERVICES_SHEET)
+        sheet.write_row(0, 0, ["PrimaryAppName", "SharedAppName", "URL"])
+        for row_index, app_name in enumerate(apps, start=1):
+            shared = r.choice(apps) if r.random() < shared_share else None
+            url = f"https://{app_name.lower()}.mgroup.net" if r.random() < .7 else None
+            sheet.write_row(row_index, 0, [app_name, shared, url])
+    finally:
+        workbook.close()
+
+    return len(raw_rows), len(apps)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create a synthetic Azure export workbook for CreateGraphvis.py.")
+    parser.add_argument('--resources', help="Number of RawData rows, e.g. 1000, 10000, 100000, 1000000 (default %(default)s).", type=int, default=1000)
+    parser.add_argument('--output', help="Workbook to write (default %(default)s).", default="AzureExport_synthetic.xlsx")
+    parser.add_argument('--seed', help="Random seed (default %(default)s).", type=int, default=1)
+    parser.add_argument('--production-share', help="Share of resources without non-Production copies (default %(default)s).", type=float, default=0.6)
+    parser.add_argument('--shared-share', help="Share of applications with a shared application (default %(default)s).", type=float, default=0.3)
+    args = parser.parse_args()
+
+    rows, apps = generate_workbook(args.resources, args.output, args.seed, args.production_share, args.shared_share)
+    print(f"Wrote {args.output}: {rows} resources, {apps} applications")
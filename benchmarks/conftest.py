@@ -0,0 +1,16 @@
+import os
+import sys
+
+# The scripts are run from the repository root, make them importable from the benchmarks
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_addoption(parser):
+    parser.addoption("--resources", default="1000,10000", help="Comma separated sizes of the generated workbooks (default %(default)s).")
+    parser.addoption("--apps", type=int, default=50, help="Applications timed per round, 0 for all (default %(default)s).")
+
+
+def pytest_generate_tests(metafunc):
+    if "resources" in metafunc.fixturenames:
+        sizes = [int(size) for size in metafunc.config.getoption("resources").split(",")]
+        metafunc.parametrize("resources", sizes, ids=[f"{size}r" for size in sizes], scope="session")
@@ -0,0 +1,142 @@
+"""
+Timings of the CreateGraphvis.py stages on generated workbooks, one benchmark per stage and
+workbook size.  Each round runs the stage for every timed application, the inputs of a stage
+are produced by the stages before it (outside the timing) in the order process_application
+runs them (cg.NODE_STAGES).
+
+    python -m pytest benchmarks --resources 1000,10000 --benchmark-autosave
+    python -m pytest benchmarks --benchmark-compare
+"""
+import contextlib
+import io
+
+import pytest
+
+import CreateGraphvis as cg
+import GenerateAzureExport
+
+ROUNDS = 3
+
+
+@pytest.fixture(scope="session")
+def workbook(resources, tmp_path_factory):
+    """
+    Synthetic export with `resources` RawData rows, generated once per session.
+    """
+    path = tmp_path_factory.mktemp("workbooks") / f"AzureExport_{resources}.xlsx"
+    GenerateAzureExport.generate_workbook(resources, str(path))
+    cg.CG_internals.debug = 0
+    cg.CG_internals.use_cache = False
+    cg.CG_internals.debug_app = None        # never matches an application, no debug tracing
+    return str(path)
+
+
+def read_workbook(workbook):
+    """
+    read_excel on workbook, its tables are left in CG_internals.
+    """
+    cg.file_path = workbook
+    cg.raw_data_sheet = GenerateAzureExport.RAW_DATA_SHEET
+    cg.azure_services_sheet = GenerateAzureExport.AZURE_SERVICES_SHEET
+    cg.shared_services_sheet = GenerateAzureExport.SHARED_SERVICES_SHEET
+    with contextlib.redirect_stdout(io.StringIO()):
+        cg.read_excel()
+
+
+@pytest.fixture(scope="session")
+def export(workbook, request, tmp_path_factory):
+    """
+    (raw_data, application tasks) of the workbook, the tasks as process_with_resource_lookup
+    creates them.  raw_data is kept here because CG_internals holds the last workbook read.
+    """
+    read_workbook(workbook)
+    sorted_data = cg.CG_internals.filtered_data.sort_values(by=["AppName", "as_Category", "as_ResourceType", "name"])
+    tasks = cg.application_tasks(sorted_data, str(tmp_path_factory.mktemp("graphviz_output")))
+    apps = request.config.getoption("apps")
+    return cg.CG_internals.raw_data, tasks[:apps] if apps else tasks
+
+
+@pytest.fixture(scope="session")
+def node_tables(export):
+    """
+    (task, combined rows, node table straight from build_node_df) of each timed application.
+    """
+    raw_data, tasks = export
+    tables = []
+    for task in tasks:
+        _, group, shared_rows, _, _ = task
+        combined_group = cg.combine_application_rows(group, shared_rows)
+        node_df, _ = cg.build_node_df(combined_group, raw_data, "")
+        tables.append((task, combined_group, node_df))
+    return tables
+
+
+def after_stages(node_tables, stages):
+    """
+    Copies of the node tables with stages applied, the stages change the tables in place.  Each
+    table comes with its SubstringIndex, shared by the stages as in process_application.
+    """
+    tables = []
+    for task, combined_group, node_df in node_tables:
+        node_df = node_df.copy()
+        names = cg.SubstringIndex(node_df['name'])
+        for stage in stages:
+            stage(node_df, names)
+        tables.append((task, combined_group, node_df, names))
+    return tables
+
+
+def test_read_excel(benchmark, workbook):
+    benchmark.pedantic(read_workbook, (workbook,), rounds=ROUNDS)
+
+
+def test_group(benchmark, export):
+    _, tasks = export
+
+    def run():
+        for _, group, shared_rows, _, _ in tasks:
+            cg.combine_application_rows(group, shared_rows)
+
+    benchmark.pedantic(run, rounds=ROUNDS)
+
+
+def test_build_node_df(benchmark, export, node_tables):
+    raw_data, _ = export
+
+    def run():
+        for _, combined_group, _ in node_tables:
+            cg.build_node_df(combined_group, raw_data, "")
+
+    benchmark.pedantic(run, rounds=ROUNDS)
+
+
+@pytest.mark.parametrize("position", range(len(cg.NODE_STAGES)), ids=[stage.__name__ for stage in cg.NODE_STAGES])
+def test_node_stage(benchmark, node_tables, position):
+    stage = cg.NODE_STAGES[position]
+
+    def setup():
+        return (after_stages(node_tables, cg.NODE_STAGES[:position]),), {}
+
+    def run(tables):
+        for _, _, node_df, names in tables:
+            stage(node_df, names)
+
+    benchmark.pedantic(run, setup=setup, rounds=ROUNDS)
+
+
+def test_create_graphvis_file(benchmark, node_tables):
+    tables = after_stages(node_tables, cg.NODE_STAGES)
+
+    def run():
+        for (app_name, _, _, url, output_file), combined_group, node_df, _ in tables:
+            cg.create_graphvis_file(cg.DotBuilder(output_file), app_name, url, node_df, combined_group)
+
+    benchmark.pedantic(run, rounds=ROUNDS)
+
+
+def test_stages_cover_process_application(export, monkeypatch):
+    # Every stage process_application records has a benchmark above
+    raw_data, tasks = export
+    monkeypatch.setattr(cg.CG_internals, "raw_data", raw_data)
+    _, _, _, stage_records = cg.process_application(*tasks[0])
+    assert [record["stage"] for record in stage_records] == cg.APPLICATION_STAGES
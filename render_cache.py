@@ -0,0 +1,144 @@
+#********************************************************************************
+#*  Module: render_cache.py
+#*  Purpose: Content-addressed cache of Graphviz renders, used by CreateGraphvis.py
+#*              and BMP.py.  A render is keyed by a hash of the DOT source, the
+#*              layout engine, the output format and the Graphviz version, so an
+#*              unchanged diagram is copied from the cache instead of being laid out
+#*              again.  Outputs are never hard links to cache entries, so a later
+#*              `dot -o` on an output (ours or any other script's) cannot change the
+#*              cache.
+#*
+#*  Cache layout: <cache_dir>/<key[:2]>/<key>.<format>
+#*  The cache is bounded by evict(), which removes the least recently used
+#*  entries (a hit refreshes the entry's mtime) until it fits in max_bytes.
+#*
+#********************************************************************************
+import contextlib
+import functools
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+
+CACHE_DIR = ".render_cache"
+MAX_BYTES = 1024 * 1024 * 1024     # 1 GB
+
+
+@functools.lru_cache(maxsize=None)
+def graphviz_version(engine):
+    """
+    Version line printed by `<engine> -V`, e.g. "dot - graphviz version 2.43.0 (0)".
+    """
+    result = subprocess.run([engine, "-V"], capture_output=True, check=True)
+    return (result.stderr or result.stdout).decode(errors="replace").strip()
+
+
+def cache_key(dot_source, engine, fmt):
+
+    sha = hashlib.sha256()
+    for part in (graphviz_version(engine), engine, fmt):
+        sha.update(part.encode())
+        sha.update(b"\x1f")
+    sha.update(dot_source.encode() if isinstance(dot_source, str) else dot_source)
+    return sha.hexdigest()
+
+
+@contextlib.contextmanager
+def replacing(target):
+    """
+    Yields a temporary path next to target, which is moved over target when the block succeeds.
+    The file is created by whoever writes it (normal permissions), and an existing target, possibly
+    a hard link made by an earlier version of this module, is replaced instead of written through.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix=".render-", dir=os.path.dirname(os.path.abspath(target)))
+    try:
+        tmp_file = os.path.join(tmp_dir, os.path.basename(target))
+        yield tmp_file
+        os.replace(tmp_file, target)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def copy_entry(source, target):
+
+    with replacing(target) as tmp_file:
+        shutil.copyfile(source, tmp_file)
+
+
+def run_graphviz(dot_source, engine, fmt, out_file, timeout=None):
+    """
+    Renders to out_file without Graphviz ever writing into an existing out_file.
+    Errors are raised as by subprocess.run.
+    """
+    with replacing(out_file) as tmp_file:
+        subprocess.run([engine, f"-T{fmt}", "-o", tmp_file], input=_encode(dot_source), capture_output=True, check=True, timeout=timeout)
+
+
+def render(dot_source, engine, fmt, out_file, timeout=None, cache_dir=CACHE_DIR):
+    """
+    Renders dot_source with engine to out_file in format fmt, from the cache when possible.
+    With cache_dir "" the cache is not used.  Graphviz errors are raised as by subprocess.run
+    (TimeoutExpired, CalledProcessError, OSError).
+
+    Returns:
+        True on a cache hit, False when Graphviz was run.
+    """
+
+    if not cache_dir:
+        run_graphviz(dot_source, engine, fmt, out_file, timeout)
+        return False
+
+    key = cache_key(dot_source, engine, fmt)
+    entry = os.path.join(cache_dir, key[:2], f"{key}.{fmt}")
+
+    if os.path.exists(entry):
+        os.utime(entry)             # most recently used
+        copy_entry(entry, out_file)
+        return True
+
+    # Render into the cache, then publish the entry atomically (concurrent renders of the same key are harmless)
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    run_graphviz(dot_source, engine, fmt, entry, timeout)
+
+    copy_entry(entry, out_file)
+    return False
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    """
+    Removes the least recently used entries until the cache holds at most max_bytes.
+    Returns (entries removed, bytes removed).
+    """
+
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return 0, 0
+
+    entries = []
+    for root, _, files in os.walk(cache_dir):
+        for file_name in files:
+            path = os.path.join(root, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(entry[1] for entry in entries)
+    removed, removed_bytes = 0, 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+        removed_bytes += size
+
+    return removed, removed_bytes
+
+
+def _encode(dot_source):
+    return dot_source.encode() if isinstance(dot_source, str) else dot_source
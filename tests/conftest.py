@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+# The scripts are run from the repository root, make them importable from the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+GRAPHVIZ_STUB = f"""#!{sys.executable}
+import sys
+if sys.argv[1] == "-V":
+    sys.stderr.write("dot - graphviz version 0.0 (stub)\\n")
+    sys.exit(0)
+out = sys.argv[sys.argv.index("-o") + 1]
+with open(out, "w") as f:
+    f.write("rendered " + sys.stdin.read())
+"""
+
+
+@pytest.fixture
+def graphviz_stub(tmp_path, monkeypatch):
+    """
+    Directory of stub Graphviz engines, first on PATH.  An engine writes "rendered <DOT source>".
+    """
+    stub_dir = tmp_path / "graphviz"
+    stub_dir.mkdir()
+    for engine in ("dot", "fdp", "sfdp", "circo", "neato"):
+        path = stub_dir / engine
+        path.write_text(GRAPHVIZ_STUB)
+        path.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{stub_dir}{os.pathsep}{os.environ['PATH']}")
+    return str(stub_dir)
@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import pandas as pd
+import pytest
+
+import BMP
+
+SHEET = "Map"
+
+
+def write_workbook(path, rows):
+    pd.DataFrame(rows, columns=["App-1", "App-2", "Topic", "Direction", "Mechanism"]).to_excel(path, sheet_name=SHEET, index=False)
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = str(tmp_path / "BMP-Data.xlsx")
+    write_workbook(path, [
+        ["App01", "App02", "Orders", "Forward", "API"],
+        ["App02", "App03", "Invoices", "Bi-Directional", "FTP"],
+        ["App03", "App01", "Payments", "Depends On", "Fileshare"],
+    ])
+    return path
+
+
+def cache_entries(cache_dir):
+    return sum(len(files) for _, _, files in os.walk(cache_dir))
+
+
+def test_server_evicts_the_render_cache(tmp_path, workbook, graphviz_stub, monkeypatch):
+    cache_dir = str(tmp_path / "render_cache")
+    maps = BMP.MapServer(workbook, SHEET, 1024 * 1024, cache_dir)
+    maps.render_cache_bytes = 0
+
+    # The first layout is evicted straight away, the next one waits for EVICT_INTERVAL
+    maps.svg("App01", False)
+    assert cache_entries(cache_dir) == 0
+    maps.svg("App02", False)
+    assert cache_entries(cache_dir) == 1
+
+    monkeypatch.setattr(BMP, "EVICT_INTERVAL", 0)
+    maps.svg("App03", False)
+    assert cache_entries(cache_dir) == 0
+
+
+@pytest.fixture
+def server(tmp_path, workbook, graphviz_stub, monkeypatch):
+    # Run serve() itself in a thread on a free port, keeping hold of the server it builds
+    servers = []
+    def make_server(*args):
+        servers.append(real_make_server(*args))
+        return servers[-1]
+    real_make_server = BMP.make_server
+    monkeypatch.setattr(BMP, "make_server", make_server)
+
+    thread = threading.Thread(target=BMP.serve, args=(workbook, SHEET, "127.0.0.1", 0, 1024 * 1024, str(tmp_path / "render_cache")), daemon=True)
+    thread.start()
+    while not servers and thread.is_alive():
+        thread.join(0.01)
+    assert servers, "serve() did not start"
+
+    yield servers[0]
+    servers[0].shutdown()
+    thread.join(10)
+    assert not thread.is_alive()
+
+
+def get(server, path):
+    # (status, headers, body) of GET path
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}{path}", timeout=30) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def test_map_is_a_miss_then_a_hit(server):
+    status, headers, body = get(server, "/map?app=App01")
+    assert status == 200
+    assert headers["Content-Type"] == "image/svg+xml"
+    assert headers["X-Cache"] == "miss"
+    assert b"App01" in body and b"App02" in body
+
+    status, headers, cached = get(server, "/map?app=App01")
+    assert status == 200
+    assert headers["X-Cache"] == "hit"
+    assert cached == body
+
+    # Another legend setting is another map
+    assert get(server, "/map?app=App01&legend=1")[1]["X-Cache"] == "miss"
+
+
+def test_apps_lists_the_applications(server):
+    status, headers, body = get(server, "/apps")
+    assert status == 200
+    assert headers["Content-Type"] == "application/json"
+    assert sorted(json.loads(body)) == ["App01", "App02", "App03"]
+
+
+def test_errors(server):
+    assert get(server, "/map?app=App99")[0] == 404
+    assert get(server, "/map?app=App01,App99")[0] == 404
+    assert get(server, "/maps?app=App01")[0] == 404
+    assert get(server, "/")[0] == 404
+    assert get(server, "/map")[0] == 400
+    assert get(server, "/map?app=,")[0] == 400
+
+
+def test_workbook_is_reloaded_when_its_mtime_changes(server, workbook):
+    assert get(server, "/map?app=App01")[1]["X-Cache"] == "miss"
+    assert get(server, "/map?app=App01")[1]["X-Cache"] == "hit"
+    assert get(server, "/map?app=App04")[0] == 404
+
+    write_workbook(workbook, [
+        ["App01", "App04", "Shipments", "Forward", "API"],
+        ["App04", "App01", "Returns", "Forward", "API"],
+    ])
+    mtime = os.path.getmtime(workbook) + 10
+    os.utime(workbook, (mtime, mtime))
+
+    assert sorted(json.loads(get(server, "/apps")[2])) == ["App01", "App04"]
+    status, headers, body = get(server, "/map?app=App01")
+    assert headers["X-Cache"] == "miss"
+    assert b"App04" in body and b"App02" not in body
+    assert get(server, "/map?app=App04")[0] == 200
@@ -0,0 +1,143 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import CreateGraphvis as cg
+
+RESOURCE_TYPES = [
+    "microsoft.compute/virtualmachines",
+    "microsoft.sqlvirtualmachine/sqlvirtualmachines",
+    "microsoft.network/networkinterfaces",
+    "microsoft.network/loadbalancers",
+    "microsoft.web/serverfarms",
+    "microsoft.web/sites",
+    "microsoft.web/site",
+    "microsoft.storage/storageaccounts",
+    "microsoft.sql/managedinstances/databases",
+    "microsoft.sql/managedinstances",
+    "microsoft.keyvault/vaults",
+    "microsoft.cache/redis",
+    "microsoft.network/privateendpoints",
+    np.nan,
+]
+NAME_PARTS = ["com", "crp", "mpc", "app", "-prd-", "prod", "sql", "iis", "rabmq", "cluster", "web", "01", "-"]
+RABMQ_NAMES = ["mps2517", "mps2518", "mps2521"]
+
+
+def build_node_df_reference(combined_group, raw_data):
+    """
+    build_node_df before it was vectorized: one row appended per resource, in groupby("type")
+    order, then the tier rules applied one after the other with .loc.  IRE names are written
+    straight into raw_data.
+    """
+    node_df = pd.DataFrame(columns=['type', 'dot_label', 'name', 'tier', 'parent', 'parent_name', 'parsed'])
+
+    for resource_type, resources in combined_group.groupby("type"):
+        dot_type = resource_type.split('/')[-1]
+        resource_cnt = 0
+        for idx, row in resources.iterrows():
+            resource_cnt += 1
+            label = row["name"]
+            unique_flag = row.get("Unique", "N")
+            node_id = f'{dot_type}_{resource_cnt}'
+
+            if unique_flag == "Y":
+                ire_name = cg.unique_name(label)
+                raw_data.loc[raw_data['name'] == label, "IRE Name"] = ire_name
+            else:
+                ire_name = ""
+
+            new_df_row = pd.DataFrame({'type': [dot_type], 'dot_label': [node_id], 'name': label, 'tier': "", 'unique': unique_flag, 'unique_name': ire_name})
+            node_df = node_df._append(new_df_row, ignore_index=True)
+
+    node_df['parent'] = ""
+    node_df['parent_name'] = ""
+    node_df['parsed'] = ""
+
+    rabmq_list = ["mps2517", "mps2518", "mps2519", "mps2520", "mps2521"]
+
+    node_df.loc[node_df['type'] == 'site', 'tier'] = 'app'
+    node_df.loc[(node_df['type'] == 'virtualmachines') & (~node_df['name'].str.contains('sql', na=False)), 'tier'] = 'web'
+    node_df.loc[(node_df['type'] == 'virtualmachines') & (node_df['name'].str.contains('sql', na=False)), 'tier'] = 'sql'
+    node_df.loc[(node_df['type'] == 'virtualmachines') & (node_df['name'].isin(rabmq_list)), 'tier'] = 'app'
+    node_df.loc[(node_df['type'] == 'sqlvirtualmachines'), 'tier'] = 'sql'
+    node_df.loc[(node_df['type'] == "loadbalancers") & (node_df['name'].str.contains('iis')), ['tier', 'parent']] = ['web', 'app_url']
+    node_df.loc[(node_df['type'] == "loadbalancers") & (node_df['name'].str.contains('rabmq')), 'tier'] = 'app'
+    node_df.loc[(node_df['type'] == "loadbalancers") & (node_df['name'].str.contains('cluster')), 'tier'] = 'sql'
+    node_df.loc[(node_df['type'] == 'networkinterfaces') & (~node_df['name'].str.contains('sql', na=False)), 'tier'] = 'web'
+    node_df.loc[(node_df['type'] == 'networkinterfaces') & (node_df['name'].str.contains('sql', na=False)), 'tier'] = 'sql'
+    node_df.loc[(node_df['type'] == 'networkinterfaces') & (node_df['name'].isin(rabmq_list)), 'tier'] = 'app'
+    node_df.loc[(node_df['type'] == 'databases') | (node_df['type'] == 'managedinstances'), 'tier'] = 'sql'
+    node_df.loc[(node_df['type'] == 'serverfarms'), 'tier'] = 'app'
+    node_df.loc[node_df['type'].isin(['privateendpoints', 'registries', 'namespaces', 'configurationstores',
+                                      'vaults', 'sites', 'storageaccounts']), 'tier'] = 'paas'
+
+    node_df.loc[(node_df['type'] == "loadbalancers") & (node_df['tier'] == ""), 'tier'] = 'web'
+
+    return node_df, len(node_df)
+
+
+def random_combined_group(seed):
+    r = random.Random(seed)
+    names = []
+    for n in range(r.randint(1, 30)):
+        if r.random() < 0.1:
+            names.append(r.choice(RABMQ_NAMES))
+        else:
+            names.append("".join(r.choice(NAME_PARTS) for _ in range(r.randint(2, 4))) + f"{n:02d}")
+    rows = [{"type": r.choice(RESOURCE_TYPES), "name": r.choice(names)} for _ in range(r.randint(1, 60))]
+    combined_group = pd.DataFrame(rows)
+
+    if r.random() < 0.8:
+        combined_group["Unique"] = pd.Series([r.choice(["Y", "Y", "N", np.nan]) for _ in rows], dtype=object)
+
+    # Resources without a name are never flagged unique (unique_name needs a string)
+    unnamed = [r.random() < 0.05 for _ in rows]
+    combined_group.loc[unnamed, "name"] = np.nan
+    if "Unique" in combined_group.columns:
+        combined_group.loc[unnamed, "Unique"] = "N"
+
+    # combined_group is a slice of the application's rows, so its index is not a range
+    combined_group.index = r.sample(range(1000), len(combined_group))
+    return combined_group
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_build_node_df_matches_reference(seed, monkeypatch):
+    combined_group = random_combined_group(seed)
+    raw_data = combined_group[["name"]].drop_duplicates().reset_index(drop=True)
+    raw_data["IRE Name"] = None
+
+    expected_raw = raw_data.copy()
+    expected, expected_cnt = build_node_df_reference(combined_group, expected_raw)
+
+    monkeypatch.setattr(cg.CG_internals, "raw_data", raw_data.copy())
+    monkeypatch.setattr(cg.CG_internals, "ire_names", {})
+    actual, actual_cnt = cg.build_node_df(combined_group, cg.CG_internals.raw_data, "")
+    cg.update_ire_names(cg.CG_internals.ire_names)
+
+    # The appended rows take whatever dtype their values infer (an all-NaN column is float),
+    # build_node_df keeps every column object, so only the values are compared
+    assert actual_cnt == expected_cnt
+    pd.testing.assert_frame_equal(actual, expected[actual.columns], check_dtype=False)
+    pd.testing.assert_frame_equal(cg.CG_internals.raw_data, expected_raw, check_dtype=False)
+
+
+def test_dot_labels_are_numbered_per_resource_type():
+    combined_group = pd.DataFrame({
+        "type": ["microsoft.network/loadbalancers", "microsoft.compute/virtualmachines", np.nan,
+                 "microsoft.network/loadbalancers", "microsoft.compute/virtualmachines"],
+        "name": ["lb-iis", "vm1", "orphan", "lb-cluster", "vmsql2"],
+    })
+
+    node_df, all_cnt = cg.build_node_df(combined_group, None, "")
+
+    assert all_cnt == 4
+    assert node_df[["dot_label", "tier", "parent"]].values.tolist() == [
+        ["virtualmachines_1", "web", ""],
+        ["virtualmachines_2", "sql", ""],
+        ["loadbalancers_1", "web", "app_url"],
+        ["loadbalancers_2", "sql", ""],
+    ]
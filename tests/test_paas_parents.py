@@ -0,0 +1,136 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import CreateGraphvis as cg
+
+
+def node_df(rows):
+    df = pd.DataFrame(rows, columns=["type", "name", "dot_label", "tier", "parsed"])
+    df["parent"] = None
+    df["parent_name"] = None
+    return df
+
+
+def test_substring_index_empty_pattern_matches_every_name():
+    index = cg.SubstringIndex(["abc", np.nan, "", "xbcx"])
+    assert index.matches("") == [0, 2, 3]
+    assert index.first_match("") == 0
+
+
+def test_substring_index_pattern_longer_than_every_name():
+    index = cg.SubstringIndex(["abc", "xbcx"])
+    assert index.matches("abcxbcx") == []
+    assert index.first_match("abcxbcx") is None
+    assert index.matches("bc") == [0, 1]
+
+
+def test_nic_takes_the_first_matching_paas_in_node_order():
+    df = node_df([
+        ["sites", "app-prd-web1", "sites_00", "paas", ""],
+        ["vaults", "app-prd-web1-kv", "vaults_00", "paas", ""],
+        ["networkinterfaces", "app-prd-web1.nic.1", "networkinterfaces_00", "web", "web1"],
+    ])
+    cg.process_paas_resources(df)
+    assert df.loc[2, ["parent", "parent_name", "tier"]].tolist() == ["sites_00", "app-prd-web1", "paas"]
+
+
+def test_empty_parsed_matches_the_first_paas_row():
+    df = node_df([
+        ["networkinterfaces", "nic0", "networkinterfaces_00", "web", ""],
+        ["sites", "site1", "sites_00", "paas", ""],
+        ["vaults", "vault1", "vaults_00", "paas", ""],
+    ])
+    cg.process_paas_resources(df)
+    assert df.loc[0, ["parent", "parent_name"]].tolist() == ["sites_00", "site1"]
+
+
+def test_nan_parsed_and_nan_paas_names_are_skipped():
+    df = node_df([
+        ["sites", np.nan, "sites_00", "paas", ""],
+        ["vaults", "vault1", "vaults_00", "paas", ""],
+        ["networkinterfaces", "nic0", "networkinterfaces_00", "web", np.nan],
+        ["networkinterfaces", "nic1", "networkinterfaces_01", "web", "vault"],
+    ])
+    cg.process_paas_resources(df)
+    assert df.loc[2, "parent"] is None
+    assert df.loc[2, "tier"] == "web"
+    assert df.loc[3, ["parent", "parent_name"]].tolist() == ["vaults_00", "vault1"]
+
+
+def test_paas_contained_by_two_parentless_nodes_takes_the_last():
+    df = node_df([
+        ["virtualmachines", "app", "virtualmachines_00", "web", ""],
+        ["virtualmachines", "app-prd", "virtualmachines_01", "web", ""],
+        ["sites", "app-prd-site1", "sites_00", "paas", ""],
+    ])
+    df.loc[2, "parent"] = "app_url"
+    cg.assign_tier_based_on_parent(df)
+    assert df.loc[2, ["parent", "parent_name"]].tolist() == ["virtualmachines_01", "app-prd"]
+
+
+def test_node_is_never_its_own_parent():
+    df = node_df([
+        ["sites", "site1", "sites_00", "paas", ""],
+        ["vaults", "site1-kv", "vaults_00", "paas", ""],
+    ])
+    cg.assign_tier_based_on_parent(df)
+    # site1 has no parent and only contains itself, site1-kv contains site1 and itself
+    assert df.loc[0, "parent"] is None
+    assert df.loc[1, ["parent", "parent_name"]].tolist() == ["sites_00", "site1"]
+
+
+def test_nan_parentless_names_are_skipped():
+    df = node_df([
+        ["virtualmachines", np.nan, "virtualmachines_00", "web", ""],
+        ["sites", np.nan, "sites_01", "paas", ""],
+        ["sites", "site1", "sites_00", "paas", ""],
+    ])
+    df.loc[2, "parent"] = "app_url"
+    cg.assign_tier_based_on_parent(df)
+    assert df["parent"].tolist() == [None, None, "app_url"]
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_substring_index_matches_a_scan(seed):
+    r = random.Random(seed)
+    names = ["".join(r.choice("abc-") for _ in range(r.randint(0, 12))) for _ in range(r.randint(1, 40))] + [np.nan]
+    r.shuffle(names)
+    candidates = [r.random() < .5 for _ in names]
+    index = cg.SubstringIndex(names)
+
+    for _ in range(100):
+        pattern = "".join(r.choice("abc-") for _ in range(r.randint(0, 8)))
+        expected = [pos for pos, name in enumerate(names) if isinstance(name, str) and pattern in name]
+        assert index.matches(pattern) == expected
+        assert index.matches(pattern, candidates) == [pos for pos in expected if candidates[pos]]
+        assert index.first_match(pattern, candidates) == next((pos for pos in expected if candidates[pos]), None)
+
+
+def test_substring_index_memory_does_not_grow_with_pattern_lengths():
+    index = cg.SubstringIndex([f"app{n:03d}-prd-site{n}" for n in range(100)])
+    index.matches("app")
+    grams = sum(len(positions) for positions in index._grams.values())
+
+    for length in range(1, 20):
+        index.matches("app050-prd-site50"[:length])
+    assert sum(len(positions) for positions in index._grams.values()) == grams
+
+
+def test_stages_share_one_index():
+    df = node_df([
+        ["virtualmachines", "web001", "virtualmachines_00", "web", ""],
+        ["loadbalancers", "lb-iis-web001-0", "loadbalancers_00", "web", ""],
+        ["sites", "site1", "sites_00", "paas", ""],
+        ["networkinterfaces", "site1.nic.1", "networkinterfaces_00", "web", "site1"],
+        ["vaults", "site1-kv", "vaults_00", "paas", ""],
+    ])
+    names = cg.SubstringIndex(df["name"])
+    cg.process_vms(df, names)
+    cg.process_paas_resources(df, names)
+    cg.assign_tier_based_on_parent(df, names)
+
+    assert df["parent_name"].tolist() == ["lb-iis-web001-0", None, None, "site1", "site1"]
+    assert df.loc[3, "tier"] == "paas"
@@ -0,0 +1,80 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import CreateGraphvis as cg
+
+TIERS = ["web", "app", "sql", "paas", np.nan]
+VM_TYPES = ["virtualmachines", "sqlvirtualmachines"]
+
+
+def process_lbs_reference(node_df):
+    """
+    process_lbs before the last-LB-per-tier table: every load balancer, in order, parents every
+    VM of its tier (all rows with the VM's name), so the last one written wins.
+    """
+    lb_df = node_df[node_df['type'] == "loadbalancers"]
+    vm_df = node_df[node_df['type'].isin(VM_TYPES)]
+
+    if not lb_df.empty and not vm_df.empty:
+        for _, lb_row in lb_df.iterrows():
+            lb_index = lb_row.name
+            matching_vms = vm_df[vm_df['tier'] == lb_row['tier']]
+            for _, vm_row in matching_vms.iterrows():
+                node_df.loc[node_df['name'] == vm_row['name'], ['parent', 'parent_name']] = lb_row['dot_label'], lb_row['name']
+                node_df.at[lb_index, 'tier'] = vm_row['tier']
+
+
+def random_node_df(seed):
+    r = random.Random(seed)
+    vm_names = [f"vm{n:02d}" for n in range(r.randint(1, 12))] + [np.nan]
+    rows = []
+    for n in range(r.randint(2, 40)):
+        kind = r.choice(["vm", "vm", "vm", "lb", "lb", "nic", "paas"])
+        if kind == "vm":
+            node_type, name = r.choice(VM_TYPES), r.choice(vm_names)
+        elif kind == "lb":
+            node_type, name = "loadbalancers", r.choice([f"lb-{n}", np.nan])
+        elif kind == "nic":
+            node_type, name = "networkinterfaces", f"{r.choice(vm_names)}.nic{n}"
+        else:
+            node_type, name = "sites", f"paas{n}"
+        rows.append({"type": node_type, "name": name, "dot_label": f"{node_type}_{n:02d}",
+                     "tier": r.choice(TIERS), "parent": None, "parent_name": None})
+
+    # One VM name with rows in several tiers, and several load balancers in each of those tiers
+    rows.append({"type": "virtualmachines", "name": "vm-multi", "dot_label": "virtualmachines_90", "tier": "web", "parent": None, "parent_name": None})
+    rows.append({"type": "sqlvirtualmachines", "name": "vm-multi", "dot_label": "sqlvirtualmachines_91", "tier": "sql", "parent": None, "parent_name": None})
+    for n, tier in enumerate(r.sample(["web", "web", "sql", "sql", "app"], 5)):
+        rows.insert(r.randint(0, len(rows)), {"type": "loadbalancers", "name": f"lb-multi-{n}", "dot_label": f"loadbalancers_9{n}",
+                                              "tier": tier, "parent": None, "parent_name": None})
+    return pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_process_lbs_matches_reference(seed):
+    expected = random_node_df(seed)
+    actual = expected.copy()
+
+    process_lbs_reference(expected)
+    cg.process_lbs(actual)
+
+    pd.testing.assert_frame_equal(actual[["parent", "parent_name", "tier"]], expected[["parent", "parent_name", "tier"]])
+
+
+def test_vm_in_several_tiers_takes_the_last_lb_of_those_tiers():
+    node_df = pd.DataFrame([
+        {"type": "loadbalancers", "name": "lb-web-2", "dot_label": "loadbalancers_00", "tier": "web"},
+        {"type": "virtualmachines", "name": "vm1", "dot_label": "virtualmachines_00", "tier": "web"},
+        {"type": "loadbalancers", "name": "lb-sql", "dot_label": "loadbalancers_01", "tier": "sql"},
+        {"type": "sqlvirtualmachines", "name": "vm1", "dot_label": "sqlvirtualmachines_00", "tier": "sql"},
+        {"type": "loadbalancers", "name": "lb-web-1", "dot_label": "loadbalancers_02", "tier": "web"},
+    ]).assign(parent=None, parent_name=None)
+
+    cg.process_lbs(node_df)
+
+    vm_rows = node_df[node_df["name"] == "vm1"]
+    assert list(vm_rows["parent_name"]) == ["lb-web-1", "lb-web-1"]
+    assert list(vm_rows["parent"]) == ["loadbalancers_02", "loadbalancers_02"]
@@ -0,0 +1,127 @@
+import random
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import CreateGraphvis as cg
+
+VM_TYPES = ["virtualmachines", "sqlvirtualmachines"]
+TIERS = ["web", "app", "sql", np.nan]
+NIC_PARTS = ["nic", "iac", "vm", "sql", "01", "abc", "-", "-", ".", ".nic", "_z", "_", "x"]
+GUID = "0a1b2c3d-4e5f-6071-8293-a4b5c6d7e8f9"
+
+
+def parse_nic_name_reference(name):
+    """ The per-name parser process_nics applied with Series.apply before parse_nic_names. """
+    if ".nic" in name:
+        return name.split(".nic")[0]
+    if "." in name:
+        return name.split('.')[0]
+    name_split = name.split('-')
+    if len(name_split) >= 3:
+        if name_split[0] == "nic":
+            return name_split[1]
+        if name_split[2] == "iac" or name_split[1] == "nic":
+            return name_split[0]
+    if "_z" in name:
+        return name.split('_')[0][:-3]
+    return name.split('-')[0]
+
+
+def process_nics_reference(node_df):
+    """
+    process_nics before the join: the GUID suffix and the VM name are handled one name at a
+    time, and every NIC/VM pair from the merge is written in turn, so the last one wins.
+    """
+    nic_df = node_df[node_df['type'] == "networkinterfaces"]
+    vm_df = node_df[node_df['type'].isin(VM_TYPES)]
+
+    if nic_df.empty or vm_df.empty:
+        return
+
+    guid_pattern = r'\.([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})$'
+
+    def update_name_if_guid(name):
+        if re.search(guid_pattern, name):
+            return re.sub(guid_pattern, '', name)
+        return name
+
+    node_df.loc[node_df['type'] == "networkinterfaces", 'name'] = node_df.loc[node_df['type'] == "networkinterfaces", 'name'].apply(update_name_if_guid)
+    node_df.loc[node_df['type'] == "networkinterfaces", 'parsed'] = node_df.loc[node_df['type'] == "networkinterfaces", 'name'].apply(parse_nic_name_reference)
+
+    nic_df = node_df[node_df['type'] == "networkinterfaces"]
+    nic_df = nic_df.merge(vm_df[['dot_label', 'name', 'tier']], left_on='parsed', right_on='name', how='left', suffixes=('', '_vm'))
+
+    if not nic_df.empty and 'tier_vm' in nic_df.columns:
+        matching_vms = nic_df[~nic_df['tier_vm'].isnull()]
+        for _, vm_row in matching_vms.iterrows():
+            mask = (node_df['type'] == 'networkinterfaces') & (node_df['parsed'] == vm_row['name_vm'])
+            if not node_df[mask].empty:
+                node_df.loc[mask, ['parent', 'parent_name', 'tier']] = vm_row['dot_label_vm'], vm_row['name_vm'], vm_row['tier_vm']
+
+
+def random_nic_name(r, vm_names):
+    name = "".join(r.choice(NIC_PARTS + vm_names) for _ in range(r.randint(0, 6)))
+    if r.random() < 0.2:
+        name += "." + GUID
+    return name
+
+
+def random_node_df(seed):
+    r = random.Random(seed)
+    vm_names = [f"vm{n:02d}" for n in range(r.randint(1, 8))] + ["sqlvm", "web-01"]
+    rows = []
+    for n in range(r.randint(1, 40)):
+        kind = r.choice(["vm", "nic", "nic", "nic", "lb"])
+        if kind == "vm":
+            node_type, name = r.choice(VM_TYPES), r.choice(vm_names)
+        elif kind == "nic":
+            node_type = "networkinterfaces"
+            name = r.choice([
+                random_nic_name(r, vm_names),
+                f"{r.choice(vm_names)}.nic{n}",
+                f"nic-{r.choice(vm_names)}-{n}",
+                f"{r.choice(vm_names)}-nic-{n}",
+                f"{r.choice(vm_names)}xyz_z{n}",
+                f"{r.choice(vm_names)}.{GUID}",
+            ])
+        else:
+            node_type, name = "loadbalancers", f"lb-{n}"
+        rows.append({"type": node_type, "name": name, "dot_label": f"{node_type}_{n:02d}",
+                     "tier": r.choice(TIERS), "parent": "", "parent_name": "", "parsed": ""})
+    return pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize("seed", range(500))
+def test_parse_nic_names_matches_reference(seed):
+    r = random.Random(seed)
+    names = pd.Series([random_nic_name(r, ["vm1", "web-02"]) for _ in range(50)])
+
+    assert cg.parse_nic_names(names).tolist() == [parse_nic_name_reference(name) for name in names]
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_process_nics_matches_reference(seed):
+    expected = random_node_df(seed)
+    actual = expected.copy()
+
+    process_nics_reference(expected)
+    cg.process_nics(actual)
+
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_nic_takes_the_last_vm_with_its_name():
+    node_df = pd.DataFrame([
+        {"type": "virtualmachines", "name": "vm1", "dot_label": "virtualmachines_1", "tier": "web"},
+        {"type": "networkinterfaces", "name": f"vm1.nic0.{GUID}", "dot_label": "networkinterfaces_1", "tier": "web"},
+        {"type": "sqlvirtualmachines", "name": "vm1", "dot_label": "sqlvirtualmachines_1", "tier": "sql"},
+        {"type": "virtualmachines", "name": "vm1", "dot_label": "virtualmachines_2", "tier": np.nan},
+    ]).assign(parent="", parent_name="", parsed="")
+
+    cg.process_nics(node_df)
+
+    assert node_df.loc[1, ["name", "parsed", "parent", "parent_name", "tier"]].tolist() == [
+        "vm1.nic0", "vm1", "sqlvirtualmachines_1", "vm1", "sql"]
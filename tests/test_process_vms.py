@@ -0,0 +1,80 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import CreateGraphvis as cg
+
+VM_TYPES = ["virtualmachines", "sqlvirtualmachines"]
+TIERS = ["web", "app", "sql", np.nan]
+NAME_PARTS = ["ab", "abc", "web", "sql", "01", "-", "x"]
+
+
+def process_vms_reference(node_df):
+    """
+    process_vms before the substring index: every VM scans the load balancers for the first
+    name containing the VM name's last 6 characters, and that load balancer takes the VM's tier.
+    """
+    vm_df = node_df[(node_df['type'] == "virtualmachines") | (node_df['type'] == "sqlvirtualmachines")]
+    lb_df = node_df[node_df['type'] == "loadbalancers"]
+
+    if not vm_df.empty and not lb_df.empty:
+        for vm_index, vm_row in vm_df.iterrows():
+            matching_lb = lb_df[lb_df['name'].apply(lambda lb_name: vm_row['name'][-6:] in lb_name if pd.notna(lb_name) else False)]
+            if not matching_lb.empty:
+                lb = matching_lb.iloc[0]
+                node_df.at[vm_index, 'parent'] = lb['dot_label']
+                node_df.at[vm_index, 'parent_name'] = lb['name']
+                node_df.loc[(node_df['type'] == "loadbalancers") & (node_df['name'] == lb['name']), 'tier'] = node_df.at[vm_index, 'tier']
+
+
+def random_name(r):
+    return "".join(r.choice(NAME_PARTS) for _ in range(r.randint(0, 5)))
+
+
+def random_node_df(seed):
+    r = random.Random(seed)
+    lb_names = [f"lb-{random_name(r)}" for _ in range(r.randint(1, 6))] + [np.nan]
+    rows = []
+    for n in range(r.randint(1, 40)):
+        kind = r.choice(["vm", "vm", "lb", "nic"])
+        if kind == "vm":
+            node_type, name = r.choice(VM_TYPES), random_name(r)
+        elif kind == "lb":
+            node_type, name = "loadbalancers", r.choice(lb_names)
+        else:
+            node_type, name = "networkinterfaces", f"{random_name(r)}.nic{n}"
+        rows.append({"type": node_type, "name": name, "dot_label": f"{node_type}_{n:02d}",
+                     "tier": r.choice(TIERS), "parent": "", "parent_name": ""})
+    return pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize("shared_index", [False, True])
+@pytest.mark.parametrize("seed", range(200))
+def test_process_vms_matches_reference(seed, shared_index):
+    expected = random_node_df(seed)
+    actual = expected.copy()
+
+    process_vms_reference(expected)
+    cg.process_vms(actual, cg.SubstringIndex(actual['name']) if shared_index else None)
+
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_lb_takes_the_tier_of_the_last_vm_matched_to_it():
+    node_df = pd.DataFrame([
+        {"type": "loadbalancers", "name": "lb-web01", "dot_label": "loadbalancers_1", "tier": "web"},
+        {"type": "loadbalancers", "name": "lb-web01-b", "dot_label": "loadbalancers_2", "tier": "web"},
+        {"type": "virtualmachines", "name": "vm-web01", "dot_label": "virtualmachines_1", "tier": "app"},
+        {"type": "sqlvirtualmachines", "name": "sql-web01", "dot_label": "sqlvirtualmachines_1", "tier": "sql"},
+    ]).assign(parent="", parent_name="")
+
+    cg.process_vms(node_df)
+
+    assert node_df[["parent", "parent_name", "tier"]].values.tolist() == [
+        ["", "", "sql"],
+        ["", "", "web"],
+        ["loadbalancers_1", "lb-web01", "app"],
+        ["loadbalancers_1", "lb-web01", "sql"],
+    ]
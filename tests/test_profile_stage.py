@@ -0,0 +1,45 @@
+import tracemalloc
+
+import pytest
+
+import CreateGraphvis as cg
+
+
+@pytest.fixture
+def traced(monkeypatch):
+    monkeypatch.setattr(cg.CG_internals, "stage_records", [])
+    monkeypatch.setattr(cg.CG_internals, "open_stages", [])
+    tracemalloc.start()
+    yield
+    tracemalloc.stop()
+
+
+def peaks():
+    return {record["stage"]: record["peak_mb"] for record in cg.CG_internals.stage_records}
+
+
+def test_inner_stage_does_not_hide_the_outer_peak(traced):
+    with cg.profile_stage("outer"):
+        block = bytearray(32 * 1024 * 1024)
+        del block
+        with cg.profile_stage("inner"):
+            small = bytearray(1024 * 1024)
+            del small
+
+    assert peaks()["inner"] == pytest.approx(1, abs=0.2)
+    assert peaks()["outer"] >= 32
+    assert cg.CG_internals.open_stages == []
+
+
+def test_outer_peak_includes_the_inner_peak(traced):
+    with cg.profile_stage("outer"):
+        with cg.profile_stage("inner"):
+            with cg.profile_stage("innermost"):
+                block = bytearray(16 * 1024 * 1024)
+                del block
+        small = bytearray(1024 * 1024)
+        del small
+
+    assert peaks()["innermost"] >= 16
+    assert peaks()["inner"] >= 16
+    assert peaks()["outer"] >= 16
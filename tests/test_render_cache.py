@@ -0,0 +1,66 @@
+import os
+import stat
+
+import pytest
+
+import render_cache
+
+
+@pytest.fixture
+def engine(graphviz_stub):
+    return os.path.join(graphviz_stub, "dot")
+
+
+def cache_entry(cache_dir, source, engine):
+    key = render_cache.cache_key(source, engine, "svg")
+    return os.path.join(cache_dir, key[:2], f"{key}.svg")
+
+
+def test_uncached_render_does_not_change_the_cache(tmp_path, engine):
+    cache_dir, out_file = str(tmp_path / "cache"), str(tmp_path / "map.svg")
+
+    assert render_cache.render("A", engine, "svg", out_file, cache_dir=cache_dir) is False
+    assert render_cache.render("A", engine, "svg", out_file, cache_dir=cache_dir) is True
+    assert render_cache.render("B", engine, "svg", out_file, cache_dir="") is False
+
+    assert open(out_file).read() == "rendered B"
+    assert open(cache_entry(cache_dir, "A", engine)).read() == "rendered A"
+    assert render_cache.render("A", engine, "svg", out_file, cache_dir=cache_dir) is True
+    assert open(out_file).read() == "rendered A"
+
+
+def test_output_is_not_linked_to_the_cache(tmp_path, engine):
+    cache_dir, out_file = str(tmp_path / "cache"), str(tmp_path / "map.svg")
+    render_cache.render("A", engine, "svg", out_file, cache_dir=cache_dir)
+    render_cache.render("A", engine, "svg", out_file, cache_dir=cache_dir)
+
+    # Another script writing the output in place, as `dot -o map.svg` does
+    with open(out_file, "w") as f:
+        f.write("edited")
+    assert open(cache_entry(cache_dir, "A", engine)).read() == "rendered A"
+    assert os.stat(out_file).st_nlink == 1
+
+
+def test_existing_hard_link_is_replaced(tmp_path, engine):
+    cache_dir, out_file = str(tmp_path / "cache"), str(tmp_path / "map.svg")
+    render_cache.render("A", engine, "svg", out_file, cache_dir=cache_dir)
+    entry = cache_entry(cache_dir, "A", engine)
+
+    # An output linked to the entry by an earlier version of render_cache
+    os.remove(out_file)
+    os.link(entry, out_file)
+    render_cache.render("B", engine, "svg", out_file, cache_dir="")
+
+    assert open(entry).read() == "rendered A"
+    assert open(out_file).read() == "rendered B"
+
+
+def test_outputs_get_normal_permissions_and_no_temporary_files(tmp_path, engine):
+    cache_dir, out_file = str(tmp_path / "cache"), str(tmp_path / "map.svg")
+    render_cache.render("A", engine, "svg", out_file, cache_dir=cache_dir)
+    render_cache.render("A", engine, "svg", out_file, cache_dir=cache_dir)
+
+    umask = os.umask(0)
+    os.umask(umask)
+    assert stat.S_IMODE(os.stat(out_file).st_mode) == 0o666 & ~umask
+    assert sorted(os.listdir(tmp_path)) == ["cache", "graphviz", "map.svg"]
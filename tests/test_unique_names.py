@@ -0,0 +1,33 @@
+import numpy as np
+import openpyxl
+import pandas as pd
+
+import CreateGraphvis as cg
+
+
+def cells(path, sheet_name):
+    worksheet = openpyxl.load_workbook(path)[sheet_name]
+    return [[(cell.value, cell.number_format, cell.font.b, cell.border.left.style, cell.alignment.horizontal, cell.alignment.vertical)
+             for cell in row] for row in worksheet.iter_rows()]
+
+
+def test_xlsx_matches_to_excel(tmp_path):
+    df = pd.DataFrame({
+        "name": ["vm1", "vm2", None],
+        "created": [pd.Timestamp("2024-05-01"), pd.NaT, pd.Timestamp("2023-12-31 23:59:58")],
+        "cores": [4, np.nan, 2.5],
+        "Unique": ["Y", "N", "Y"],
+    })
+    expected, actual = str(tmp_path / "to_excel.xlsx"), str(tmp_path / "unique.xlsx")
+    df.to_excel(expected, sheet_name="RawData")
+    cg.write_unique_names(df, actual, "RawData")
+
+    assert cells(actual, "RawData") == cells(expected, "RawData")
+
+
+def test_date_column_round_trips(tmp_path):
+    df = pd.DataFrame({"created": [pd.Timestamp("2024-05-01"), pd.NaT, pd.Timestamp("2024-02-29 12:30:00")]})
+    path = str(tmp_path / "unique.xlsx")
+    cg.write_unique_names(df, path, "RawData")
+
+    pd.testing.assert_frame_equal(pd.read_excel(path, sheet_name="RawData", index_col=0), df)